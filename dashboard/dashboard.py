@@ -1,9 +1,12 @@
+import time
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
-from fetch_api import get_plants, get_sensors, get_sensor_data
+from fetch_api import MAX_POINTS, feed, get_anomalies, get_plants, get_sensors, get_sensor_window, get_plant_data
 from streamlit_autorefresh import st_autorefresh
+from shared.rules import REASON_NAMES, REASON_TITLES
 
 st.set_page_config(
     page_title="Supervision Ferme Urbaine", 
@@ -25,18 +28,123 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# fenêtre de mesures du capteur affiché, gardée d'un rafraîchissement à l'autre dans st.session_state :
+# la plage entière n'est chargée qu'au premier affichage ou au changement de plante, capteur ou période.
+# ensuite les nouveautés viennent du flux /stream (fetch_api.feed) sans requête vers l'API ; si le flux est
+# indisponible, seules les mesures insérées depuis le dernier chargement sont demandées (/data?since).
+# le flux d'une instance de l'API ne relaie que les mesures qu'elle a reçues (plusieurs réplicas) : toutes les
+# RECONCILE_INTERVAL secondes, les mesures insérées depuis le dernier last_id sont demandées aussi (/data?since).
+# last_id est le plus grand id visible : une mesure dont l'id a été attribué avant mais validée après (transaction
+# plus longue, autre réplica) serait sautée. chaque relecture repart donc du last_id de la relecture précédente
+# (window["floor"]) et couvre les validations en retard d'au plus RECONCILE_INTERVAL secondes ; au-delà, la mesure
+# n'apparaît qu'au prochain chargement complet.
+# les mesures sont dédoublonnées sur leur id (flux, chargements bruts et marquages le portent) : la copie la plus
+# récente remplace l'ancienne. les agrégats (chargement réduit sur une longue période) n'ont pas d'id.
+# les mesures sorties de la plage sont retirées ; au-delà de WINDOW_MAX_ROWS lignes, ou si le flux a perdu des
+# événements, la plage est rechargée (réduite côté API à MAX_POINTS points).
+# les chargements arrivent en colonnes (horodatages à la milliseconde) : ceux du flux sont tronqués à la
+# milliseconde pour être comparables.
+WINDOW_MAX_ROWS = 2 * MAX_POINTS
+RECONCILE_INTERVAL = 60
+WINDOW_COLUMNS = ["id", "timestamp", "temperature", "humidity", "anomaly", "cross_sensor_issue", "sensor_id"]
+
+# intitulés des compteurs par raison de /anomalies, indexés par nom court
+COUNT_TITLES = {REASON_NAMES[bit]: title for bit, title in REASON_TITLES.items()}
+
+
+# mesures reçues du flux (dicts) -> DataFrame
+def to_frame(rows):
+    df = pd.DataFrame(rows) if rows else pd.DataFrame(columns=WINDOW_COLUMNS)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True).dt.floor("ms")
+    return df
+
+
+def append_rows(df, new):
+    if new.empty:
+        return df
+    if df.empty:
+        return new
+    # une mesure reçue par le flux peut aussi figurer dans le chargement qui l'a précédé ou dans une relecture
+    if "id" in df and "id" in new:
+        df = df[~df["id"].isin(new["id"].dropna())]
+    else:
+        new = new[~new["timestamp"].isin(df["timestamp"])]
+    return pd.concat([df, new], ignore_index=True)
+
+
+# applique les événements du flux à la fenêtre ; None si un marquage trop volumineux impose un rechargement
+def apply_events(df, events, sensor_id):
+    readings = [data for event, data in events if event == "reading" and data["sensor_id"] == sensor_id]
+    df = append_rows(df, to_frame(readings))
+    flags = []
+    for event, data in events:
+        if event == "anomaly":
+            if data.get("readings") is None:
+                return None
+            flags.extend(flagged for flagged in data["readings"] if flagged["sensor_id"] == sensor_id)
+    if flags:
+        df = df.copy()
+        for flagged in flags:
+            if "id" in df:
+                rows = df["id"] == flagged["id"]
+            else:
+                rows = df["timestamp"] == pd.Timestamp(flagged["timestamp"]).floor("ms")
+            for column in ("anomaly", "cross_sensor_issue"):
+                if flagged[column]:
+                    df.loc[rows, column] = True
+    return df
+
+
+def load_window(plant_id, sensor_id, time_range, start_time, end_time):
+    key = (plant_id, sensor_id, time_range)
+    window = st.session_state.get("window")
+    live = feed.position()
+    now = time.monotonic()
+    df = None
+    if window is not None and window["key"] == key and len(window["df"]) <= WINDOW_MAX_ROWS:
+        reconciled, last_id, floor = window["reconciled"], window["last_id"], window["floor"]
+        if window["live"] is not None:
+            update = feed.since(window["live"], plant_id)
+            if update is not None:
+                events, live = update
+                df = apply_events(window["df"], events, sensor_id)
+                if df is not None and now - reconciled >= RECONCILE_INTERVAL:
+                    new, since_id = get_sensor_window(plant_id, sensor_id, start_time, end_time, since=floor)
+                    df = append_rows(df, new)
+                    reconciled, floor, last_id = now, last_id, max(last_id, since_id)
+        elif live is None:
+            new, since_id = get_sensor_window(plant_id, sensor_id, start_time, end_time, since=floor)
+            df = append_rows(window["df"], new)
+            reconciled, floor, last_id = now, last_id, max(last_id, since_id)
+    if df is None:
+        # position du flux relevée avant le chargement : aucune mesure ne peut passer entre les deux
+        df, last_id = get_sensor_window(plant_id, sensor_id, start_time, end_time)
+        reconciled, floor = now, last_id
+        if df.empty:
+            df = to_frame([])
+
+    if not df["timestamp"].is_monotonic_increasing:
+        df = df.sort_values("timestamp", ignore_index=True)
+    df = df.iloc[df["timestamp"].searchsorted(pd.Timestamp(start_time, tz="UTC")):]
+    st.session_state["window"] = {"key": key, "df": df, "last_id": last_id, "floor": floor, "live": live,
+                                   "reconciled": reconciled}
+    return df
+
+
 def main():
     st.title("🌍 Supervision Ferme Urbaine Verticale - Atos x LIRIS")
     
     try:
-        # Auto-refresh toutes les 15 secondes
+        # Auto-refresh toutes les 15 secondes, 5 secondes quand le flux temps réel est connecté
+        # (le rafraîchissement ne fait alors que relire les événements reçus, sans requête vers l'API)
+        feed.start()
         auto_refresh = st.sidebar.checkbox(
-            "🔄 Actualisation automatique (15s)", 
+            "🔄 Actualisation automatique", 
             key="auto_refresh_key",
             value=True
         )
         if auto_refresh:
-            st_autorefresh(interval=15_000, key="data_refresher")
+            st_autorefresh(interval=5_000 if feed.connected else 15_000, key="data_refresher")
 
         with st.sidebar:
             st.header("Filtres")
@@ -80,22 +188,17 @@ def main():
         end_time = datetime.utcnow().replace(second=0, microsecond=0)
         start_time = end_time - timedelta(hours=time_map[time_range])
 
-        # Récupération des données principales
+        # Récupération des données principales (incrémentale d'un rafraîchissement à l'autre)
         try:
-            main_data = get_sensor_data(
-                plant_id=selected_plant,
-                sensor_id=selected_sensor["sensor_id"],
-                start=start_time,
-                end=end_time
-            )
-            df = pd.DataFrame(main_data)
+            df = load_window(selected_plant, selected_sensor["sensor_id"], time_range, start_time, end_time)
         except Exception as e:
             st.error(f"Erreur données : {str(e)}")
             st.stop()
 
         # Traitement des données
         df['anomaly'] = df.get('anomaly', False)
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        # compteurs et raisons calculés côté API (agrégats tenus par la base), pas à partir de la fenêtre
+        summary = get_anomalies(selected_plant, selected_sensor["sensor_id"], start_time, end_time)
         latest = df.iloc[-1].to_dict() if not df.empty else {}
 
         # Section métriques
@@ -115,7 +218,7 @@ def main():
                         unsafe_allow_html=True)
         
         with col3:
-            anomaly_count = df['anomaly'].sum()
+            anomaly_count = summary["total"] if summary else 0
             st.markdown(f'<div class="metric-card {"warning" if anomaly_count > 0 else ""}">'
                         f'<h3>🚨 Anomalies</h3>'
                         f'<h1>{int(anomaly_count)}</h1></div>', 
@@ -135,58 +238,34 @@ def main():
             st.plotly_chart(fig, use_container_width=True)
 
       
-        if anomaly_count > 0:
+        if summary and (anomaly_count > 0 or summary["results"]):
             st.subheader("🚨 Détail des Anomalies")
-            anomalies_df = df[df["anomaly"]].sort_values("timestamp", ascending=False)
-        
-            for _, row in anomalies_df.iterrows():
-                cols = st.columns([2, 6, 2])
-                with cols[0]:
-                    st.markdown(f"**{row['timestamp'].strftime('%d/%m %H:%M')}**")
-                with cols[1]:
-                    issues = []
-                    temp = row.get('temperature', 0)
-                    hum = row.get('humidity', 0)
-                    
-                    if temp > 35:
-                        issues.append(f"Température critique ({temp:.1f}°C)")
-                    elif temp < 10:
-                        issues.append(f"Température basse ({temp:.1f}°C)")
-                        
-                    if hum > 85:
-                        issues.append(f"Humidité élevée ({hum:.1f}%)")
-                    elif hum < 25:
-                        issues.append(f"Humidité basse ({hum:.1f}%)")
-                        
-                    if row.get('cross_sensor_issue', False):
-                        issues.append("Écart inter-capteurs")
-                        
-                    st.write(", ".join(issues) if issues else "Anomalie non spécifiée")
-                with cols[2]:
-                    st.button("📋 Détails", key=f"details_{row['timestamp']}")
+            counts = {COUNT_TITLES.get(name, name): count for name, count in summary["counts"].items() if count}
+            if counts:
+                st.bar_chart(pd.Series(counts, name="Mesures"))
+            # les plus récentes, raisons enregistrées avec la mesure (ingestion et détecteur)
+            details = pd.DataFrame([
+                {
+                    "Horodatage": pd.Timestamp(anomaly["timestamp"]).strftime("%d/%m %H:%M:%S"),
+                    "Température": anomaly["temperature"],
+                    "Humidité": anomaly["humidity"],
+                    "Raisons": ", ".join(anomaly["reasons"]) or "Anomalie non spécifiée"
+                }
+                for anomaly in summary["results"]
+            ])
+            st.dataframe(details, use_container_width=True, hide_index=True)
 
         # Comparaison inter-capteurs
         if len(sensors) > 1:
             st.subheader("🔍 Comparaison Inter-Capteurs")
-            all_data = []
-            
-            for sensor in sensors:
-                try:
-                    sensor_data = get_sensor_data(
-                        plant_id=selected_plant,
-                        sensor_id=sensor["sensor_id"],
-                        start=start_time,
-                        end=end_time
-                    )
-                    if sensor_data:
-                        df_sensor = pd.DataFrame(sensor_data)
-                        df_sensor["sensor_id"] = sensor["sensor_id"]
-                        all_data.append(df_sensor)
-                except Exception:
-                    continue
+            # une seule requête pour tous les capteurs de la plante, reçue en colonnes
+            comparison_df = get_plant_data(
+                plant_id=selected_plant,
+                start=start_time,
+                end=end_time
+            )
             
-            if all_data:
-                comparison_df = pd.concat(all_data)
+            if not comparison_df.empty:
                 fig = px.line(comparison_df, 
                             x="timestamp", 
                             y="temperature",
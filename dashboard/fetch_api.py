@@ -1,40 +1,281 @@
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import msgpack
+import numpy as np
+import pandas as pd
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
 
 API_BASE = "http://ingestion-api:8000"
+# points par capteur demandés pour les graphiques (réduction côté API, voir /data?max_points)
+MAX_POINTS = 1000
+# mesures au plus par rafraîchissement incrémental (/data?since)
+SINCE_LIMIT = 10000
+# délais (connexion, lecture) en secondes
+API_TIMEOUT = (3.05, 15)
+# durée de vie des réponses en cache : le registre change rarement, les mesures à chaque rafraîchissement (15 s)
+REGISTRY_TTL = 60
+DATA_TTL = 10
+# réponses en colonnes de /data et /data/plant (voir ingestion-api/columnar.py)
+COLUMNAR_TYPE = "application/x-msgpack"
+# anomalies détaillées par le dashboard (les plus récentes), compteurs exclus
+ANOMALIES_LIMIT = 20
+# événements /stream gardés en mémoire, et délai avant reconnexion au flux
+LIVE_BUFFER = 5000
+LIVE_RETRY = 5
 
-# but : interroger l'endpoint /plants de l'API pour récupérer la liste des id. 
-def get_plants():
-    try:
-        response = requests.get(f"{API_BASE}/plants")
+
+# session HTTP partagée : connexions keep-alive réutilisées d'un appel et d'une session Streamlit à l'autre
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=20))
+
+
+# cache partagé par toutes les sessions Streamlit du processus, indexé par (endpoint, paramètres).
+# les appels simultanés sur une même clé absente sont regroupés : un seul part vers l'API, les autres
+# attendent sa réponse. les erreurs ne sont pas mises en cache.
+
+class SharedCache:
+    def __init__(self):
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, ttl, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            with self._lock:
+                self._entries[key] = (value, time.monotonic() + ttl)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = SharedCache()
+
+
+# GET sur l'API via la session partagée et le cache ; les valeurs retournées sont partagées entre sessions
+# et ne doivent pas être modifiées.
+def api_get(path, params=None, ttl=DATA_TTL):
+    def load():
+        response = session.get(f"{API_BASE}{path}", params=params, timeout=API_TIMEOUT)
         response.raise_for_status()
         return response.json()
+
+    key = (path, tuple(sorted((params or {}).items())))
+    return cache.get_or_load(key, ttl, load)
+
+
+# réponse msgpack en colonnes -> (métadonnées, DataFrame). chaque colonne est un tableau NumPy construit sur les
+# octets reçus (np.frombuffer, sans objet Python par valeur) ; horodatages en ms -> datetime UTC,
+# sensor_id (codé par dictionnaire) -> Categorical.
+def decode_columns(content):
+    payload = msgpack.unpackb(content, raw=False)
+    data = {}
+    for name, column in payload.pop("columns").items():
+        values = np.frombuffer(column["data"], dtype=column["dtype"])
+        if "dictionary" in column:
+            values = pd.Categorical.from_codes(values, categories=column["dictionary"])
+        elif name == "timestamp":
+            values = pd.to_datetime(values, unit="ms", utc=True)
+        data[name] = values
+    return payload, pd.DataFrame(data)
+
+
+# comme api_get, avec une réponse en colonnes : retourne (métadonnées, DataFrame), partagés entre sessions
+def api_get_frame(path, params=None, ttl=DATA_TTL):
+    def load():
+        response = session.get(
+            f"{API_BASE}{path}", params=params, headers={"Accept": COLUMNAR_TYPE}, timeout=API_TIMEOUT
+        )
+        response.raise_for_status()
+        return decode_columns(response.content)
+
+    key = (path, COLUMNAR_TYPE, tuple(sorted((params or {}).items())))
+    return cache.get_or_load(key, ttl, load)
+
+# but : interroger l'endpoint /plants de l'API pour récupérer la liste des id.
+def get_plants():
+    try:
+        return api_get("/plants", ttl=REGISTRY_TTL)
     except Exception:
         return []
 
 # but : récupérer la liste des capteurs pour une plante spécifiée via l'endpoint /sensors
 def get_sensors(plant_id):
     try:
-        response = requests.get(
-            f"{API_BASE}/sensors",
-            params={"plant_id": plant_id}
-        )
-        response.raise_for_status()
-        return response.json()
+        return api_get("/sensors", {"plant_id": plant_id}, ttl=REGISTRY_TTL)
     except Exception:
         return []
 
 # but : obtenir les données enregistrées par un capteur spécifique sur une plage temporelle donnée via l'endpoint /data
-def get_sensor_data(plant_id, sensor_id, start, end):
+def get_sensor_data(plant_id, sensor_id, start, end, max_points=MAX_POINTS):
     try:
         params = {
             "plant_id": plant_id,
             "sensor_id": sensor_id,
             "start": start.isoformat(),
-            "end": end.isoformat()
+            "end": end.isoformat(),
+            "max_points": max_points
         }
-        response = requests.get(f"{API_BASE}/data", params=params)
-        response.raise_for_status()
-        return response.json().get("results", [])
+        return api_get("/data", params).get("results", [])
     except Exception:
         return []
+
+# but : comme get_sensor_data, en retournant aussi last_id ; avec since (last_id d'un appel précédent), seules
+# les mesures insérées depuis sont demandées, sans borne de plage. retourne (DataFrame des mesures, last_id) ;
+# le DataFrame est vide en cas d'erreur.
+def get_sensor_window(plant_id, sensor_id, start, end, since=None, max_points=MAX_POINTS):
+    if since is None:
+        params = {
+            "plant_id": plant_id,
+            "sensor_id": sensor_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "max_points": max_points
+        }
+    else:
+        params = {"plant_id": plant_id, "sensor_id": sensor_id, "since": since, "limit": SINCE_LIMIT}
+    try:
+        meta, df = api_get_frame("/data", params)
+        return df, meta.get("last_id", since)
+    except Exception:
+        return pd.DataFrame(), since
+
+# but : obtenir en un seul appel les données de tous les capteurs d'une plante via l'endpoint /data/plant
+# (DataFrame timestamp, temperature, humidity, anomaly, cross_sensor_issue, sensor_id ; vide en cas d'erreur)
+def get_plant_data(plant_id, start, end, max_points=MAX_POINTS):
+    try:
+        params = {
+            "plant_id": plant_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "max_points": max_points
+        }
+        return api_get_frame("/data/plant", params)[1]
+    except Exception:
+        return pd.DataFrame()
+
+# but : résumé des anomalies d'un capteur sur une plage via l'endpoint /anomalies : total, compteurs par raison
+# ({"temp_high": 3, ...}) et les limit plus récentes avec leurs raisons ; None en cas d'erreur
+def get_anomalies(plant_id, sensor_id, start, end, limit=ANOMALIES_LIMIT):
+    try:
+        params = {
+            "plant_id": plant_id,
+            "sensor_id": sensor_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "limit": limit
+        }
+        return api_get("/anomalies", params)
+    except Exception:
+        return None
+
+
+# flux /stream (Server-Sent Events) partagé par toutes les sessions du processus : un thread de fond lit les
+# nouvelles mesures et les marquages d'anomalies de toutes les plantes et garde les LIVE_BUFFER derniers
+# événements, numérotés. chaque session lit les événements postérieurs à sa position au lieu d'interroger /data.
+# epoch change à chaque (re)connexion ou perte d'événements : les positions antérieures ne sont plus fiables.
+
+class LiveFeed:
+    def __init__(self, url, buffer_size=LIVE_BUFFER):
+        self.url = url
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.connected = False
+        self.epoch = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                # délai de lecture supérieur à l'intervalle des pings de l'API : détecte une connexion morte
+                with requests.get(self.url, stream=True, timeout=(3.05, 60)) as response:
+                    response.raise_for_status()
+                    self._reset(connected=True)
+                    self.consume(response.iter_lines(decode_unicode=True))
+            except Exception:
+                pass
+            self._reset(connected=False)
+            time.sleep(LIVE_RETRY)
+
+    # décode les lignes SSE (event: / data: / ligne vide)
+    def consume(self, lines):
+        event, data = None, []
+        for line in lines:
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].strip())
+            elif not line:
+                if event:
+                    self.dispatch(event, json.loads("\n".join(data)) if data else {})
+                event, data = None, []
+
+    def dispatch(self, event, data):
+        if event == "resync":
+            self._reset(connected=True)
+            return
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, event, data))
+
+    def _reset(self, connected):
+        with self._lock:
+            self.connected = connected
+            self.epoch += 1
+
+    # position courante (seq, epoch), None si le flux n'est pas connecté
+    def position(self):
+        with self._lock:
+            return (self._seq, self.epoch) if self.connected else None
+
+    # événements d'une plante postérieurs à position : ([(événement, données)], nouvelle position),
+    # None si le flux est coupé, a changé d'epoch, ou a déjà oublié des événements postérieurs à position
+    def since(self, position, plant_id):
+        with self._lock:
+            seq, epoch = position
+            if not self.connected or epoch != self.epoch:
+                return None
+            if self._events and self._events[0][0] > seq + 1:
+                return None
+            events = [(event, data) for s, event, data in self._events if s > seq and data.get("plant_id") == plant_id]
+            return events, (self._seq, self.epoch)
+
+
+feed = LiveFeed(f"{API_BASE}/stream")
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import msgpack
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_api import LiveFeed, SharedCache, decode_columns
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = SharedCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return [1, 2, 3]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", 10, load))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [[1, 2, 3]] * 8
+    assert cache.get_or_load("k", 10, load) == [1, 2, 3]
+    assert len(calls) == 1
+
+
+def test_expired_entries_are_reloaded():
+    cache = SharedCache()
+    assert cache.get_or_load("k", 0, lambda: 1) == 1
+    assert cache.get_or_load("k", 0, lambda: 2) == 2
+
+
+def test_errors_are_not_cached():
+    cache = SharedCache()
+
+    def fail():
+        raise ConnectionError("API indisponible")
+
+    with pytest.raises(ConnectionError):
+        cache.get_or_load("k", 10, fail)
+    assert cache.get_or_load("k", 10, lambda: "ok") == "ok"
+
+
+def test_live_feed_parses_events_per_plant():
+    feed = LiveFeed("http://api/stream")
+    feed._reset(connected=True)
+    start = feed.position()
+    feed.consume([
+        "retry: 5000", "",
+        "event: reading", 'data: {"plant_id": 1, "sensor_id": "S-1"}', "",
+        ": ping", "",
+        "event: reading", 'data: {"plant_id": 2, "sensor_id": "S-9"}', "",
+    ])
+
+    events, position = feed.since(start, 1)
+    assert events == [("reading", {"plant_id": 1, "sensor_id": "S-1"})]
+    assert feed.since(position, 1) == ([], position)
+
+
+def test_live_feed_invalidates_positions_on_resync_and_overflow():
+    feed = LiveFeed("http://api/stream", buffer_size=2)
+    feed._reset(connected=True)
+    start = feed.position()
+    feed.consume(["event: resync", ""])
+    assert feed.since(start, 1) is None
+
+    start = feed.position()
+    for _ in range(3):
+        feed.dispatch("reading", {"plant_id": 1})
+    assert feed.since(start, 1) is None
+
+
+def test_decode_columns_builds_frame():
+    content = msgpack.packb({
+        "last_id": 7,
+        "rows": 2,
+        "columns": {
+            "timestamp": {"dtype": "<i8", "data": np.array([1712577600123, 1712577605123]).tobytes()},
+            "temperature": {"dtype": "<f8", "data": np.array([21.5, 22.0]).tobytes()},
+            "sensor_id": {"dtype": "<i4", "dictionary": ["S-1", "S-2"], "data": np.array([1, 0], dtype="<i4").tobytes()},
+        }
+    }, use_bin_type=True)
+
+    meta, df = decode_columns(content)
+
+    assert meta == {"last_id": 7, "rows": 2}
+    assert df["timestamp"].iloc[0] == pd.Timestamp("2024-04-08T12:00:00.123Z")
+    assert list(df["temperature"]) == [21.5, 22.0]
+    assert list(df["sensor_id"]) == ["S-2", "S-1"]
@@ -0,0 +1,290 @@
+-- fonctions de maintenance du schéma, rejouables (CREATE OR REPLACE).
+-- exécuté après init.sql à l'initialisation de la base, et inclus par les migrations qui le modifient.
+
+-- crée les partitions journalières de sensor_data de "days_back" jours dans le passé jusqu'à "days_ahead" jours dans le futur.
+-- si la partition par défaut contient déjà des lignes du jour concerné, elles sont déplacées dans la nouvelle partition.
+CREATE OR REPLACE FUNCTION create_sensor_data_partitions(days_ahead INTEGER DEFAULT 7, days_back INTEGER DEFAULT 1)
+RETURNS INTEGER AS $$
+DECLARE
+    day DATE;
+    partition_name TEXT;
+    range_start TIMESTAMPTZ;
+    range_end TIMESTAMPTZ;
+    created INTEGER := 0;
+BEGIN
+    FOR day IN
+        SELECT d::date FROM generate_series((now() AT TIME ZONE 'UTC')::date - days_back,
+                                            (now() AT TIME ZONE 'UTC')::date + days_ahead,
+                                            INTERVAL '1 day') AS d
+    LOOP
+        partition_name := format('sensor_data_%s', to_char(day, 'YYYYMMDD'));
+        CONTINUE WHEN to_regclass(partition_name) IS NOT NULL;
+
+        range_start := day::timestamp AT TIME ZONE 'UTC';
+        range_end := (day + 1)::timestamp AT TIME ZONE 'UTC';
+
+        EXECUTE format('CREATE TABLE %I (LIKE sensor_data INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM sensor_data_default WHERE timestamp >= %L AND timestamp < %L RETURNING *)
+             INSERT INTO %I SELECT * FROM moved',
+            range_start, range_end, partition_name);
+        EXECUTE format('ALTER TABLE sensor_data ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                       partition_name, range_start, range_end);
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- supprime (ou archive dans le schéma "archive") les partitions journalières entièrement antérieures à now() - retention.
+CREATE OR REPLACE FUNCTION drop_sensor_data_partitions(retention INTERVAL, archive BOOLEAN DEFAULT FALSE)
+RETURNS INTEGER AS $$
+DECLARE
+    partition_name TEXT;
+    removed INTEGER := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sensor_data'::regclass
+          AND c.relname ~ '^sensor_data_[0-9]{8}$'
+          AND to_date(substring(c.relname FROM 13), 'YYYYMMDD') + 1
+              <= ((now() - retention) AT TIME ZONE 'UTC')::date
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE sensor_data DETACH PARTITION %I', partition_name);
+        IF archive THEN
+            CREATE SCHEMA IF NOT EXISTS archive;
+            EXECUTE format('ALTER TABLE %I SET SCHEMA archive', partition_name);
+        ELSE
+            EXECUTE format('DROP TABLE %I', partition_name);
+        END IF;
+        removed := removed + 1;
+    END LOOP;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- agrégats minute / heure : les nouvelles mesures d'un INSERT (ou d'un COPY) sont agrégées en une passe
+-- et fusionnées dans sensor_data_1m et sensor_data_1h. les seaux sont calculés en UTC.
+CREATE OR REPLACE FUNCTION sensor_data_rollup_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_data_1m AS r
+    SELECT date_trunc('minute', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', plant_id, sensor_id,
+           count(*), min(temperature), max(temperature), sum(temperature),
+           min(humidity), max(humidity), sum(humidity),
+           count(*) FILTER (WHERE anomaly), count(*) FILTER (WHERE cross_sensor_issue)
+    FROM new_rows
+    GROUP BY 1, 2, 3
+    ON CONFLICT (plant_id, sensor_id, bucket) DO UPDATE SET
+        readings = r.readings + EXCLUDED.readings,
+        temperature_min = LEAST(r.temperature_min, EXCLUDED.temperature_min),
+        temperature_max = GREATEST(r.temperature_max, EXCLUDED.temperature_max),
+        temperature_sum = r.temperature_sum + EXCLUDED.temperature_sum,
+        humidity_min = LEAST(r.humidity_min, EXCLUDED.humidity_min),
+        humidity_max = GREATEST(r.humidity_max, EXCLUDED.humidity_max),
+        humidity_sum = r.humidity_sum + EXCLUDED.humidity_sum,
+        anomaly_count = r.anomaly_count + EXCLUDED.anomaly_count,
+        cross_sensor_count = r.cross_sensor_count + EXCLUDED.cross_sensor_count;
+
+    INSERT INTO sensor_data_1h AS r
+    SELECT date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', plant_id, sensor_id,
+           count(*), min(temperature), max(temperature), sum(temperature),
+           min(humidity), max(humidity), sum(humidity),
+           count(*) FILTER (WHERE anomaly), count(*) FILTER (WHERE cross_sensor_issue)
+    FROM new_rows
+    GROUP BY 1, 2, 3
+    ON CONFLICT (plant_id, sensor_id, bucket) DO UPDATE SET
+        readings = r.readings + EXCLUDED.readings,
+        temperature_min = LEAST(r.temperature_min, EXCLUDED.temperature_min),
+        temperature_max = GREATEST(r.temperature_max, EXCLUDED.temperature_max),
+        temperature_sum = r.temperature_sum + EXCLUDED.temperature_sum,
+        humidity_min = LEAST(r.humidity_min, EXCLUDED.humidity_min),
+        humidity_max = GREATEST(r.humidity_max, EXCLUDED.humidity_max),
+        humidity_sum = r.humidity_sum + EXCLUDED.humidity_sum,
+        anomaly_count = r.anomaly_count + EXCLUDED.anomaly_count,
+        cross_sensor_count = r.cross_sensor_count + EXCLUDED.cross_sensor_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- répercute sur les agrégats les changements des indicateurs anomaly / cross_sensor_issue (marquage par le détecteur)
+CREATE OR REPLACE FUNCTION sensor_data_rollup_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    WITH deltas AS (
+        SELECT date_trunc('minute', n.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS minute_bucket,
+               date_trunc('hour', n.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour_bucket,
+               n.plant_id, n.sensor_id,
+               n.anomaly::int - o.anomaly::int AS anomaly_delta,
+               n.cross_sensor_issue::int - o.cross_sensor_issue::int AS cross_delta
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id AND o.timestamp = n.timestamp
+        WHERE n.anomaly IS DISTINCT FROM o.anomaly OR n.cross_sensor_issue IS DISTINCT FROM o.cross_sensor_issue
+    ), minute_update AS (
+        UPDATE sensor_data_1m r SET
+            anomaly_count = r.anomaly_count + d.anomaly_delta,
+            cross_sensor_count = r.cross_sensor_count + d.cross_delta
+        FROM (SELECT minute_bucket, plant_id, sensor_id,
+                     sum(anomaly_delta) AS anomaly_delta, sum(cross_delta) AS cross_delta
+              FROM deltas GROUP BY 1, 2, 3) d
+        WHERE r.bucket = d.minute_bucket AND r.plant_id = d.plant_id AND r.sensor_id = d.sensor_id
+    )
+    UPDATE sensor_data_1h r SET
+        anomaly_count = r.anomaly_count + d.anomaly_delta,
+        cross_sensor_count = r.cross_sensor_count + d.cross_delta
+    FROM (SELECT hour_bucket, plant_id, sensor_id,
+                 sum(anomaly_delta) AS anomaly_delta, sum(cross_delta) AS cross_delta
+          FROM deltas GROUP BY 1, 2, 3) d
+    WHERE r.bucket = d.hour_bucket AND r.plant_id = d.plant_id AND r.sensor_id = d.sensor_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- compteurs d'anomalies par raison : chaque bit du code de raison des nouvelles mesures est compté dans
+-- sensor_anomalies_1m (seau d'une minute, en UTC). la raison 0 compte les mesures signalées (anomaly ou
+-- cross_sensor_issue, comme la liste de /anomalies), une seule fois quel que soit le nombre de bits.
+CREATE OR REPLACE FUNCTION sensor_data_anomaly_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_anomalies_1m AS a
+    SELECT date_trunc('minute', n.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', n.plant_id, n.sensor_id,
+           r.reason, count(*)
+    FROM new_rows n
+    CROSS JOIN LATERAL (
+        SELECT 1 << bit FROM generate_series(0, 30) AS bit WHERE (n.reason & (1 << bit)) <> 0
+        UNION ALL
+        SELECT 0 WHERE n.anomaly OR n.cross_sensor_issue
+    ) AS r(reason)
+    WHERE n.reason <> 0 OR n.anomaly OR n.cross_sensor_issue
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (plant_id, sensor_id, bucket, reason) DO UPDATE SET
+        anomalies = a.anomalies + EXCLUDED.anomalies;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- répercute sur les compteurs les bits de raison ajoutés (ou retirés) et les mesures nouvellement signalées
+-- par une mise à jour (marquage par le détecteur)
+CREATE OR REPLACE FUNCTION sensor_data_anomaly_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sensor_anomalies_1m AS a
+    SELECT bucket, plant_id, sensor_id, reason, delta
+    FROM (
+        SELECT date_trunc('minute', n.timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS bucket,
+               n.plant_id, n.sensor_id, r.reason, sum(r.delta) AS delta
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id AND o.timestamp = n.timestamp
+        CROSS JOIN LATERAL (
+            SELECT 1 << bit, ((n.reason & (1 << bit)) <> 0)::int - ((o.reason & (1 << bit)) <> 0)::int
+            FROM generate_series(0, 30) AS bit
+            WHERE ((n.reason # o.reason) & (1 << bit)) <> 0
+            UNION ALL
+            SELECT 0, (n.anomaly OR n.cross_sensor_issue)::int - (o.anomaly OR o.cross_sensor_issue)::int
+        ) AS r(reason, delta)
+        WHERE r.delta <> 0
+        GROUP BY 1, 2, 3, 4
+    ) d
+    WHERE delta <> 0
+    ON CONFLICT (plant_id, sensor_id, bucket, reason) DO UPDATE SET
+        anomalies = a.anomalies + EXCLUDED.anomalies;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- notifie le détecteur des nouvelles mesures (canal sensor_data_inserted) : une notification par plante et par
+-- instruction, avec l'intervalle d'id insérés et l'heure d'insertion (epoch, secondes). les notifications ne sont
+-- délivrées qu'à la validation de la transaction.
+CREATE OR REPLACE FUNCTION sensor_data_notify()
+RETURNS TRIGGER AS $$
+DECLARE
+    batch RECORD;
+BEGIN
+    FOR batch IN
+        SELECT plant_id, min(id) AS min_id, max(id) AS max_id, count(*) AS readings FROM new_rows GROUP BY plant_id
+    LOOP
+        PERFORM pg_notify('sensor_data_inserted', json_build_object(
+            'plant_id', batch.plant_id,
+            'min_id', batch.min_id,
+            'max_id', batch.max_id,
+            'readings', batch.readings,
+            'inserted_at', extract(epoch FROM clock_timestamp())
+        )::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- notifie l'API d'ingestion (flux /stream) des mesures nouvellement marquées par le détecteur (canal
+-- sensor_data_flagged) : une notification par plante et par instruction, avec les mesures concernées ; au-delà
+-- de 50 mesures seul leur nombre est envoyé, pour rester sous la limite de 8000 octets d'une notification.
+CREATE OR REPLACE FUNCTION sensor_data_flag_notify()
+RETURNS TRIGGER AS $$
+DECLARE
+    batch RECORD;
+BEGIN
+    FOR batch IN
+        SELECT n.plant_id, count(*) AS flagged,
+               json_agg(json_build_object(
+                   'id', n.id,
+                   'sensor_id', n.sensor_id,
+                   'timestamp', n.timestamp,
+                   'anomaly', n.anomaly,
+                   'cross_sensor_issue', n.cross_sensor_issue
+               ) ORDER BY n.id) AS readings
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id AND o.timestamp = n.timestamp
+        WHERE (n.anomaly AND NOT o.anomaly) OR (n.cross_sensor_issue AND NOT o.cross_sensor_issue)
+        GROUP BY n.plant_id
+    LOOP
+        PERFORM pg_notify('sensor_data_flagged', json_build_object(
+            'plant_id', batch.plant_id,
+            'flagged', batch.flagged,
+            'readings', CASE WHEN batch.flagged <= 50 THEN batch.readings END
+        )::text);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sensor_data_rollup_insert ON sensor_data;
+CREATE TRIGGER sensor_data_rollup_insert
+    AFTER INSERT ON sensor_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_rollup_insert();
+
+DROP TRIGGER IF EXISTS sensor_data_rollup_update ON sensor_data;
+CREATE TRIGGER sensor_data_rollup_update
+    AFTER UPDATE ON sensor_data
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_rollup_update();
+
+DROP TRIGGER IF EXISTS sensor_data_anomaly_insert ON sensor_data;
+CREATE TRIGGER sensor_data_anomaly_insert
+    AFTER INSERT ON sensor_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_anomaly_insert();
+
+DROP TRIGGER IF EXISTS sensor_data_anomaly_update ON sensor_data;
+CREATE TRIGGER sensor_data_anomaly_update
+    AFTER UPDATE ON sensor_data
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_anomaly_update();
+
+DROP TRIGGER IF EXISTS sensor_data_notify ON sensor_data;
+CREATE TRIGGER sensor_data_notify
+    AFTER INSERT ON sensor_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_notify();
+
+DROP TRIGGER IF EXISTS sensor_data_flag_notify ON sensor_data;
+CREATE TRIGGER sensor_data_flag_notify
+    AFTER UPDATE ON sensor_data
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_flag_notify();
+
+SELECT create_sensor_data_partitions();
@@ -1,5 +1,7 @@
+-- table des mesures, partitionnée par jour sur "timestamp" (une partition par jour UTC, voir functions.sql).
+-- la clé primaire d'une table partitionnée doit contenir la clé de partitionnement : (id, timestamp).
 CREATE TABLE IF NOT EXISTS sensor_data (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     sensor_id VARCHAR(50) NOT NULL,
     sensor_version VARCHAR(10) NOT NULL,
     plant_id INTEGER NOT NULL,  --
@@ -7,8 +9,106 @@ CREATE TABLE IF NOT EXISTS sensor_data (
     humidity FLOAT NOT NULL,
     timestamp TIMESTAMPTZ NOT NULL,
     anomaly BOOLEAN DEFAULT FALSE,
-    cross_sensor_issue BOOLEAN DEFAULT FALSE
+    cross_sensor_issue BOOLEAN DEFAULT FALSE,
+    -- raisons des anomalies : combinaison des bits de shared/rules.py (0 si aucune raison connue)
+    reason INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- reçoit les mesures hors des partitions journalières (horloge capteur décalée, partition pas encore créée)
+CREATE TABLE IF NOT EXISTS sensor_data_default PARTITION OF sensor_data DEFAULT;
+
+-- index alignés sur les requêtes de l'API :
+--  - /data avec capteur : (plant_id, sensor_id, timestamp DESC), couvrant les colonnes renvoyées (index-only scan) ;
+--    sert aussi /sensors (sensor_version incluse) ;
+--  - /data sans capteur et /plants : (plant_id, timestamp DESC) ;
+--  - fenêtres temporelles du détecteur : BRIN sur timestamp, adapté à l'insertion en ordre chronologique ;
+--  - lecture incrémentale du détecteur (nouvelles mesures d'une plante après son point de reprise) : (plant_id, id) ;
+--  - /anomalies : index partiel des seules mesures anormales, (plant_id, timestamp DESC, id DESC).
+CREATE INDEX idx_plant_sensor_timestamp ON sensor_data (plant_id, sensor_id, timestamp DESC)
+    INCLUDE (sensor_version, temperature, humidity, anomaly, cross_sensor_issue);
+CREATE INDEX idx_plant_timestamp ON sensor_data (plant_id, timestamp DESC);
+CREATE INDEX idx_timestamp_brin ON sensor_data USING BRIN (timestamp);
+CREATE INDEX idx_plant_id ON sensor_data (plant_id, id);
+CREATE INDEX idx_plant_anomalies ON sensor_data (plant_id, timestamp DESC, id DESC)
+    WHERE anomaly OR cross_sensor_issue;
+
+-- registre des capteurs, tenu à jour par l'API d'ingestion : /plants et /sensors le lisent au lieu de parcourir l'historique
+CREATE TABLE IF NOT EXISTS sensors (
+    sensor_id VARCHAR(50) NOT NULL,
+    sensor_version VARCHAR(10) NOT NULL,
+    plant_id INTEGER NOT NULL,
+    first_seen TIMESTAMPTZ NOT NULL,
+    last_seen TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (plant_id, sensor_id)
+);
+
+-- agrégats par capteur et par minute / par heure, tenus à jour de façon incrémentale par des triggers
+-- sur sensor_data (voir functions.sql). les moyennes se calculent par somme / nombre de mesures.
+CREATE TABLE IF NOT EXISTS sensor_data_1m (
+    bucket TIMESTAMPTZ NOT NULL,
+    plant_id INTEGER NOT NULL,
+    sensor_id VARCHAR(50) NOT NULL,
+    readings INTEGER NOT NULL,
+    temperature_min FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    temperature_sum FLOAT NOT NULL,
+    humidity_min FLOAT NOT NULL,
+    humidity_max FLOAT NOT NULL,
+    humidity_sum FLOAT NOT NULL,
+    anomaly_count INTEGER NOT NULL DEFAULT 0,
+    cross_sensor_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (plant_id, sensor_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS sensor_data_1h (LIKE sensor_data_1m INCLUDING ALL);
+
+-- mesures anormales par capteur, par minute et par raison (un bit de sensor_data.reason par ligne, 0 pour le total
+-- des mesures signalées), tenues à jour par des triggers sur sensor_data (voir functions.sql) : /anomalies en tire
+-- ses compteurs sans relire les mesures.
+CREATE TABLE IF NOT EXISTS sensor_anomalies_1m (
+    bucket TIMESTAMPTZ NOT NULL,
+    plant_id INTEGER NOT NULL,
+    sensor_id VARCHAR(50) NOT NULL,
+    reason INTEGER NOT NULL,
+    anomalies INTEGER NOT NULL,
+    PRIMARY KEY (plant_id, sensor_id, bucket, reason)
+);
+
+-- point de reprise du détecteur d'anomalies par plante : dernier id traité (et horodatage le plus récent vu),
+-- mis à jour dans la même transaction que les marquages d'anomalies.
+CREATE TABLE IF NOT EXISTS detector_state (
+    plant_id INTEGER PRIMARY KEY,
+    last_id BIGINT NOT NULL,
+    last_timestamp TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- statistiques glissantes de dérive par capteur (moyenne / variance à décroissance exponentielle, voir
+-- detection/streaming.py), sauvegardées avec le point de reprise pour reprendre sans relire l'historique.
+-- un même sensor_id peut exister sur plusieurs plantes : la clé est (plant_id, sensor_id).
+CREATE TABLE IF NOT EXISTS sensor_stats (
+    sensor_id VARCHAR(50) NOT NULL,
+    plant_id INTEGER NOT NULL,
+    last_timestamp TIMESTAMPTZ NOT NULL,
+    weight FLOAT NOT NULL,
+    temperature_mean FLOAT NOT NULL,
+    temperature_var FLOAT NOT NULL,
+    humidity_mean FLOAT NOT NULL,
+    humidity_var FLOAT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (plant_id, sensor_id)
 );
 
-CREATE INDEX idx_plant ON sensor_data (plant_id);
-CREATE INDEX idx_timestamp ON sensor_data (timestamp);
+-- répartition des plantes entre réplicas du détecteur : battement de cœur des réplicas vivants, et bail
+-- (propriétaire, expiration) par plante, renouvelé à chaque passage par le réplica qui la traite.
+CREATE TABLE IF NOT EXISTS detector_replicas (
+    replica_id VARCHAR(100) PRIMARY KEY,
+    heartbeat_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS detector_leases (
+    plant_id INTEGER PRIMARY KEY,
+    owner VARCHAR(100) NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
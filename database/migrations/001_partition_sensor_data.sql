@@ -0,0 +1,54 @@
+-- migration d'une base existante vers la table sensor_data partitionnée par jour.
+-- à exécuter depuis le dossier database/ : psql -v ON_ERROR_STOP=1 -f migrations/001_partition_sensor_data.sql
+-- les migrations s'appliquent toutes, dans l'ordre, services d'ingestion et de détection arrêtés.
+-- les nouvelles installations n'en ont pas besoin (init.sql crée directement la table partitionnée).
+
+BEGIN;
+
+ALTER TABLE sensor_data RENAME TO sensor_data_legacy;
+ALTER TABLE sensor_data_legacy RENAME CONSTRAINT sensor_data_pkey TO sensor_data_legacy_pkey;
+DROP INDEX IF EXISTS idx_plant;
+DROP INDEX IF EXISTS idx_timestamp;
+
+-- même définition que init.sql, la séquence existante est conservée pour ne pas réutiliser d'identifiants
+CREATE TABLE sensor_data (
+    id INTEGER NOT NULL DEFAULT nextval('sensor_data_id_seq'),
+    sensor_id VARCHAR(50) NOT NULL,
+    sensor_version VARCHAR(10) NOT NULL,
+    plant_id INTEGER NOT NULL,
+    temperature FLOAT NOT NULL,
+    humidity FLOAT NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL,
+    anomaly BOOLEAN DEFAULT FALSE,
+    cross_sensor_issue BOOLEAN DEFAULT FALSE,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE sensor_data_default PARTITION OF sensor_data DEFAULT;
+
+CREATE INDEX idx_plant ON sensor_data (plant_id);
+CREATE INDEX idx_timestamp ON sensor_data (timestamp);
+
+ALTER SEQUENCE sensor_data_id_seq OWNED BY sensor_data.id;
+
+\ir ../functions.sql
+
+-- crée une partition par jour couvert par l'historique, puis recopie les données
+DO $$
+DECLARE
+    oldest DATE;
+BEGIN
+    SELECT (min(timestamp) AT TIME ZONE 'UTC')::date INTO oldest FROM sensor_data_legacy;
+    IF oldest IS NOT NULL THEN
+        PERFORM create_sensor_data_partitions(7, GREATEST(1, (now() AT TIME ZONE 'UTC')::date - oldest));
+    END IF;
+END;
+$$;
+
+-- les agrégats éventuellement définis par functions.sql sont reconstruits par leur propre migration
+ALTER TABLE sensor_data DISABLE TRIGGER USER;
+INSERT INTO sensor_data SELECT * FROM sensor_data_legacy;
+ALTER TABLE sensor_data ENABLE TRIGGER USER;
+DROP TABLE sensor_data_legacy;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- remplace les index mono-colonne par des index alignés sur les requêtes de l'API (voir init.sql).
+-- sur une table partitionnée, CREATE INDEX ne peut pas être CONCURRENTLY : à exécuter hors des heures de pointe.
+-- psql -v ON_ERROR_STOP=1 -f migrations/002_query_indexes.sql
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_plant_sensor_timestamp ON sensor_data (plant_id, sensor_id, timestamp DESC)
+    INCLUDE (sensor_version, temperature, humidity, anomaly, cross_sensor_issue);
+CREATE INDEX IF NOT EXISTS idx_plant_timestamp ON sensor_data (plant_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_timestamp_brin ON sensor_data USING BRIN (timestamp);
+
+DROP INDEX IF EXISTS idx_plant;
+DROP INDEX IF EXISTS idx_timestamp;
+
+COMMIT;
+
+ANALYZE sensor_data;
@@ -0,0 +1,23 @@
+-- crée le registre des capteurs et le remplit à partir de l'historique existant.
+-- psql -v ON_ERROR_STOP=1 -f migrations/003_sensors_registry.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS sensors (
+    sensor_id VARCHAR(50) NOT NULL,
+    sensor_version VARCHAR(10) NOT NULL,
+    plant_id INTEGER NOT NULL,
+    first_seen TIMESTAMPTZ NOT NULL,
+    last_seen TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (plant_id, sensor_id)
+);
+
+INSERT INTO sensors (sensor_id, sensor_version, plant_id, first_seen, last_seen)
+SELECT DISTINCT ON (plant_id, sensor_id) sensor_id, sensor_version, plant_id,
+       min(timestamp) OVER (PARTITION BY plant_id, sensor_id),
+       max(timestamp) OVER (PARTITION BY plant_id, sensor_id)
+FROM sensor_data
+ORDER BY plant_id, sensor_id, timestamp DESC
+ON CONFLICT (plant_id, sensor_id) DO NOTHING;
+
+COMMIT;
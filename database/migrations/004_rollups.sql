@@ -0,0 +1,46 @@
+-- crée les agrégats par minute et par heure, leurs triggers, et les calcule sur l'historique existant.
+-- psql -v ON_ERROR_STOP=1 -f migrations/004_rollups.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS sensor_data_1m (
+    bucket TIMESTAMPTZ NOT NULL,
+    plant_id INTEGER NOT NULL,
+    sensor_id VARCHAR(50) NOT NULL,
+    readings INTEGER NOT NULL,
+    temperature_min FLOAT NOT NULL,
+    temperature_max FLOAT NOT NULL,
+    temperature_sum FLOAT NOT NULL,
+    humidity_min FLOAT NOT NULL,
+    humidity_max FLOAT NOT NULL,
+    humidity_sum FLOAT NOT NULL,
+    anomaly_count INTEGER NOT NULL DEFAULT 0,
+    cross_sensor_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (plant_id, sensor_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS sensor_data_1h (LIKE sensor_data_1m INCLUDING ALL);
+
+\ir ../functions.sql
+
+-- recalcul complet à partir de l'historique, sous verrou pour ne pas perdre d'insertions concurrentes
+LOCK TABLE sensor_data IN SHARE MODE;
+TRUNCATE sensor_data_1m, sensor_data_1h;
+
+INSERT INTO sensor_data_1m
+SELECT date_trunc('minute', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', plant_id, sensor_id,
+       count(*), min(temperature), max(temperature), sum(temperature),
+       min(humidity), max(humidity), sum(humidity),
+       count(*) FILTER (WHERE anomaly), count(*) FILTER (WHERE cross_sensor_issue)
+FROM sensor_data
+GROUP BY 1, 2, 3;
+
+INSERT INTO sensor_data_1h
+SELECT date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', plant_id, sensor_id,
+       count(*), min(temperature), max(temperature), sum(temperature),
+       min(humidity), max(humidity), sum(humidity),
+       count(*) FILTER (WHERE anomaly), count(*) FILTER (WHERE cross_sensor_issue)
+FROM sensor_data
+GROUP BY 1, 2, 3;
+
+COMMIT;
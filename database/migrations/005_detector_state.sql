@@ -0,0 +1,16 @@
+-- ajoute le point de reprise du détecteur et l'index de lecture incrémentale (voir init.sql).
+-- sans ligne dans detector_state, le détecteur reprend sur les 2 dernières minutes de chaque plante.
+-- psql -v ON_ERROR_STOP=1 -f migrations/005_detector_state.sql
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_plant_id ON sensor_data (plant_id, id);
+
+CREATE TABLE IF NOT EXISTS detector_state (
+    plant_id INTEGER PRIMARY KEY,
+    last_id BIGINT NOT NULL,
+    last_timestamp TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMIT;
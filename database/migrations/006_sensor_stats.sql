@@ -0,0 +1,20 @@
+-- ajoute la sauvegarde des statistiques de dérive du détecteur (voir init.sql).
+-- la table démarre vide : chaque capteur accumule DRIFT_MIN_WEIGHT de poids avant de pouvoir être signalé.
+-- psql -v ON_ERROR_STOP=1 -f migrations/006_sensor_stats.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS sensor_stats (
+    sensor_id VARCHAR(50) PRIMARY KEY,
+    plant_id INTEGER NOT NULL,
+    last_timestamp TIMESTAMPTZ NOT NULL,
+    weight FLOAT NOT NULL,
+    temperature_mean FLOAT NOT NULL,
+    temperature_var FLOAT NOT NULL,
+    humidity_mean FLOAT NOT NULL,
+    humidity_var FLOAT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_sensor_stats_plant ON sensor_stats (plant_id);
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- ajoute les tables de répartition des plantes entre réplicas du détecteur (voir init.sql).
+-- psql -v ON_ERROR_STOP=1 -f migrations/007_detector_leases.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS detector_replicas (
+    replica_id VARCHAR(100) PRIMARY KEY,
+    heartbeat_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS detector_leases (
+    plant_id INTEGER PRIMARY KEY,
+    owner VARCHAR(100) NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- ajoute le trigger de notification des nouvelles mesures au détecteur (voir functions.sql).
+-- psql -v ON_ERROR_STOP=1 -f migrations/008_insert_notifications.sql
+
+BEGIN;
+
+\ir ../functions.sql
+
+COMMIT;
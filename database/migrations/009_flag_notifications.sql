@@ -0,0 +1,8 @@
+-- ajoute le trigger de notification des mesures marquées par le détecteur, relayées par /stream (voir functions.sql).
+-- psql -v ON_ERROR_STOP=1 -f migrations/009_flag_notifications.sql
+
+BEGIN;
+
+\ir ../functions.sql
+
+COMMIT;
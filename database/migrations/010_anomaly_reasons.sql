@@ -0,0 +1,42 @@
+-- ajoute le code de raison des anomalies (sensor_data.reason), l'index partiel des mesures anormales et les
+-- compteurs par raison (sensor_anomalies_1m) avec leurs triggers (voir init.sql et functions.sql).
+-- les raisons des anomalies déjà enregistrées ne sont pas connues : seules les mesures marquées cross_sensor_issue
+-- reçoivent un code (bit 256, voir shared/rules.py) ; les autres restent comptées comme anomalies, sans raison.
+-- sur une table partitionnée, CREATE INDEX ne peut pas être CONCURRENTLY : à exécuter hors des heures de pointe.
+-- psql -v ON_ERROR_STOP=1 -f migrations/010_anomaly_reasons.sql
+
+BEGIN;
+
+ALTER TABLE sensor_data ADD COLUMN IF NOT EXISTS reason INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_plant_anomalies ON sensor_data (plant_id, timestamp DESC, id DESC)
+    WHERE anomaly OR cross_sensor_issue;
+
+CREATE TABLE IF NOT EXISTS sensor_anomalies_1m (
+    bucket TIMESTAMPTZ NOT NULL,
+    plant_id INTEGER NOT NULL,
+    sensor_id VARCHAR(50) NOT NULL,
+    reason INTEGER NOT NULL,
+    anomalies INTEGER NOT NULL,
+    PRIMARY KEY (plant_id, sensor_id, bucket, reason)
+);
+
+-- sous verrou pour ne pas perdre de marquages concurrents entre le code de raison et le calcul des compteurs
+LOCK TABLE sensor_data IN SHARE ROW EXCLUSIVE MODE;
+
+UPDATE sensor_data SET reason = 256 WHERE cross_sensor_issue AND reason = 0;
+
+\ir ../functions.sql
+
+TRUNCATE sensor_anomalies_1m;
+
+INSERT INTO sensor_anomalies_1m
+SELECT date_trunc('minute', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', plant_id, sensor_id, 1 << bit, count(*)
+FROM sensor_data
+CROSS JOIN generate_series(0, 30) AS bit
+WHERE reason <> 0 AND (reason & (1 << bit)) <> 0
+GROUP BY 1, 2, 3, 4;
+
+COMMIT;
+
+ANALYZE sensor_data;
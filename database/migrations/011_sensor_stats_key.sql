@@ -0,0 +1,11 @@
+-- clé de sensor_stats : (plant_id, sensor_id) au lieu de sensor_id seul (voir init.sql), un même capteur pouvant
+-- être déclaré sur plusieurs plantes. la clé commence par plant_id : l'index idx_sensor_stats_plant devient inutile.
+-- psql -v ON_ERROR_STOP=1 -f migrations/011_sensor_stats_key.sql
+
+BEGIN;
+
+ALTER TABLE sensor_stats DROP CONSTRAINT IF EXISTS sensor_stats_pkey;
+ALTER TABLE sensor_stats ADD PRIMARY KEY (plant_id, sensor_id);
+DROP INDEX IF EXISTS idx_sensor_stats_plant;
+
+COMMIT;
@@ -0,0 +1,20 @@
+-- ajoute aux compteurs d'anomalies (sensor_anomalies_1m) le total des mesures signalées, raison 0 : anomaly ou
+-- cross_sensor_issue, comme la liste de /anomalies (voir functions.sql). le total est recalculé depuis les mesures.
+-- psql -v ON_ERROR_STOP=1 -f migrations/012_anomaly_totals.sql
+
+BEGIN;
+
+-- sous verrou pour ne pas perdre de marquages concurrents entre le remplacement des triggers et le calcul
+LOCK TABLE sensor_data IN SHARE ROW EXCLUSIVE MODE;
+
+\ir ../functions.sql
+
+DELETE FROM sensor_anomalies_1m WHERE reason = 0;
+
+INSERT INTO sensor_anomalies_1m
+SELECT date_trunc('minute', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', plant_id, sensor_id, 0, count(*)
+FROM sensor_data
+WHERE anomaly OR cross_sensor_issue
+GROUP BY 1, 2, 3;
+
+COMMIT;
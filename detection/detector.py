@@ -1,13 +1,25 @@
 import psycopg2
+from psycopg2.extras import execute_values
+import os
 import time
 import logging
+import select
 import socket
+import threading
+import numpy as np
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from typing import List, Tuple
 
-# Seuils environnementaux
-TEMP_MIN = 5.0  # Au lieu de 10.0
-TEMP_MAX = 40.0  # Au lieu de 35.0
+from events import NOTIFY_CHANNEL, LatencyStats, PendingInserts, parse_notification
+from sharding import HashRing
+from streaming import StreamingStats
+from shared.rules import (CROSS_SENSOR, HUM_DRIFT, HUM_HIGH, HUM_LOW, HUM_RATE, TEMP_DRIFT, TEMP_HIGH, TEMP_LOW,
+                          TEMP_RATE, describe, rules)
+
+# Seuils environnementaux, de vitesse de variation et de dérive : règles communes (shared/rules.py, RULES_FILE)
 
 # Seuils d'écart entre capteurs
 MAX_TEMP_DIFF = 1.5  # Au lieu de 2.0
@@ -20,6 +32,64 @@ DB_NAME = "plant_monitoring"
 DB_USER = "postgres"
 DB_PASSWORD = "postgres"
 
+# Maintenance des partitions journalières de sensor_data
+PARTITION_DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "7"))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))  # 0 = conservation illimitée
+ARCHIVE_PARTITIONS = os.getenv("ARCHIVE_PARTITIONS", "0") == "1"
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+# rétention des agrégats par minute, mesures et compteurs d'anomalies (les agrégats horaires sont conservés)
+ROLLUP_1M_RETENTION_DAYS = int(os.getenv("ROLLUP_1M_RETENTION_DAYS", "30"))  # 0 = conservation illimitée
+# verrou consultatif (pg_try_advisory_xact_lock) : un seul réplica fait la maintenance à la fois
+PARTITION_MAINTENANCE_LOCK = 4_711_015
+
+# Détection incrémentale : nombre maximal de nouvelles mesures lues par plante et par requête
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", "5000"))
+# fenêtre glissante gardée en mémoire par plante pour la comparaison entre capteurs, et écart de temps
+# maximal entre deux mesures de capteurs différents pour les comparer (les capteurs émettent toutes les 8 à 15 s)
+CROSS_SENSOR_WINDOW = timedelta(seconds=int(os.getenv("CROSS_SENSOR_WINDOW", "120")))
+CROSS_SENSOR_TOLERANCE = timedelta(seconds=float(os.getenv("CROSS_SENSOR_TOLERANCE", "5")))
+# premier passage sans point de reprise : seules les mesures de cette période sont analysées
+COLD_START_WINDOW = timedelta(minutes=2)
+# délai pendant lequel une mesure validée tardivement, avec un id inférieur au point de reprise, est encore relue,
+# et nombre maximal d'intervalles d'id manquants gardés par plante pour cette relecture
+LATE_COMMIT_GRACE = float(os.getenv("LATE_COMMIT_GRACE", "60"))
+LATE_COMMIT_MAX_GAPS = int(os.getenv("LATE_COMMIT_MAX_GAPS", "1000"))
+
+# Dérive : demi-vie (en secondes) des statistiques glissantes par capteur, et poids minimal accumulé avant
+# de signaler une dérive (le seuil en écarts-types est le zscore des règles)
+DRIFT_HALF_LIFE = float(os.getenv("DRIFT_HALF_LIFE", "600"))
+DRIFT_MIN_WEIGHT = float(os.getenv("DRIFT_MIN_WEIGHT", "10"))
+
+# Parallélisme et répartition entre réplicas : nombre de plantes traitées en parallèle (une connexion par thread),
+# identifiant du réplica, durée de vie des baux de plantes et du battement de cœur des réplicas
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", "4"))
+REPLICA_ID = os.getenv("REPLICA_ID") or socket.gethostname()
+LEASE_TTL = timedelta(seconds=int(os.getenv("LEASE_TTL", "60")))
+REPLICA_TTL = timedelta(seconds=int(os.getenv("REPLICA_TTL", "30")))
+
+# Détection sur notification : écoute des insertions (LISTEN), délai de regroupement des notifications,
+# période des passages complets (repli si une notification est perdue) et des rapports de latence
+DETECTION_LISTEN = os.getenv("DETECTION_LISTEN", "1") == "1"
+NOTIFY_DEBOUNCE = float(os.getenv("NOTIFY_DEBOUNCE", "0.2"))
+DETECTION_POLL_INTERVAL = float(os.getenv("DETECTION_POLL_INTERVAL", "10"))
+LATENCY_REPORT_INTERVAL = float(os.getenv("LATENCY_REPORT_INTERVAL", "60"))
+
+# état en mémoire par plante ; une plante n'est traitée que par un thread à la fois
+# mesures récentes : {plant_id: deque[(id, sensor_id, timestamp, temperature, humidity, sensor_version)]}
+plant_windows = {}
+# statistiques de dérive : {plant_id: StreamingStats}
+plant_stats = {}
+# intervalles d'id sautés sous le point de reprise, à relire : {plant_id: deque[(échéance, premier id, dernier id)]}
+plant_gaps = {}
+
+# plantes détenues au dernier passage complet, insertions notifiées en attente d'analyse et latences mesurées
+owned_plants = set()
+pending_inserts = PendingInserts()
+latency_stats = LatencyStats()
+
+executor = ThreadPoolExecutor(max_workers=DETECTION_WORKERS, thread_name_prefix="detection")
+thread_state = threading.local()
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
@@ -61,135 +131,576 @@ def get_db_connection():
             time.sleep(wait_time)
     raise Exception("Échec de connexion à la base de données après 5 tentatives")
 
-# requête SQL pour comparer les mesures de températures et humidités entre capteurs différents. identifie une anomalie et pour chaque anomalie détectée loggue un avertissement détaillant l'écart observé entre les capteurs.
+# lit les points de reprise des plantes : {plant_id: last_id}
 
-def detect_cross_sensor_anomalies(cursor, plant_id: int):
-    """Détecte les anomalies entre capteurs sur la même plante"""
+def load_watermarks(cursor, plant_ids):
+    cursor.execute("SELECT plant_id, last_id FROM detector_state WHERE plant_id = ANY(%s)", (list(plant_ids),))
+    return dict(cursor.fetchall())
+
+# premier passage sur une plante sans point de reprise : on repart des mesures de COLD_START_WINDOW,
+# ou de la dernière mesure connue si la plante n'a rien reçu récemment
+
+def initial_watermark(cursor, plant_id: int) -> int:
+    cursor.execute("""
+        SELECT MIN(id) - 1 FROM sensor_data
+        WHERE plant_id = %s AND timestamp > NOW() - %s
+    """, (plant_id, COLD_START_WINDOW))
+    last_id = cursor.fetchone()[0]
+    if last_id is None:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data WHERE plant_id = %s", (plant_id,))
+        last_id = cursor.fetchone()[0]
+    return last_id
+
+# enregistre le point de reprise ; appelé dans la transaction qui contient les marquages du lot
+
+def save_watermark(cursor, plant_id: int, last_id: int, last_timestamp):
+    cursor.execute("""
+        INSERT INTO detector_state (plant_id, last_id, last_timestamp, updated_at)
+        VALUES (%s, %s, %s, NOW())
+        ON CONFLICT (plant_id) DO UPDATE
+        SET last_id = EXCLUDED.last_id,
+            last_timestamp = GREATEST(detector_state.last_timestamp, EXCLUDED.last_timestamp),
+            updated_at = EXCLUDED.updated_at
+    """, (plant_id, last_id, last_timestamp))
+
+# nouvelles mesures d'une plante après le point de reprise, dans l'ordre d'insertion (index (plant_id, id))
+
+def fetch_new_readings(cursor, plant_id: int, last_id: int) -> List[Tuple]:
+    cursor.execute("""
+        SELECT id, sensor_id, timestamp, temperature, humidity, sensor_version
+        FROM sensor_data
+        WHERE plant_id = %s AND id > %s
+        ORDER BY id
+        LIMIT %s
+    """, (plant_id, last_id, DETECTION_BATCH_SIZE))
+    return cursor.fetchall()
+
+# une transaction d'ingestion encore en cours lors d'une lecture peut être validée ensuite avec des id plus petits
+# que le point de reprise. les intervalles d'id sautés entre deux mesures lues (mesures d'autres plantes,
+# transactions en cours ou annulées) sont gardés LATE_COMMIT_GRACE secondes, au plus LATE_COMMIT_MAX_GAPS par
+# plante (les plus anciens sont abandonnés au-delà), et relus une fois par passage.
+# ils ne sont pas sauvegardés : une mesure validée tardivement pendant un redémarrage n'est pas relue.
+
+def record_gaps(plant_id: int, previous_id: int, readings: List[Tuple]):
+    gaps = plant_gaps.setdefault(plant_id, deque())
+    deadline = time.monotonic() + LATE_COMMIT_GRACE
+    for reading in readings:
+        if reading[0] > previous_id + 1:
+            gaps.append((deadline, previous_id + 1, reading[0] - 1))
+        previous_id = reading[0]
+    while len(gaps) > LATE_COMMIT_MAX_GAPS:
+        gaps.popleft()
+
+# intervalles encore à relire : (premiers id, derniers id)
+
+def pending_gaps(plant_id: int):
+    gaps = plant_gaps.get(plant_id, ())
+    now = time.monotonic()
+    while gaps and gaps[0][0] < now:
+        gaps.popleft()
+    return [gap[1] for gap in gaps], [gap[2] for gap in gaps]
+
+# retire des intervalles les id des mesures relues (un intervalle peut être coupé en deux)
+
+def fill_gaps(plant_id: int, reading_ids: List[int]):
+    found = sorted(reading_ids)
+    remaining = deque()
+    for deadline, first, last in plant_gaps.get(plant_id, ()):
+        start = first
+        for reading_id in found[bisect_left(found, first):bisect_right(found, last)]:
+            if reading_id > start:
+                remaining.append((deadline, start, reading_id - 1))
+            start = reading_id + 1
+        if start <= last:
+            remaining.append((deadline, start, last))
+    plant_gaps[plant_id] = remaining
+
+# mesures d'une plante validées depuis dans les intervalles sautés, dans l'ordre d'insertion
+
+def fetch_late_readings(cursor, plant_id: int, firsts: List[int], lasts: List[int]) -> List[Tuple]:
+    if not firsts:
+        return []
     cursor.execute("""
-        SELECT s1.sensor_id, s1.timestamp, s1.temperature, s2.temperature, 
-               s1.humidity, s2.humidity
-        FROM sensor_data s1
-        JOIN sensor_data s2 
-        ON s1.plant_id = s2.plant_id 
-        AND s1.timestamp = s2.timestamp 
-        WHERE s1.plant_id = %s
-        AND s1.sensor_id != s2.sensor_id
-        AND (
-            ABS(s1.temperature - s2.temperature) > 2.0 OR 
-            ABS(s1.humidity - s2.humidity) > 5.0
+        SELECT s.id, s.sensor_id, s.timestamp, s.temperature, s.humidity, s.sensor_version
+        FROM unnest(%s::bigint[], %s::bigint[]) AS g(first_id, last_id)
+        JOIN sensor_data s ON s.plant_id = %s AND s.id BETWEEN g.first_id AND g.last_id
+        ORDER BY s.id
+    """, (firsts, lasts, plant_id))
+    return cursor.fetchall()
+
+# après un redémarrage, recharge la fenêtre de comparaison entre capteurs avec les mesures déjà traitées
+
+def load_window(cursor, plant_id: int, last_id: int):
+    cursor.execute("""
+        SELECT id, sensor_id, timestamp, temperature, humidity, sensor_version
+        FROM sensor_data
+        WHERE plant_id = %s AND id <= %s AND timestamp > NOW() - %s
+        ORDER BY id
+    """, (plant_id, last_id, CROSS_SENSOR_WINDOW))
+    plant_windows[plant_id] = deque(cursor.fetchall())
+
+# compare chaque nouvelle mesure à la mesure la plus proche dans le temps de chacun des autres capteurs de la
+# plante (jointure "as-of" à CROSS_SENSOR_TOLERANCE près), sur la fenêtre glissante gardée en mémoire.
+# le calcul est vectorisé par capteur : tri des horodatages puis recherche dichotomique (searchsorted).
+# chaque paire n'est signalée qu'une fois. retourne la liste (mesure, autre mesure de la paire, messages).
+
+def detect_cross_sensor_anomalies(plant_id: int, readings: List[Tuple]) -> List[Tuple]:
+    """Détecte les anomalies entre capteurs sur la même plante"""
+    window = plant_windows.setdefault(plant_id, deque())
+    rows = list(window) + list(readings)
+    window.extend(readings)
+    # éviction des mesures sorties de la fenêtre (par rapport à la plus récente vue)
+    if window:
+        newest = max(reading[2] for reading in window)
+        while window and window[0][2] < newest - CROSS_SENSOR_WINDOW:
+            window.popleft()
+    if len(rows) < 2 or not readings:
+        return []
+
+    sensors = np.array([row[1] for row in rows], dtype=object)
+    seconds = np.array([row[2].timestamp() for row in rows])
+    temperatures = np.array([row[3] for row in rows], dtype=float)
+    humidities = np.array([row[4] for row in rows], dtype=float)
+    new = np.arange(len(rows) - len(readings), len(rows))
+    tolerance = CROSS_SENSOR_TOLERANCE.total_seconds()
+
+    pairs = set()
+    for sensor in sorted(set(sensors)):
+        candidates = new[sensors[new] != sensor]
+        if not candidates.size:
+            continue
+        own = np.flatnonzero(sensors == sensor)
+        own = own[np.argsort(seconds[own], kind="stable")]
+        own_seconds = seconds[own]
+        # plus proche voisin : l'élément à gauche ou à droite du point d'insertion
+        right = np.clip(np.searchsorted(own_seconds, seconds[candidates]), 0, len(own) - 1)
+        left = np.clip(right - 1, 0, len(own) - 1)
+        nearest = np.where(
+            np.abs(own_seconds[left] - seconds[candidates]) <= np.abs(own_seconds[right] - seconds[candidates]),
+            left, right
         )
-    """, (plant_id,))
-    
-    for row in cursor.fetchall():
-        sensor1, ts, temp1, temp2, hum1, hum2 = row
+        partners = own[nearest]
+        hits = (np.abs(seconds[partners] - seconds[candidates]) <= tolerance) & (
+            (np.abs(temperatures[candidates] - temperatures[partners]) > MAX_TEMP_DIFF) |
+            (np.abs(humidities[candidates] - humidities[partners]) > MAX_HUM_DIFF)
+        )
+        for candidate, partner in zip(candidates[hits], partners[hits]):
+            pairs.add((min(candidate, partner), max(candidate, partner)))
+
+    issues = []
+    for candidate, partner in sorted(pairs):
+        _, sensor1, ts, temp1, hum1 = rows[candidate][:5]
+        _, sensor2, _, temp2, hum2 = rows[partner][:5]
         anomalies = []
-        if abs(temp1 - temp2) > 2.0:
+        if abs(temp1 - temp2) > MAX_TEMP_DIFF:
             anomalies.append(f"Écart température anormal ({temp1}°C vs {temp2}°C)")
-        if abs(hum1 - hum2) > 5.0:
+        if abs(hum1 - hum2) > MAX_HUM_DIFF:
             anomalies.append(f"Écart humidité anormal ({hum1}% vs {hum2}%)")
-        
+        issues.append((rows[candidate], rows[partner], anomalies))
         logging.warning(
-            f"[{ts.isoformat()}] PLANTE {plant_id} - Capteurs {sensor1} : {', '.join(anomalies)}"
+            "[%s] PLANTE %s - Capteurs %s / %s : %s",
+            ts.isoformat(), plant_id, sensor1, sensor2, ", ".join(anomalies)
         )
+    return issues
+
+# indicateurs que le détecteur peut positionner sur sensor_data
+MARK_COLUMNS = ("anomaly", "cross_sensor_issue")
+
+# positionne un indicateur sur un ensemble de mesures en une seule requête, et ajoute les bits de raison donnés
+# au code de la mesure (sensor_data.reason) : les clés (id, timestamp, raison) sont passées en tableaux (unnest),
+# les bornes de timestamp limitent la mise à jour aux partitions concernées, et les mesures déjà marquées avec
+# ces raisons sont ignorées. retourne le nombre de lignes modifiées.
 
-# récupère les mesures des capteurs enregistrées durant les 2 dernières minutes, vérifie si la temp et l'hum est en dehors des limites critiques, en cas d'anomalie logge un message d'avertissement et met à jour pour marquer la donnée comme anormale.
+def mark_readings(cursor, column: str, keys) -> int:
+    if column not in MARK_COLUMNS:
+        raise ValueError(f"Indicateur inconnu : {column}")
+    merged = {}
+    for reading_id, ts, reason in keys:
+        merged[(reading_id, ts)] = merged.get((reading_id, ts), 0) | int(reason)
+    if not merged:
+        return 0
+    keys = sorted(merged)
+    ids = [key[0] for key in keys]
+    timestamps = [key[1] for key in keys]
+    reasons = [merged[key] for key in keys]
+    cursor.execute(f"""
+        UPDATE sensor_data AS s
+        SET {column} = TRUE, reason = s.reason | v.reason
+        FROM unnest(%s::integer[], %s::timestamptz[], %s::integer[]) AS v (id, timestamp, reason)
+        WHERE s.id = v.id AND s.timestamp = v.timestamp
+        AND s.timestamp BETWEEN %s AND %s
+        AND (NOT s.{column} OR (s.reason & v.reason) <> v.reason)
+    """, (ids, timestamps, reasons, min(timestamps), max(timestamps)))
+    return cursor.rowcount
 
-def detect_environment_anomalies(cursor):
+# marque cross_sensor_issue sur les deux mesures de chaque paire en écart
+
+def mark_cross_sensor_issues(cursor, issues: List[Tuple]) -> int:
+    return mark_readings(
+        cursor, "cross_sensor_issue",
+        ((row[0], row[2], CROSS_SENSOR) for reading, other, _ in issues for row in (reading, other))
+    )
+
+# raisons relevant d'une anomalie environnementale (marquée en base) et d'une dérive (signalée seulement)
+ENVIRONMENT_REASONS = TEMP_HIGH | TEMP_LOW | HUM_HIGH | HUM_LOW | TEMP_RATE | HUM_RATE
+DRIFT_REASONS = TEMP_DRIFT | HUM_DRIFT
+
+# évalue les nouvelles mesures d'une plante avec les règles communes, en une passe vectorisée : seuils par
+# version de capteur, vitesse de variation (par rapport aux mesures précédentes de la fenêtre) et écart à la
+# référence glissante de chaque capteur, prise juste avant la mesure. met à jour les statistiques de dérive.
+# à appeler avant detect_cross_sensor_anomalies, qui ajoute le lot à la fenêtre. retourne un code de raison par mesure.
+
+def evaluate_readings(plant_id: int, readings: List[Tuple]) -> np.ndarray:
+    engine = plant_stats[plant_id]
+    baselines = np.array(
+        [engine.observe(row[1], plant_id, row[2], row[3], row[4]) for row in readings], dtype=float
+    ).reshape(-1, 4)
+    rows = list(plant_windows.get(plant_id, ())) + list(readings)
+    new = slice(len(rows) - len(readings), len(rows))
+    temperatures = np.array([row[3] for row in rows], dtype=float)
+    humidities = np.array([row[4] for row in rows], dtype=float)
+    _, reasons = rules.evaluate(
+        temperatures, humidities,
+        plant_ids=np.full(len(rows), plant_id),
+        sensor_versions=[row[5] for row in rows],
+        sensor_ids=[row[1] for row in rows],
+        timestamps=[row[2] for row in rows],
+    )
+    # référence de dérive des seules nouvelles mesures
+    _, drift = rules.evaluate(
+        temperatures[new], humidities[new],
+        plant_ids=np.full(len(readings), plant_id),
+        sensor_versions=[row[5] for row in readings],
+        temp_mean=baselines[:, 0], temp_std=baselines[:, 1],
+        hum_mean=baselines[:, 2], hum_std=baselines[:, 3],
+    )
+    return (reasons[new] & ENVIRONMENT_REASONS) | (drift & DRIFT_REASONS)
+
+# logge les mesures hors des limites critiques ou qui varient trop vite, puis les marque anormales en une requête.
+
+def detect_environment_anomalies(cursor, plant_id: int, readings: List[Tuple], reasons: np.ndarray) -> int:
     """Détecte les anomalies environnementales"""
-    cursor.execute("""
-        SELECT plant_id, sensor_id, timestamp, temperature, humidity
-        FROM sensor_data
-        WHERE timestamp > NOW() - INTERVAL '2 minutes'
-    """)
-    
-    for plant_id, sensor_id, ts, temp, hum in cursor.fetchall():
-        anomalies = []
-        if temp > 35.0 or temp < 10.0:
-            anomalies.append(f"Température critique ({temp}°C)")
-        if hum > 85.0 or hum < 25.0:
-            anomalies.append(f"Humidité critique ({hum}%)")
-        
-        if anomalies:
-            logging.warning(
-                f"[{ts.isoformat()}] PLANTE {plant_id} - Capteur {sensor_id} : {', '.join(anomalies)}"
-            )
-            # Marquer l'anomalie dans la BDD
-            cursor.execute("""
-                UPDATE sensor_data
-                SET anomaly = TRUE
-                WHERE plant_id = %s AND sensor_id = %s AND timestamp = %s
-            """, (plant_id, sensor_id, ts))
+    flagged = []
+    for index in np.flatnonzero(reasons & ENVIRONMENT_REASONS):
+        reading_id, sensor_id, ts, temp, hum = readings[index][:5]
+        anomalies = describe(reasons[index] & ENVIRONMENT_REASONS, temp, hum)
+        logging.warning(
+            f"[{ts.isoformat()}] PLANTE {plant_id} - Capteur {sensor_id} : {', '.join(anomalies)}"
+        )
+        flagged.append((reading_id, ts, reasons[index] & ENVIRONMENT_REASONS))
+
+    # Marquer les anomalies dans la BDD
+    return mark_readings(cursor, "anomaly", flagged)
 
-# 
+# recharge l'état des statistiques de dérive des capteurs d'une plante, sauvegardé au dernier lot validé
 
-def detect_gradual_drift(cursor):
-    """Détecte les dérives progressives sur les 30 dernières minutes"""
+def load_sensor_stats(cursor, plant_id: int):
     cursor.execute("""
-        WITH sensor_stats AS (
-            SELECT sensor_id,
-                   AVG(temperature) as avg_temp,
-                   STDDEV(temperature) as std_temp,
-                   AVG(humidity) as avg_hum,
-                   STDDEV(humidity) as std_hum
-            FROM sensor_data
-            WHERE timestamp > NOW() - INTERVAL '30 minutes'
-            GROUP BY sensor_id
-        )
-        SELECT s.plant_id, s.sensor_id, s.timestamp, s.temperature, s.humidity
-        FROM sensor_data s
-        JOIN sensor_stats st ON s.sensor_id = st.sensor_id
-        WHERE s.timestamp > NOW() - INTERVAL '5 minutes'
-        AND (
-            ABS(s.temperature - st.avg_temp) > 3 * st.std_temp OR
-            ABS(s.humidity - st.avg_hum) > 3 * st.std_hum
-        )
-    """)
-    
-    for plant_id, sensor_id, ts, temp, hum in cursor.fetchall():
+        SELECT sensor_id, plant_id, last_timestamp, weight,
+               temperature_mean, temperature_var, humidity_mean, humidity_var
+        FROM sensor_stats
+        WHERE plant_id = %s
+    """, (plant_id,))
+    engine = plant_stats[plant_id] = StreamingStats(DRIFT_HALF_LIFE, DRIFT_MIN_WEIGHT)
+    engine.load(cursor.fetchall())
+
+# sauvegarde les statistiques des capteurs modifiés ; appelé dans la transaction du point de reprise
+
+def save_sensor_stats(cursor, plant_id: int):
+    rows = plant_stats[plant_id].pop_dirty()
+    if not rows:
+        return
+    execute_values(cursor, """
+        INSERT INTO sensor_stats (sensor_id, plant_id, last_timestamp, weight,
+                                  temperature_mean, temperature_var, humidity_mean, humidity_var)
+        VALUES %s
+        ON CONFLICT (plant_id, sensor_id) DO UPDATE
+        SET last_timestamp = EXCLUDED.last_timestamp,
+            weight = EXCLUDED.weight,
+            temperature_mean = EXCLUDED.temperature_mean,
+            temperature_var = EXCLUDED.temperature_var,
+            humidity_mean = EXCLUDED.humidity_mean,
+            humidity_var = EXCLUDED.humidity_var,
+            updated_at = NOW()
+    """, rows, page_size=len(rows))
+
+# signale les mesures qui s'écartent de la référence glissante de leur capteur de plus du zscore des règles.
+# retourne la liste (capteur, horodatage, libellés).
+
+def detect_gradual_drift(plant_id: int, readings: List[Tuple], reasons: np.ndarray) -> List[Tuple]:
+    """Détecte les dérives progressives au fil des mesures"""
+    drifts = []
+    for index in np.flatnonzero(reasons & DRIFT_REASONS):
+        _, sensor_id, ts, temp, hum = readings[index][:5]
+        drifts.append((sensor_id, ts, describe(reasons[index] & DRIFT_REASONS)))
         logging.warning(
             f"[{ts.isoformat()}] PLANTE {plant_id} - Capteur {sensor_id} : Dérive détectée "
             f"(Temp: {temp}°C, Hum: {hum}%)"
         )
+    return drifts
+
+# analyse un lot de mesures : limites, vitesses de variation, écarts entre capteurs et dérive
+
+def analyse_readings(cursor, plant_id: int, readings: List[Tuple]):
+    reasons = evaluate_readings(plant_id, readings)
+    detect_environment_anomalies(cursor, plant_id, readings, reasons)
+    mark_cross_sensor_issues(cursor, detect_cross_sensor_anomalies(plant_id, readings))
+    detect_gradual_drift(plant_id, readings, reasons)
+
+# relit d'abord les intervalles sautés, puis traite les nouvelles mesures d'une plante par lots de
+# DETECTION_BATCH_SIZE ; chaque lot est validé avec son point de reprise, un arrêt en cours de route reprend donc
+# au lot suivant. retourne le nombre de mesures traitées.
+
+def detect_plant_anomalies(conn, plant_id: int, last_id) -> int:
+    """Détection incrémentale des anomalies d'une plante"""
+    processed = 0
+    with conn.cursor() as cursor:
+        if last_id is None:
+            last_id = initial_watermark(cursor, plant_id)
+        if plant_id not in plant_windows:
+            load_window(cursor, plant_id, last_id)
+            load_sensor_stats(cursor, plant_id)
+
+        late = fetch_late_readings(cursor, plant_id, *pending_gaps(plant_id))
+        if late:
+            logging.info("Plante %s : %d mesures validées après le point de reprise relues", plant_id, len(late))
+            analyse_readings(cursor, plant_id, late)
+            save_sensor_stats(cursor, plant_id)
+            conn.commit()
+            fill_gaps(plant_id, [reading[0] for reading in late])
+            processed += len(late)
+
+        while True:
+            readings = fetch_new_readings(cursor, plant_id, last_id)
+            if not readings:
+                break
+            analyse_readings(cursor, plant_id, readings)
+            previous_id, last_id = last_id, readings[-1][0]
+            save_watermark(cursor, plant_id, last_id, max(reading[2] for reading in readings))
+            save_sensor_stats(cursor, plant_id)
+            conn.commit()
+            record_gaps(plant_id, previous_id, readings)
+            latency_stats.record(pending_inserts.settle(plant_id, last_id))
+            processed += len(readings)
+            if len(readings) < DETECTION_BATCH_SIZE:
+                break
+    return processed
+
+# connexion propre au thread courant, ouverte à la première utilisation et réutilisée d'un passage à l'autre
+
+def thread_connection():
+    conn = getattr(thread_state, "conn", None)
+    if conn is None or conn.closed:
+        conn = thread_state.conn = get_db_connection()
+    return conn
+
+def drop_thread_connection():
+    conn = getattr(thread_state, "conn", None)
+    thread_state.conn = None
+    if conn is not None and not conn.closed:
+        conn.close()
+
+# oublie l'état en mémoire de plantes (lot non validé, ou plante passée à un autre réplica) :
+# il sera rechargé depuis la base au prochain traitement
+
+def forget_plants(plant_ids):
+    for plant_id in plant_ids:
+        plant_windows.pop(plant_id, None)
+        plant_stats.pop(plant_id, None)
+        plant_gaps.pop(plant_id, None)
+
+# signale le réplica comme vivant, attribue les plantes du registre aux réplicas vivants par hachage cohérent,
+# puis prend (ou renouvelle) un bail sur les plantes qui lui reviennent et rend les autres.
+# un bail détenu par un autre réplica n'est repris qu'après expiration. retourne les plantes à traiter.
+
+def acquire_plants(cursor) -> List[int]:
+    cursor.execute("""
+        INSERT INTO detector_replicas (replica_id, heartbeat_at) VALUES (%s, NOW())
+        ON CONFLICT (replica_id) DO UPDATE SET heartbeat_at = EXCLUDED.heartbeat_at
+    """, (REPLICA_ID,))
+    cursor.execute("DELETE FROM detector_replicas WHERE heartbeat_at < NOW() - 10 * %s", (REPLICA_TTL,))
+    cursor.execute("SELECT replica_id FROM detector_replicas WHERE heartbeat_at > NOW() - %s", (REPLICA_TTL,))
+    ring = HashRing([replica_id for (replica_id,) in cursor.fetchall()])
+
+    cursor.execute("SELECT DISTINCT plant_id FROM sensors")
+    assigned = [plant_id for (plant_id,) in cursor.fetchall() if ring.owner(plant_id) == REPLICA_ID]
+
+    cursor.execute("""
+        DELETE FROM detector_leases WHERE owner = %s AND NOT (plant_id = ANY(%s))
+    """, (REPLICA_ID, assigned))
+    cursor.execute("""
+        INSERT INTO detector_leases (plant_id, owner, expires_at)
+        SELECT plant_id, %s, NOW() + %s FROM unnest(%s::integer[]) AS plant_id
+        ON CONFLICT (plant_id) DO UPDATE
+        SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at
+        WHERE detector_leases.owner = EXCLUDED.owner OR detector_leases.expires_at < NOW()
+        RETURNING plant_id
+    """, (REPLICA_ID, LEASE_TTL, assigned))
+    return sorted(plant_id for (plant_id,) in cursor.fetchall())
+
+# traitement d'une plante dans un thread du pool, avec la connexion du thread
+
+def detect_plant_task(plant_id: int, last_id) -> int:
+    try:
+        return detect_plant_anomalies(thread_connection(), plant_id, last_id)
+    except Exception:
+        forget_plants([plant_id])
+        drop_thread_connection()
+        raise
 
-# établit une connexion à la BDD
+# analyse les mesures arrivées depuis le dernier passage : les plantes détenues par ce réplica sont réparties
+# entre DETECTION_WORKERS threads ; l'échec d'une plante n'interrompt pas les autres.
+# sans plant_ids (passage complet), les baux sont renouvelés et toutes les plantes détenues sont analysées ;
+# avec plant_ids (notification d'insertion), seules ces plantes, parmi celles détenues au dernier passage complet.
 
-def detect_anomalies():
+def detect_anomalies(plant_ids=None):
     """Détection complète des anomalies"""
     try:
-        conn = get_db_connection()
-        with conn:
-            with conn.cursor() as cursor:
-                # Détection multi-capteurs
-                cursor.execute("SELECT DISTINCT plant_id FROM sensor_data")
-                for (plant_id,) in cursor.fetchall():
-                    detect_cross_sensor_anomalies(cursor, plant_id)
-                
-                # Détection environnementale
-                detect_environment_anomalies(cursor)
-                
-                # Détection dérive progressive
-                detect_gradual_drift(cursor)
-                
-        logging.info("Vérification des anomalies terminée")
-        
+        conn = thread_connection()
+        with conn.cursor() as cursor:
+            if plant_ids is None:
+                plants = acquire_plants(cursor)
+                owned_plants.clear()
+                owned_plants.update(plants)
+            else:
+                plants = sorted(owned_plants.intersection(plant_ids))
+            watermarks = load_watermarks(cursor, plants)
+        conn.commit()
     except Exception as e:
+        drop_thread_connection()
         logging.error("Erreur lors de la détection: %s", str(e), exc_info=True)
         raise
 
-# lance une boucle infinie, et vérifie en continu réussit pour l'hôte de la base.
+    if plant_ids is None:
+        forget_plants(set(plant_windows) - owned_plants)
+        pending_inserts.retain(owned_plants)
+    futures = {
+        executor.submit(detect_plant_task, plant_id, watermarks.get(plant_id)): plant_id
+        for plant_id in plants
+    }
+    processed = failed = 0
+    for future in as_completed(futures):
+        try:
+            processed += future.result()
+        except Exception as e:
+            failed += 1
+            logging.error("Erreur lors de la détection (plante %s): %s", futures[future], str(e), exc_info=True)
+
+    logging.log(logging.INFO if plant_ids is None else logging.DEBUG,
+                "Vérification des anomalies terminée (%d nouvelles mesures, %d plantes, %d en échec)",
+                processed, len(plants), failed)
+
+# connexion dédiée à l'écoute des notifications d'insertion (autocommit, sans transaction ouverte)
+
+def open_listener():
+    conn = get_db_connection()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+    logging.info("Écoute des notifications d'insertion (%s)", NOTIFY_CHANNEL)
+    return conn
+
+# attend au plus timeout secondes une notification, puis regroupe celles qui arrivent pendant NOTIFY_DEBOUNCE.
+# retourne les plantes concernées détenues par ce réplica.
+
+def wait_for_inserts(listener, timeout: float) -> set:
+    plants = set()
+    if not select.select([listener], [], [], max(timeout, 0))[0]:
+        return plants
+    deadline = time.monotonic() + NOTIFY_DEBOUNCE
+    while True:
+        listener.poll()
+        while listener.notifies:
+            notification = listener.notifies.pop(0)
+            try:
+                plant_id, max_id, inserted_at = parse_notification(notification.payload)
+            except (ValueError, KeyError, TypeError):
+                logging.warning("Notification invalide ignorée : %s", notification.payload)
+                continue
+            latency_stats.record_notification()
+            if plant_id in owned_plants:
+                pending_inserts.add(plant_id, max_id, inserted_at)
+                plants.add(plant_id)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([listener], [], [], remaining)[0]:
+            return plants
+
+# crée à l'avance les partitions des prochains jours et supprime (ou archive) celles qui dépassent la rétention,
+# puis purge les agrégats par minute (mesures et compteurs d'anomalies) trop anciens. si un autre réplica fait déjà la maintenance (verrou pris),
+# ce passage est sauté.
+
+def maintain_partitions():
+    """Maintenance des partitions de sensor_data"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (PARTITION_MAINTENANCE_LOCK,))
+                if not cursor.fetchone()[0]:
+                    logging.info("Maintenance des partitions en cours sur un autre réplica, passage ignoré")
+                    return
+                cursor.execute("SELECT create_sensor_data_partitions(%s)", (PARTITION_DAYS_AHEAD,))
+                created = cursor.fetchone()[0]
+                removed = 0
+                if RETENTION_DAYS > 0:
+                    cursor.execute(
+                        "SELECT drop_sensor_data_partitions(make_interval(days => %s), %s)",
+                        (RETENTION_DAYS, ARCHIVE_PARTITIONS)
+                    )
+                    removed = cursor.fetchone()[0]
+                if ROLLUP_1M_RETENTION_DAYS > 0:
+                    for table in ("sensor_data_1m", "sensor_anomalies_1m"):
+                        cursor.execute(
+                            f"DELETE FROM {table} WHERE bucket < NOW() - make_interval(days => %s)",
+                            (ROLLUP_1M_RETENTION_DAYS,)
+                        )
+    finally:
+        conn.close()
+    logging.info("Maintenance des partitions : %d créées, %d %s", created, removed,
+                 "archivées" if ARCHIVE_PARTITIONS else "supprimées")
+
+# lance une boucle infinie : passage complet toutes les DETECTION_POLL_INTERVAL secondes (renouvellement des
+# baux, rattrapage des notifications perdues) et, entre deux, analyse des plantes dès qu'une insertion est notifiée.
+# sans notifications (DETECTION_LISTEN=0), seuls les passages complets ont lieu.
 def main_loop():
     """Boucle principale avec gestion robuste des erreurs"""
+    last_maintenance = 0.0
+    last_full = 0.0
+    last_report = time.monotonic()
+    listener = None
     while True:
         try:
-            if wait_for_dns_resolution():
-                detect_anomalies()
-                time.sleep(10)
-            else:
+            if listener is None and not wait_for_dns_resolution():
                 logging.critical("Échec critique de résolution DNS après 10 tentatives")
                 break
+            if DETECTION_LISTEN and listener is None:
+                listener = open_listener()
+            if time.monotonic() - last_maintenance >= PARTITION_MAINTENANCE_INTERVAL:
+                maintain_partitions()
+                last_maintenance = time.monotonic()
+
+            if time.monotonic() - last_full >= DETECTION_POLL_INTERVAL:
+                detect_anomalies()
+                last_full = time.monotonic()
+            else:
+                timeout = min(DETECTION_POLL_INTERVAL - (time.monotonic() - last_full),
+                              LATENCY_REPORT_INTERVAL - (time.monotonic() - last_report))
+                if listener is None:
+                    time.sleep(max(timeout, 0))
+                else:
+                    plants = wait_for_inserts(listener, timeout)
+                    if plants:
+                        detect_anomalies(plants)
+
+            if time.monotonic() - last_report >= LATENCY_REPORT_INTERVAL:
+                latency_stats.report()
+                last_report = time.monotonic()
                 
         except Exception as e:
             logging.error("Erreur critique: %s", str(e), exc_info=True)
+            if listener is not None:
+                listener.close()
+                listener = None
             logging.info("Nouvelle tentative dans 30 secondes...")
             time.sleep(30)
 
@@ -0,0 +1,93 @@
+import json
+import logging
+import threading
+import time
+
+# notifications d'insertion émises par le trigger sensor_data_notify (database/functions.sql)
+NOTIFY_CHANNEL = "sensor_data_inserted"
+
+
+# décode une notification : (plant_id, max_id, inserted_at en secondes epoch)
+def parse_notification(payload):
+    data = json.loads(payload)
+    return int(data["plant_id"]), int(data["max_id"]), float(data["inserted_at"])
+
+
+# insertions notifiées mais pas encore couvertes par le point de reprise de leur plante ; sert à mesurer
+# la latence entre l'insertion d'une mesure et la validation de son analyse (marquage des anomalies compris).
+
+class PendingInserts:
+    def __init__(self, max_per_plant=1000):
+        self.max_per_plant = max_per_plant
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def add(self, plant_id, max_id, inserted_at):
+        with self._lock:
+            entries = self._pending.setdefault(plant_id, [])
+            if len(entries) < self.max_per_plant:
+                entries.append((max_id, inserted_at))
+
+    # retire les insertions couvertes par last_id et retourne leurs latences (secondes)
+    def settle(self, plant_id, last_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = self._pending.get(plant_id)
+            if not entries:
+                return []
+            done = [now - inserted_at for max_id, inserted_at in entries if max_id <= last_id]
+            remaining = [entry for entry in entries if entry[0] > last_id]
+            if remaining:
+                self._pending[plant_id] = remaining
+            else:
+                del self._pending[plant_id]
+        return done
+
+    # oublie les plantes qui ne sont plus traitées par ce réplica
+    def retain(self, plant_ids):
+        plant_ids = set(plant_ids)
+        with self._lock:
+            for plant_id in list(self._pending):
+                if plant_id not in plant_ids:
+                    del self._pending[plant_id]
+
+
+# latences insertion -> analyse, écrites périodiquement en une ligne JSON (comme les compteurs d'ingestion)
+
+class LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = []
+        self.notifications = 0
+
+    def record(self, latencies):
+        with self._lock:
+            self._samples.extend(latencies)
+
+    def record_notification(self):
+        with self._lock:
+            self.notifications += 1
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            samples = sorted(self._samples)
+            data = {"notifications": self.notifications, "analysed": len(samples)}
+            if reset:
+                self._samples = []
+                self.notifications = 0
+        if samples:
+            data["latency_ms"] = {
+                "p50": round(percentile(samples, 50) * 1000, 1),
+                "p95": round(percentile(samples, 95) * 1000, 1),
+                "max": round(samples[-1] * 1000, 1),
+            }
+        return data
+
+    def report(self):
+        data = self.snapshot(reset=True)
+        if data["notifications"] or data["analysed"]:
+            logging.info("detection_latency %s", json.dumps(data))
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,26 @@
+import bisect
+import hashlib
+
+# répartition des plantes entre les réplicas du détecteur par hachage cohérent : chaque réplica occupe
+# VNODES points d'un anneau, une plante appartient au premier point qui suit son propre hash.
+# l'ajout ou le retrait d'un réplica ne déplace que les plantes des points concernés (~1/N des plantes).
+
+VNODES = 64
+
+
+def ring_hash(key) -> int:
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes, vnodes=VNODES):
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in set(nodes) for i in range(vnodes))
+        self._hashes = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    # réplica propriétaire d'une clé (None si l'anneau est vide)
+    def owner(self, key):
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key)) % len(self._nodes)
+        return self._nodes[index]
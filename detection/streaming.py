@@ -0,0 +1,106 @@
+import math
+
+# statistiques glissantes par capteur pour la détection de dérive, mises à jour à chaque mesure en O(1).
+#
+# chaque variable (température, humidité) garde une moyenne et une variance à décroissance exponentielle
+# dans le temps : le poids d'une mesure est divisé par deux toutes les half_life secondes (horodatage capteur).
+# observe retourne la référence (moyenne, écart-type) calculée avant la mesure, une fois que le capteur a accumulé
+# au moins min_weight de poids ; l'écart toléré (zscore) est appliqué par les règles (shared/rules.py).
+
+VARIABLES = ("temperature", "humidity")
+
+
+class DecayingStats:
+    """Moyenne et variance pondérées, à décroissance exponentielle (algorithme incrémental de West)"""
+    __slots__ = ("weight", "mean", "m2")
+
+    def __init__(self, weight=0.0, mean=0.0, variance=0.0):
+        self.weight = weight
+        self.mean = mean
+        self.m2 = variance * weight
+
+    @property
+    def variance(self):
+        return self.m2 / self.weight if self.weight else 0.0
+
+    def update(self, value, decay):
+        self.weight = self.weight * decay + 1.0
+        self.m2 *= decay
+        delta = value - self.mean
+        self.mean += delta / self.weight
+        self.m2 += delta * (value - self.mean)
+
+
+class SensorStats:
+    __slots__ = ("plant_id", "last_timestamp", "temperature", "humidity")
+
+    def __init__(self, plant_id, last_timestamp=None, temperature=None, humidity=None):
+        self.plant_id = plant_id
+        self.last_timestamp = last_timestamp
+        self.temperature = temperature or DecayingStats()
+        self.humidity = humidity or DecayingStats()
+
+
+class StreamingStats:
+    def __init__(self, half_life, min_weight=10.0):
+        self.half_life = half_life
+        self.min_weight = min_weight
+        self.sensors = {}
+        self._dirty = set()
+
+    # facteur de décroissance entre deux mesures ; une mesure en retard (horodatage antérieur) ne décroît rien
+    def _decay(self, previous, ts):
+        if previous is None:
+            return 1.0
+        elapsed = (ts - previous).total_seconds()
+        return math.exp(-math.log(2) * elapsed / self.half_life) if elapsed > 0 else 1.0
+
+    # intègre une mesure ; retourne la référence de chaque variable juste avant la mesure :
+    # (moyenne température, écart-type température, moyenne humidité, écart-type humidité),
+    # NaN tant que le capteur n'a pas accumulé min_weight de poids
+    def observe(self, sensor_id, plant_id, ts, temperature, humidity):
+        sensor = self.sensors.get(sensor_id)
+        if sensor is None:
+            sensor = self.sensors[sensor_id] = SensorStats(plant_id)
+        decay = self._decay(sensor.last_timestamp, ts)
+
+        baseline = []
+        for name, value in zip(VARIABLES, (temperature, humidity)):
+            stats = getattr(sensor, name)
+            if stats.weight * decay >= self.min_weight:
+                baseline.extend((stats.mean, math.sqrt(stats.variance)))
+            else:
+                baseline.extend((math.nan, math.nan))
+            stats.update(value, decay)
+
+        if sensor.last_timestamp is None or ts > sensor.last_timestamp:
+            sensor.last_timestamp = ts
+        self._dirty.add(sensor_id)
+        return tuple(baseline)
+
+    # lignes à sauvegarder (capteurs modifiés depuis le dernier appel) :
+    # (sensor_id, plant_id, last_timestamp, poids, moyenne et variance de la température puis de l'humidité)
+    def pop_dirty(self):
+        rows = []
+        for sensor_id in sorted(self._dirty):
+            sensor = self.sensors[sensor_id]
+            rows.append((
+                sensor_id, sensor.plant_id, sensor.last_timestamp, sensor.temperature.weight,
+                sensor.temperature.mean, sensor.temperature.variance,
+                sensor.humidity.mean, sensor.humidity.variance,
+            ))
+        self._dirty.clear()
+        return rows
+
+    # recharge un état sauvegardé (même format que pop_dirty)
+    def load(self, rows):
+        for sensor_id, plant_id, last_timestamp, weight, temp_mean, temp_var, hum_mean, hum_var in rows:
+            self.sensors[sensor_id] = SensorStats(
+                plant_id, last_timestamp,
+                DecayingStats(weight, temp_mean, temp_var),
+                DecayingStats(weight, hum_mean, hum_var),
+            )
+
+    def reset(self):
+        self.sensors.clear()
+        self._dirty.clear()
@@ -1,5 +1,11 @@
+import contextlib
+from collections import deque
+
 import pytest
-from detector import detect_anomalies
+from datetime import datetime, timedelta, timezone
+
+import detector
+from detector import detect_anomalies, detect_cross_sensor_anomalies
 
 
 def test_detect_anomalies_normal():
@@ -12,3 +18,117 @@ def test_detect_anomalies_temp_error():
     data = {"temperature": 60, "humidity": 50}
     anomalies = detect_anomalies(data)
     assert "Temperature out of range" in anomalies
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def empty_windows():
+    detector.plant_windows.clear()
+    yield
+    detector.plant_windows.clear()
+
+
+def test_cross_sensor_pair_reported_once_across_batches():
+    first = [(1, "S-1", T0, 20.0, 50.0)]
+    second = [(2, "S-2", T0, 25.0, 50.0), (3, "S-2", T0 + timedelta(seconds=10), 25.0, 50.0)]
+    assert detect_cross_sensor_anomalies(1, first) == []
+    issues = detect_cross_sensor_anomalies(1, second)
+    assert [(reading[0], other[0]) for reading, other, _ in issues] == [(1, 2)]
+    # un lot suivant sans nouvelle paire ne signale plus rien
+    assert detect_cross_sensor_anomalies(1, [(4, "S-1", T0 + timedelta(seconds=20), 20.0, 50.0)]) == []
+
+
+def test_cross_sensor_window_evicts_old_readings():
+    detect_cross_sensor_anomalies(1, [(1, "S-1", T0, 20.0, 50.0)])
+    later = T0 + detector.CROSS_SENSOR_WINDOW + timedelta(seconds=1)
+    detect_cross_sensor_anomalies(1, [(2, "S-1", later, 20.0, 50.0)])
+    assert [reading[0] for reading in detector.plant_windows[1]] == [2]
+
+
+def test_cross_sensor_pairs_nearest_reading_within_tolerance():
+    readings = [
+        (1, "S-1", T0, 20.0, 50.0),
+        (2, "S-2", T0 + timedelta(seconds=3), 20.5, 60.0),   # écart d'humidité, 3 s plus tard
+        (3, "S-1", T0 + timedelta(seconds=12), 20.0, 50.0),
+        (4, "S-2", T0 + timedelta(seconds=30), 25.0, 50.0),  # aucun voisin à moins de 5 s
+    ]
+    issues = detect_cross_sensor_anomalies(1, readings)
+    # la paire (1, 2) n'est signalée qu'une fois, bien que chacune soit la plus proche de l'autre
+    assert [(reading[0], other[0]) for reading, other, _ in issues] == [(1, 2)]
+    assert issues[0][2] == ["Écart humidité anormal (50.0% vs 60.0%)"]
+
+
+def test_mark_readings_rejects_unknown_column():
+    with pytest.raises(ValueError):
+        detector.mark_readings(None, "temperature", [(1, T0)])
+
+
+def test_mark_readings_skips_empty_batch():
+    assert detector.mark_readings(None, "anomaly", []) == 0
+
+
+class RecordingCursor:
+    rowcount = 0
+
+    def execute(self, query, params):
+        self.query, self.params = query, params
+
+
+def test_mark_readings_merges_reasons_per_reading():
+    cursor = RecordingCursor()
+    detector.mark_readings(cursor, "anomaly", [(2, T0, 1), (1, T0, 16), (2, T0, 16)])
+    ids, timestamps, reasons = cursor.params[:3]
+    assert ids == [1, 2]
+    assert reasons == [16, 17]
+    assert "reason = s.reason | v.reason" in cursor.query
+
+
+class FakeConnection:
+    commits = 0
+
+    def cursor(self):
+        return contextlib.nullcontext(None)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_late_commit_rescan_stays_bounded_across_batches(monkeypatch):
+    monkeypatch.setattr(detector, "DETECTION_BATCH_SIZE", 5)
+    monkeypatch.setattr(detector, "LATE_COMMIT_MAX_GAPS", 8)
+    # mesures de la plante une sur deux : chaque lecture laisse un intervalle sauté par mesure
+    batches = [[(i, "S-1", T0) for i in range(start, start + 10, 2)] for start in range(100, 140, 10)]
+    batches.append([(141, "S-1", T0)])
+    scans, rescans = [], []
+
+    def fetch_new(cursor, plant_id, last_id):
+        scans.append(last_id)
+        return batches.pop(0) if batches else []
+
+    def fetch_late(cursor, plant_id, firsts, lasts):
+        rescans.append(len(firsts))
+        return [(103, "S-1", T0)] if firsts else []
+
+    monkeypatch.setattr(detector, "fetch_new_readings", fetch_new)
+    monkeypatch.setattr(detector, "fetch_late_readings", fetch_late)
+    for name in ("analyse_readings", "save_watermark", "save_sensor_stats"):
+        monkeypatch.setattr(detector, name, lambda *args: None)
+    detector.forget_plants([1])
+    detector.plant_windows[1] = deque()
+
+    assert detector.detect_plant_anomalies(FakeConnection(), 1, 99) == 21
+    # lecture ordonnée depuis le point de reprise, sans relire les lots précédents
+    assert scans == [99, 108, 118, 128, 138]
+    assert detector.detect_plant_anomalies(FakeConnection(), 1, 141) == 1
+    assert rescans == [0, detector.LATE_COMMIT_MAX_GAPS]
+    detector.forget_plants([1])
+
+
+def test_filled_gaps_are_split_around_late_readings():
+    detector.forget_plants([1])
+    detector.record_gaps(1, 10, [(15,), (16,), (20,)])
+    assert detector.pending_gaps(1) == ([11, 17], [14, 19])
+    detector.fill_gaps(1, [11, 13, 19])
+    assert detector.pending_gaps(1) == ([12, 14, 17], [12, 14, 18])
+    detector.forget_plants([1])
@@ -0,0 +1,37 @@
+import json
+
+from events import LatencyStats, PendingInserts, parse_notification
+
+
+def test_parse_notification():
+    payload = json.dumps({"plant_id": 3, "min_id": 10, "max_id": 12, "readings": 3, "inserted_at": 1700000000.5})
+    assert parse_notification(payload) == (3, 12, 1700000000.5)
+
+
+def test_settle_returns_latencies_of_covered_inserts_only():
+    pending = PendingInserts()
+    pending.add(1, 10, 100.0)
+    pending.add(1, 20, 101.0)
+    assert pending.settle(1, 15, now=100.5) == [0.5]
+    assert pending.settle(1, 15, now=102.0) == []
+    assert pending.settle(1, 20, now=102.0) == [1.0]
+    assert pending.settle(2, 100) == []
+
+
+def test_retain_forgets_plants_of_other_replicas():
+    pending = PendingInserts()
+    pending.add(1, 10, 100.0)
+    pending.add(2, 10, 100.0)
+    pending.retain({2})
+    assert pending.settle(1, 10, now=101.0) == []
+    assert pending.settle(2, 10, now=101.0) == [1.0]
+
+
+def test_latency_snapshot_resets():
+    stats = LatencyStats()
+    stats.record_notification()
+    stats.record([0.05, 0.1, 0.2])
+    snapshot = stats.snapshot(reset=True)
+    assert snapshot["notifications"] == 1
+    assert snapshot["latency_ms"]["max"] == 200.0
+    assert stats.snapshot() == {"notifications": 0, "analysed": 0}
@@ -0,0 +1,22 @@
+from collections import Counter
+
+from sharding import HashRing
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).owner(1) is None
+
+
+def test_plants_are_spread_across_replicas():
+    ring = HashRing(["A", "B", "C"])
+    counts = Counter(ring.owner(plant_id) for plant_id in range(3000))
+    assert set(counts) == {"A", "B", "C"}
+    assert min(counts.values()) > 600
+
+
+def test_adding_a_replica_only_moves_its_share():
+    before = HashRing(["A", "B", "C"])
+    after = HashRing(["A", "B", "C", "D"])
+    moved = [plant_id for plant_id in range(3000) if before.owner(plant_id) != after.owner(plant_id)]
+    assert all(after.owner(plant_id) == "D" for plant_id in moved)
+    assert len(moved) < 3000 / 2
@@ -0,0 +1,54 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from streaming import StreamingStats
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+# mesures de température successives ; retourne les indices hors de sigmas écarts-types de la référence
+def feed(engine, values, step=timedelta(seconds=10), sensor_id="S-1", sigmas=3.0):
+    flagged = []
+    for i, value in enumerate(values):
+        mean, std, _, _ = engine.observe(sensor_id, 1, T0 + i * step, value, 50.0)
+        if not math.isnan(mean) and abs(value - mean) > sigmas * std:
+            flagged.append(i)
+    return flagged
+
+
+def test_without_decay_matches_mean_and_variance():
+    values = np.random.default_rng(0).normal(25, 2, 500)
+    engine = StreamingStats(half_life=math.inf, min_weight=1e9)
+    feed(engine, values)
+    stats = engine.sensors["S-1"].temperature
+    assert abs(stats.mean - values.mean()) < 1e-9
+    assert abs(stats.variance - values.var()) < 1e-9
+
+
+def test_decay_forgets_old_readings():
+    engine = StreamingStats(half_life=60)
+    feed(engine, [10.0] * 100 + [30.0] * 100)
+    assert abs(engine.sensors["S-1"].temperature.mean - 30.0) < 0.01
+
+
+def test_flags_outlier_after_warm_up_only():
+    engine = StreamingStats(half_life=600, min_weight=10)
+    values = [24.5, 25.5] * 25
+    assert feed(engine, [40.0] + values[:5]) == []
+    engine.reset()
+    assert feed(engine, values + [40.0]) == [50]
+
+
+def test_snapshot_round_trip_resumes_same_state():
+    engine = StreamingStats(half_life=600)
+    feed(engine, [20.0, 21.0, 22.0, 21.5])
+    rows = engine.pop_dirty()
+    assert engine.pop_dirty() == []
+
+    restored = StreamingStats(half_life=600)
+    restored.load(rows)
+    for resumed in (engine, restored):
+        resumed.observe("S-1", 1, T0 + timedelta(seconds=60), 23.0, 55.0)
+    assert engine.pop_dirty() == restored.pop_dirty()
@@ -0,0 +1,97 @@
+# micro-benchmark : réponse de /data pour 100 000 mesures en JSON (une mesure par objet) et en colonnes
+# (msgpack, Arrow IPC si pyarrow est installé). mesure la taille, la sérialisation côté API à partir des lignes
+# SQL, et la lecture côté client jusqu'au DataFrame pandas utilisé par le dashboard.
+#
+# usage : python bench_columnar.py
+
+import json
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from columnar import ARROW_AVAILABLE, pack_arrow, pack_msgpack, to_columns, unpack_msgpack
+
+ROWS = 100_000
+REPEAT = 3
+START = datetime(2024, 4, 8, tzinfo=timezone.utc)
+# lignes de queries.data_query
+POSITIONS = {
+    "plant_id": 0, "sensor_id": 6, "id": 7, "timestamp": 3, "temperature": 1, "humidity": 2,
+    "anomaly": 4, "cross_sensor_issue": 5
+}
+META = {"resolution": "raw", "next_cursor": None, "last_id": ROWS}
+
+
+def sample_rows():
+    return [
+        (
+            1, round(random.normalvariate(25, 3), 2), round(random.normalvariate(60, 10), 2),
+            START + timedelta(seconds=5 * i), random.random() < 0.01, False, f"FR-00{i % 4}", i + 1
+        )
+        for i in range(ROWS)
+    ]
+
+
+# sérialisation JSON de main.fetch_data (hors surcoût de FastAPI)
+def json_body(rows):
+    results = [
+        {
+            "plant_id": row[0],
+            "temperature": float(row[1]),
+            "humidity": float(row[2]),
+            "timestamp": row[3].isoformat(),
+            "anomaly": bool(row[4]),
+            "cross_sensor_issue": bool(row[5]),
+            "sensor_id": row[6],
+            "id": row[7]
+        }
+        for row in rows
+    ]
+    return json.dumps(dict(META, results=results)).encode()
+
+
+def json_frame(body):
+    df = pd.DataFrame(json.loads(body)["results"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df
+
+
+def msgpack_frame(body):
+    meta, columns = unpack_msgpack(body)
+    df = pd.DataFrame(columns)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
+    return df
+
+
+def arrow_frame(body):
+    import pyarrow as pa
+    df = pa.ipc.open_stream(body).read_all().to_pandas()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms", utc=True)
+    return df
+
+
+def best(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def bench(label, serialize, parse, reference=None):
+    body = serialize()
+    serialize_time = best(serialize)
+    parse_time = best(lambda: parse(body))
+    ratio = f" (x{reference / (serialize_time + parse_time):.1f} vs JSON)" if reference else ""
+    print(f"{label:<8} taille {len(body) / 1e6:>6.2f} Mo | sérialisation {serialize_time * 1e3:>7.1f} ms | "
+          f"lecture {parse_time * 1e3:>7.1f} ms{ratio}")
+    return serialize_time + parse_time
+
+
+if __name__ == "__main__":
+    rows = sample_rows()
+    print(f"{ROWS} mesures")
+    reference = bench("JSON", lambda: json_body(rows), json_frame)
+    bench("msgpack", lambda: pack_msgpack(META, to_columns(rows, POSITIONS)), msgpack_frame, reference)
+    if ARROW_AVAILABLE:
+        bench("Arrow", lambda: pack_arrow(META, to_columns(rows, POSITIONS)), arrow_frame, reference)
+    else:
+        print("Arrow    ignoré (pyarrow non installé)")
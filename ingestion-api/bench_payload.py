@@ -0,0 +1,42 @@
+# micro-benchmark : taille sur le réseau et coût de décodage d'une mesure (et d'un lot de 1000 mesures)
+# en msgpack brut et en msgpack enveloppé dans du base64.
+#
+# usage : python bench_payload.py
+
+import base64
+import random
+import timeit
+from datetime import datetime, timezone
+
+import msgpack
+
+from parser import unpack_payload
+
+ROUNDS = 20000
+
+
+def sample_reading():
+    return {
+        "sensor_id": "FR-001",
+        "sensor_version": "FR-v8",
+        "plant_id": 1,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "temperature": round(random.normalvariate(25, 3), 2),
+        "humidity": round(random.normalvariate(60, 10), 2)
+    }
+
+
+def bench(label, payload, rounds):
+    raw = msgpack.packb(payload)
+    wrapped = base64.b64encode(raw)
+    raw_time = min(timeit.repeat(lambda: unpack_payload(raw, False), number=rounds, repeat=5)) / rounds
+    b64_time = min(timeit.repeat(lambda: unpack_payload(wrapped, True), number=rounds, repeat=5)) / rounds
+    print(f"{label}")
+    print(f"  taille  : brut {len(raw):>8} o | base64 {len(wrapped):>8} o (+{len(wrapped) / len(raw) - 1:.0%})")
+    print(f"  décodage: brut {raw_time * 1e6:>8.2f} µs | base64 {b64_time * 1e6:>8.2f} µs "
+          f"(x{b64_time / raw_time:.2f})")
+
+
+if __name__ == "__main__":
+    bench("Mesure unitaire", sample_reading(), ROUNDS)
+    bench("Lot de 1000 mesures", [sample_reading() for _ in range(1000)], ROUNDS // 1000)
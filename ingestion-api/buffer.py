@@ -0,0 +1,170 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import time
+from collections import deque
+
+import psycopg2
+
+from db import get_connection, run_db
+from registry import confirm_sensors, upsert_sensors
+
+# mode write-behind (désactivé par défaut) : les mesures validées sont mises en file en mémoire
+# puis écrites par lots avec COPY par une tâche de fond.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "50000"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "1000"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+WRITE_BEHIND_RETRY_AFTER = int(os.getenv("WRITE_BEHIND_RETRY_AFTER", "1"))
+# délai maximal accordé à la vidange de la file à l'arrêt
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", "30"))
+
+COPY_COLUMNS = ("sensor_id", "sensor_version", "plant_id", "temperature", "humidity", "timestamp", "anomaly", "reason")
+# lignes écrites, telles que diffusées sur /stream : l'id attribué en base, puis les colonnes de COPY_COLUMNS
+WRITTEN_COLUMNS = ("id",) + COPY_COLUMNS
+
+
+# écrit un lot de lignes dans "sensor_data" avec COPY ... FROM STDIN (CSV) en une seule transaction,
+# avec la mise à jour du registre des capteurs. COPY ne renvoie pas les id : ils sont réservés d'abord sur la
+# séquence de la table puis écrits avec les lignes. retourne les lignes écrites (voir WRITTEN_COLUMNS).
+
+def copy_readings(rows):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence('sensor_data', 'id')) FROM generate_series(1, %s)",
+                (len(rows),)
+            )
+            written = [(reading_id,) + tuple(row) for (reading_id,), row in zip(cursor.fetchall(), rows)]
+            data = io.StringIO()
+            csv.writer(data).writerows(written)
+            data.seek(0)
+            cursor.copy_expert(
+                "COPY sensor_data (%s) FROM STDIN WITH (FORMAT csv)" % ", ".join(WRITTEN_COLUMNS),
+                data
+            )
+            registered = upsert_sensors(cursor, rows)
+    confirm_sensors(registered)
+    return written
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_rows, batch_size, interval, flush_func=copy_readings, on_flush=None):
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.interval = interval
+        self.flush_func = flush_func
+        # appelé (dans la boucle d'événements) avec chaque lot écrit : les lignes retournées par flush_func
+        # (lignes avec leur id, voir copy_readings), ou les lignes de la file si elle ne retourne rien
+        self.on_flush = on_flush
+        self._rows = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self.queued = 0
+        self.flushed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failures = 0
+        self.invalid = 0
+
+    # ajoute des lignes à la file ; retourne False (rien n'est ajouté) si la file est pleine ou en cours de fermeture
+    def offer(self, rows):
+        if self._closing or len(self._rows) + len(rows) > self.max_rows:
+            self.rejected += len(rows)
+            return False
+        self._rows.extend(rows)
+        self.queued += len(rows)
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._rows:
+                if not await self._flush_once():
+                    break
+                if len(self._rows) < self.batch_size:
+                    break
+
+    # écrit au plus batch_size lignes. une erreur de données (psycopg2.DataError : ligne refusée par COPY) coupe le
+    # lot en deux moitiés réécrites séparément, jusqu'à isoler les lignes invalides, qui sont écartées (compteur
+    # "invalid") au lieu de bloquer la file. après tout autre échec (base indisponible), les lignes non écrites
+    # sont remises en tête de file.
+    async def _flush_once(self):
+        batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+        started = time.perf_counter()
+        # pile des morceaux à écrire, le prochain en dernier
+        chunks = [batch]
+        written = []
+        ok = True
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                result = await run_db(self.flush_func, chunk)
+            except psycopg2.DataError as e:
+                if len(chunk) == 1:
+                    self.invalid += 1
+                    logging.error("Mesure invalide écartée de la file write-behind : %s (%s)", chunk[0], str(e))
+                else:
+                    middle = len(chunk) // 2
+                    chunks.extend([chunk[middle:], chunk[:middle]])
+                continue
+            except Exception as e:
+                self.failures += 1
+                logging.error("Échec d'écriture d'un lot de %d mesures : %s", len(chunk), str(e))
+                remaining = chunk + [row for pending in reversed(chunks) for row in pending]
+                self._rows.extendleft(reversed(remaining))
+                ok = False
+                break
+            written.extend(chunk if result is None else result)
+        if written:
+            self.flushed += len(written)
+            self.flushes += 1
+            # les lignes sont écrites : un échec de diffusion ne doit pas arrêter l'écriture des suivantes
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(written)
+                except Exception:
+                    logging.exception("Échec de diffusion d'un lot de %d mesures écrites", len(written))
+            logging.debug("Lot de %d mesures écrit en %.1fms", len(written), (time.perf_counter() - started) * 1000)
+        return ok
+
+    # arrêt propre : refuse les nouvelles mesures et vide la file avant la fermeture du pool
+    async def drain(self, timeout=WRITE_BEHIND_DRAIN_TIMEOUT):
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        deadline = time.monotonic() + timeout
+        while self._rows and time.monotonic() < deadline:
+            if not await self._flush_once():
+                await asyncio.sleep(1)
+        if self._rows:
+            self.dropped += len(self._rows)
+            logging.error("%d mesures perdues à l'arrêt (file non vidée)", len(self._rows))
+            self._rows.clear()
+
+    def stats(self):
+        return {
+            "depth": len(self._rows),
+            "capacity": self.max_rows,
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "invalid": self.invalid,
+        }
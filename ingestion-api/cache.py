@@ -0,0 +1,44 @@
+import threading
+import time
+
+
+# cache en mémoire du processus avec durée de vie (TTL) par entrée.
+# les entrées peuvent être invalidées explicitement depuis n'importe quel thread.
+
+class TTLCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    # retourne la valeur en cache, ou la calcule avec "loader" (coroutine sans argument) et la met en cache
+    async def get_or_load(self, key, loader):
+        found, value = self.get(key)
+        if found:
+            return value
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,111 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import msgpack
+
+try:
+    import pyarrow as pa
+except ImportError:  # format Arrow indisponible sans pyarrow (dépendance facultative)
+    pa = None
+
+ARROW_AVAILABLE = pa is not None
+
+# réponses en colonnes des endpoints de lecture, choisies par l'en-tête Accept :
+#   - application/x-msgpack : {"columns": {nom: {"dtype": "<f8", "data": octets}}, "rows": n, ...} ; chaque colonne
+#     est le tampon brut d'un tableau NumPy (np.frombuffer côté client, sans objet Python par valeur).
+#     les chaînes (sensor_id) sont codées par dictionnaire : "dictionary" (valeurs distinctes) + codes int32.
+#   - application/vnd.apache.arrow.stream : flux Arrow IPC, les métadonnées de la réponse dans le schéma.
+# dans les deux cas les horodatages sont des entiers int64 en millisecondes depuis l'epoch (UTC).
+
+MSGPACK_TYPE = "application/x-msgpack"
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_TYPES = (MSGPACK_TYPE, ARROW_TYPE)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+# type de chaque colonne : "ms" (horodatage), "str" (codé par dictionnaire) ou un dtype NumPy
+COLUMN_TYPES = {
+    "plant_id": "<i4",
+    "id": "<i8",
+    "sensor_id": "str",
+    "timestamp": "ms",
+    "temperature": "<f8",
+    "humidity": "<f8",
+    "anomaly": "|b1",
+    "cross_sensor_issue": "|b1",
+    "readings": "<i4",
+    "anomaly_count": "<i4",
+    "temperature_min": "<f8",
+    "temperature_max": "<f8",
+    "humidity_min": "<f8",
+    "humidity_max": "<f8",
+}
+
+
+# type de réponse demandé par Accept : un des COLUMNAR_TYPES, ou None pour JSON
+def negotiate(accept):
+    for media_type in COLUMNAR_TYPES:
+        if media_type in (accept or ""):
+            return media_type
+    return None
+
+
+# lignes SQL -> {nom: tableau NumPy}, pour les colonnes données sous forme {nom: position dans la ligne}
+def to_columns(rows, positions):
+    columns = {}
+    for name, position in positions.items():
+        values = [row[position] for row in rows]
+        kind = COLUMN_TYPES[name]
+        if kind == "ms":
+            columns[name] = np.array([(value - EPOCH) // MILLISECOND for value in values], dtype="<i8")
+        elif kind == "str":
+            columns[name] = np.array(values, dtype=object)
+        else:
+            columns[name] = np.array(values, dtype=float if kind == "<f8" else None).astype(kind)
+    return columns
+
+
+def _encode_column(values):
+    if values.dtype == object:
+        dictionary, codes = np.unique(values.astype(str), return_inverse=True) if len(values) else ([], values)
+        return {"dtype": "<i4", "dictionary": [str(value) for value in dictionary],
+                "data": np.asarray(codes, dtype="<i4").tobytes()}
+    return {"dtype": values.dtype.str, "data": values.tobytes()}
+
+
+def pack_msgpack(meta, columns):
+    rows = len(next(iter(columns.values()))) if columns else 0
+    payload = dict(meta, rows=rows, columns={name: _encode_column(values) for name, values in columns.items()})
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def pack_arrow(meta, columns):
+    arrays = {}
+    for name, values in columns.items():
+        if values.dtype == object:
+            arrays[name] = pa.array(values.astype(str)).dictionary_encode()
+        else:
+            arrays[name] = pa.array(values)
+    # métadonnées Arrow : valeurs encodées en JSON
+    table = pa.table(arrays).replace_schema_metadata({key: json.dumps(value) for key, value in meta.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def pack(media_type, meta, columns):
+    return pack_arrow(meta, columns) if media_type == ARROW_TYPE else pack_msgpack(meta, columns)
+
+
+# décodage d'une réponse msgpack en colonnes (utilisé par les clients Python et les tests) : (méta, {nom: tableau})
+def unpack_msgpack(data):
+    payload = msgpack.unpackb(data, raw=False)
+    columns = {}
+    for name, column in payload.pop("columns").items():
+        values = np.frombuffer(column["data"], dtype=column["dtype"])
+        if "dictionary" in column:
+            values = np.asarray(column["dictionary"], dtype=object)[values]
+        columns[name] = values
+    return payload, columns
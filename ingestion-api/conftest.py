@@ -0,0 +1,6 @@
+# les tests s'exécutent depuis le dossier du service : rend importable le paquet shared/ de la racine du dépôt,
+# copié à côté du code dans l'image Docker.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,259 @@
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import anyio
+import psycopg2
+from psycopg2 import extensions
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/plant_monitoring")
+
+# taille du pool et délais, configurables par variables d'environnement
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# une connexion restée inactive plus longtemps que ce délai est vérifiée (SELECT 1) avant d'être prêtée
+DB_POOL_IDLE_CHECK = float(os.getenv("DB_POOL_IDLE_CHECK", "30"))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# pool de connexions partagé par tout le processus : les connexions sont ouvertes une fois et réutilisées
+# au lieu d'un psycopg2.connect (TCP + authentification) par requête.
+
+# connect : fonction d'ouverture d'une connexion (psycopg2.connect, remplacée dans les tests)
+
+class ConnectionPool:
+    def __init__(self, dsn, minconn, maxconn, connect=psycopg2.connect):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.connect = connect
+        self._idle = []  # pile de (connexion, instant de restitution)
+        self._size = 0
+        self._waiting = 0
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        try:
+            for _ in range(minconn):
+                self._idle.append((self._connect(), time.monotonic()))
+                self._size += 1
+        except Exception:
+            self.closeall()
+            raise
+
+    # ouverture hors verrou (lente) ; seul le compteur est mis à jour sous verrou
+    def _connect(self):
+        conn = self.connect(self.dsn)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self, timeout=DB_POOL_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("pool de connexions fermé")
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.maxconn:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            raise PoolTimeout("aucune connexion disponible après %.1fs" % timeout)
+                        if self._closed:
+                            raise PoolTimeout("pool de connexions fermé")
+                finally:
+                    self._waiting -= 1
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                else:
+                    conn, released_at = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            # vérification des connexions inactives depuis longtemps (coupure réseau, redémarrage de la base)
+            if conn.closed or (time.monotonic() - released_at > DB_POOL_IDLE_CHECK and not self._is_alive(conn)):
+                logging.warning("Connexion inactive invalide, remplacement")
+                self._discard(conn)
+                continue
+            return conn
+
+    def putconn(self, conn):
+        status = conn.info.transaction_status if not conn.closed else None
+        if status is None or status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            self._discard(conn)
+            return
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._size -= 1
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "created": self._created,
+                "min": self.minconn,
+                "max": self.maxconn,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# résout le nom d'hôte de la base jusqu'à 10 fois ; n'est appelé qu'une fois, à l'ouverture du pool.
+
+def wait_for_db():
+    host = urlparse(DATABASE_URL).hostname or "localhost"
+    for attempt in range(10):
+        try:
+            socket.gethostbyname(host)
+            logging.info("Résolution DNS réussie pour '%s'", host)
+            return True
+        except socket.gaierror:
+            wait_time = 5 * (attempt + 1)
+            logging.warning("DNS échec (tentative %d), retry dans %ds", attempt + 1, wait_time)
+            time.sleep(wait_time)
+    return False
+
+
+# ouvre le pool. au démarrage (retry=True), avec la même politique de réessais qu'avant ; si la base reste
+# injoignable, l'application démarre quand même et chaque requête suivante retente une ouverture, sans attente
+# (retry=False) : les endpoints répondent en erreur (/health : base non connectée) tant qu'elle est indisponible.
+
+def open_pool(retry=False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+        if retry and not wait_for_db():
+            raise Exception("Résolution DNS de la base échouée")
+        attempts = 5 if retry else 1
+        for attempt in range(attempts):
+            try:
+                _pool = ConnectionPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX)
+                logging.info("Pool DB ouvert (min=%d, max=%d)", DB_POOL_MIN, DB_POOL_MAX)
+                return _pool
+            except psycopg2.OperationalError as e:
+                if attempt + 1 == attempts:
+                    break
+                wait_time = 2 ** attempt
+                logging.warning("Échec DB (tentative %d), retry dans %ds...: %s", attempt + 1, wait_time, str(e))
+                time.sleep(wait_time)
+        raise Exception(f"Connexion à la base échouée après {attempts} tentative(s)")
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            logging.info("Pool DB fermé")
+            _pool = None
+
+
+# emprunte une connexion au pool le temps d'une transaction : commit si tout se passe bien, rollback sinon.
+
+@contextmanager
+def get_connection():
+    pool = _pool or open_pool()
+    conn = pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn)
+
+
+# connexion ouverte hors du pool pour les traitements longs (exports en flux) : un client lent ne prive pas
+# le pool des requêtes courtes ni de l'écriture write-behind. validée ou annulée puis fermée en sortie de bloc.
+
+@contextmanager
+def dedicated_connection():
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    if _pool is None:
+        return None
+    return _pool.stats()
+
+
+# exécute une fonction bloquante (requêtes psycopg2) dans un thread, hors de la boucle d'événements.
+# le nombre de threads simultanés est borné par la taille du pool : les requêtes en surnombre attendent
+# de façon asynchrone au lieu d'immobiliser un thread sur le pool.
+
+_db_limiter = None
+
+
+async def run_db(func, *args):
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(DB_POOL_MAX)
+    return await anyio.to_thread.run_sync(func, *args, limiter=_db_limiter)
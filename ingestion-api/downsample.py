@@ -0,0 +1,65 @@
+import numpy as np
+
+# réduction des séries pour l'affichage (/data?max_points=N) : Largest-Triangle-Three-Buckets.
+#
+# la série est découpée en max_points - 2 seaux entre le premier et le dernier point (toujours conservés) ;
+# dans chaque seau on garde le point qui forme le plus grand triangle avec le point retenu au seau précédent
+# et la moyenne du seau suivant, ce qui conserve les pics. température et humidité sont normalisées sur leur
+# étendue et leurs aires additionnées, pour choisir les mêmes instants pour les deux courbes.
+# si un seau contient des mesures marquées en anomalie, le point retenu est choisi parmi elles.
+
+
+def lttb(x, ys, max_points, keep=None):
+    """Indices (croissants) des points retenus, au plus max_points"""
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    if n <= max_points or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1][:max_points], dtype=int)
+
+    ys = [np.asarray(y, dtype=float) for y in ys]
+    ys = [(y - y.min()) / (np.ptp(y) or 1.0) for y in ys]
+    keep = None if keep is None else np.asarray(keep, dtype=bool)
+
+    every = (n - 2) / (max_points - 2)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        next_hi = min(int((i + 2) * every) + 1, n)
+        next_x = x[hi:next_hi].mean()
+
+        area = np.zeros(hi - lo)
+        for y in ys:
+            next_y = y[hi:next_hi].mean()
+            area += np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        if keep is not None and keep[lo:hi].any():
+            area = np.where(keep[lo:hi], area, -1.0)
+
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+# applique lttb à des lignes de résultat SQL, capteur par capteur (max_points par capteur).
+# sensor, timestamp, values et flag sont des positions de colonnes ; l'ordre des lignes est conservé.
+
+def downsample_rows(rows, max_points, sensor, timestamp, values, flag):
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(row[sensor], []).append(index)
+
+    kept = []
+    for indices in groups.values():
+        if len(indices) <= max_points:
+            kept.extend(indices)
+            continue
+        indices = sorted(indices, key=lambda i: rows[i][timestamp])
+        x = [rows[i][timestamp].timestamp() for i in indices]
+        ys = [[rows[i][column] for i in indices] for column in values]
+        keep = [bool(rows[i][flag]) for i in indices]
+        kept.extend(indices[j] for j in lttb(x, ys, max_points, keep))
+    return [rows[i] for i in sorted(kept)]
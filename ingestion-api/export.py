@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+
+import msgpack
+
+# encodage des paquets de lignes de /data/export. chaque encodeur reçoit une liste de mesures (dicts) et
+# first=True pour le premier paquet (en-tête CSV) et retourne des octets ; les paquets mis bout à bout forment
+# un document NDJSON (une mesure JSON par ligne), CSV, ou une suite d'objets MessagePack (msgpack.Unpacker).
+
+EXPORT_COLUMNS = ("plant_id", "sensor_id", "timestamp", "temperature", "humidity", "anomaly", "cross_sensor_issue")
+# lignes lues par aller-retour avec le curseur serveur, et donc par paquet envoyé
+EXPORT_CHUNK_ROWS = 5000
+
+
+# ligne de queries.export_query -> mesure exportée
+def export_record(row):
+    plant_id, sensor_id, timestamp, temperature, humidity, anomaly, cross_sensor_issue = row
+    return {
+        "plant_id": plant_id,
+        "sensor_id": sensor_id,
+        "timestamp": timestamp.isoformat(),
+        "temperature": float(temperature),
+        "humidity": float(humidity),
+        "anomaly": bool(anomaly),
+        "cross_sensor_issue": bool(cross_sensor_issue)
+    }
+
+
+def ndjson_chunk(records, first):
+    return "".join(json.dumps(record) + "\n" for record in records).encode()
+
+
+def csv_chunk(records, first):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_COLUMNS)
+    if first:
+        writer.writeheader()
+    writer.writerows(records)
+    return buffer.getvalue().encode()
+
+
+def msgpack_chunk(records, first):
+    packer = msgpack.Packer()
+    return b"".join(packer.pack(record) for record in records)
+
+
+# format -> (type MIME, extension du fichier, encodeur)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson", ndjson_chunk),
+    "csv": ("text/csv", "csv", csv_chunk),
+    "msgpack": ("application/x-msgpack", "msgpack", msgpack_chunk),
+}
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+from collections import Counter
+
+# journalisation des mesures individuelles : "off" (défaut), "sampled" (une mesure sur LOG_SAMPLE_RATE) ou "all"
+LOG_READINGS = os.getenv("LOG_READINGS", "off")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+# période d'écriture des compteurs agrégés
+LOG_STATS_INTERVAL = float(os.getenv("LOG_STATS_INTERVAL", "60"))
+
+logger = logging.getLogger("ingest")
+
+
+# indique si la mesure courante doit être journalisée individuellement
+def log_this_reading():
+    if LOG_READINGS == "all":
+        return True
+    if LOG_READINGS == "sampled":
+        return random.random() < LOG_SAMPLE_RATE
+    return False
+
+
+# compteurs d'ingestion agrégés par intervalle, écrits en une seule ligne JSON au lieu d'une ligne par mesure.
+
+class IngestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.alerts_by_plant = Counter()
+
+    def record_accepted(self, plant_id, alert_count):
+        with self._lock:
+            self.accepted += 1
+            if alert_count:
+                self.alerts_by_plant[plant_id] += alert_count
+
+    def record_rejected(self, count=1):
+        with self._lock:
+            self.rejected += count
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            data = {
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "alerts_by_plant": {str(plant_id): n for plant_id, n in sorted(self.alerts_by_plant.items())},
+            }
+            if reset:
+                self._reset()
+        return data
+
+    async def run_reporter(self, interval=LOG_STATS_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            self.report()
+
+    def report(self):
+        data = self.snapshot(reset=True)
+        if data["accepted"] or data["rejected"]:
+            data["interval_s"] = LOG_STATS_INTERVAL
+            logger.info("ingest_stats %s", json.dumps(data))
+
+
+stats = IngestStats()
@@ -0,0 +1,88 @@
+# test de charge de /ingest : simule N capteurs concurrents (10, 100 puis 1000 par défaut) qui envoient chacun
+# une mesure toutes les INTERVAL secondes, et affiche les latences p50/p95/p99 par palier.
+# le test échoue (code de sortie 1) si le p99 du dernier palier dépasse MAX_P99_RATIO fois celui du premier.
+#
+# usage : API_URL=http://localhost:8000/ingest python load_test.py
+# nécessite httpx (déjà utilisé par le TestClient de FastAPI) et une API démarrée avec sa base.
+
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import msgpack
+
+API_URL = os.getenv("API_URL", "http://localhost:8000/ingest")
+LEVELS = [int(x) for x in os.getenv("LEVELS", "10,100,1000").split(",")]
+DURATION = float(os.getenv("DURATION", "20"))
+INTERVAL = float(os.getenv("INTERVAL", "1"))
+MAX_P99_RATIO = float(os.getenv("MAX_P99_RATIO", "2"))
+
+
+def build_payload(sensor_index):
+    payload = {
+        "sensor_id": f"LOAD-{sensor_index:04d}",
+        "sensor_version": "FR-v8",
+        "plant_id": sensor_index % 50 + 1,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "temperature": round(random.normalvariate(25, 3), 2),
+        "humidity": round(random.normalvariate(60, 10), 2)
+    }
+    return msgpack.packb(payload)
+
+
+async def run_sensor(client, sensor_index, deadline, latencies, errors):
+    # décalage aléatoire pour ne pas envoyer toutes les mesures au même instant
+    await asyncio.sleep(random.uniform(0, INTERVAL))
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.post(API_URL, content=build_payload(sensor_index), headers={
+                "Content-Type": "application/msgpack",
+                "X-Sensor-Version": "FR-v8"
+            })
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        await asyncio.sleep(max(0.0, INTERVAL - (time.perf_counter() - started)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_level(sensors):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=sensors, max_keepalive_connections=sensors)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        deadline = time.monotonic() + DURATION
+        await asyncio.gather(*(run_sensor(client, i, deadline, latencies, errors) for i in range(sensors)))
+    return latencies, errors
+
+
+async def main():
+    results = []
+    for sensors in LEVELS:
+        latencies, errors = await run_level(sensors)
+        if not latencies:
+            print(f"{sensors:>5} capteurs : aucune réponse réussie ({len(errors)} erreurs)")
+            return 1
+        p50, p95, p99 = (percentile(latencies, p) * 1000 for p in (50, 95, 99))
+        results.append(p99)
+        print(f"{sensors:>5} capteurs : {len(latencies):>6} req, {len(errors):>4} erreurs, "
+              f"p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms")
+
+    ratio = results[-1] / results[0]
+    print(f"p99 {LEVELS[-1]} / p99 {LEVELS[0]} = {ratio:.2f} (max {MAX_P99_RATIO})")
+    return 0 if ratio <= MAX_P99_RATIO else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,111 +1,204 @@
-import base64
-import msgpack
+import asyncio
+import itertools
+import json
 import os
 import logging
-import psycopg2
-import socket
-import time
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
 from fastapi import FastAPI, Request, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from psycopg2.extras import execute_values
 
-from validator import validate_sensor_payload
+from buffer import WRITE_BEHIND, WRITE_BEHIND_BATCH, WRITE_BEHIND_INTERVAL, WRITE_BEHIND_MAX_ROWS, \
+    WRITE_BEHIND_RETRY_AFTER, COPY_COLUMNS, WRITTEN_COLUMNS, WriteBehindBuffer
+from columnar import ARROW_AVAILABLE, ARROW_TYPE, negotiate, pack, to_columns
+from db import dedicated_connection, get_connection, open_pool, close_pool, pool_stats, run_db
+from downsample import downsample_rows
+from export import EXPORT_CHUNK_ROWS, EXPORT_FORMATS, export_record
+from ingest_stats import log_this_reading, stats as ingest_stats
+from parser import decode_sensor_batch, decode_sensor_reading
+from pubsub import STREAM_LISTEN, broker, listen_flags, publish_rows
+from queries import LAST_ID_QUERY, PLANTS_QUERY, SENSORS_QUERY, anomalies_query, anomaly_counts_query, data_query, \
+    decode_cursor, encode_cursor, export_query, pick_resolution, plant_data_query, plant_rollup_query, rollup_query, \
+    since_query
+from registry import confirm_sensors, registry_cache, upsert_sensors
+from shared.rules import REASON_NAMES, describe, rules
+from validator import parse_timestamp, validate_sensor_payload
 
-app = FastAPI()
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format='%(asctime)s - %(levelname)s - %(message)s')
 
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/plant_monitoring")
-TEMP_MIN = 10.0
-TEMP_MAX = 35.0
-HUM_MIN = 30.0
-HUM_MAX = 80.0
-# according to les données sur internet of course
 
-def wait_for_db():
-    for attempt in range(10):
-        try:
-            socket.gethostbyname('db')
-            logging.info("Résolution DNS réussie pour 'db'")
-            return True
-        except socket.gaierror:
-            wait_time = 5 * (attempt + 1)
-            logging.warning("DNS échec (tentative %d), retry dans %ds", attempt + 1, wait_time)
-            time.sleep(wait_time)
-    return False
-# permet de faire une boucle de 10 tentatives et en cas d'échec de réessayer.
-
-
-def get_db_connection():
-    for attempt in range(5):
-        try:
-            conn = psycopg2.connect(DATABASE_URL)
-            logging.info("Connexion DB réussie")
-            return conn
-        except psycopg2.OperationalError as e:
-            wait_time = 2 ** attempt
-            logging.warning("Échec DB (tentative %d), retry dans %ds...: %s", attempt + 1, wait_time, str(e))
-            time.sleep(wait_time)
-    raise Exception("Connexion à la base échouée après 5 tentatives")
+# le pool de connexions est ouvert une seule fois au démarrage (résolution DNS comprise) et fermé à l'arrêt.
+# en mode write-behind, la file d'écriture est vidée avant la fermeture du pool.
+# une tâche de fond écrit périodiquement les compteurs d'ingestion agrégés.
 
-# endpoint /ingest permet de réceptionner, convertit et valide les données, génère des anomalies, enregistre les données dans la table "sensor_data".
+write_buffer = None
 
 
-@app.post("/ingest")
-async def ingest(request: Request):
+@asynccontextmanager
+async def lifespan(app):
+    global write_buffer
     try:
-        if not wait_for_db():
-            raise HTTPException(status_code=500, detail="DNS DB échoué")
+        await run_db(open_pool, True)
+    except Exception as e:
+        # démarrage en mode dégradé : le pool sera ouvert par la première requête qui trouve la base
+        logging.error("Base indisponible au démarrage, nouvel essai à chaque requête : %s", str(e))
+    stats_task = asyncio.create_task(ingest_stats.run_reporter())
+    listen_task = asyncio.create_task(listen_flags()) if STREAM_LISTEN else None
+    if WRITE_BEHIND:
+        write_buffer = WriteBehindBuffer(
+            WRITE_BEHIND_MAX_ROWS, WRITE_BEHIND_BATCH, WRITE_BEHIND_INTERVAL,
+            on_flush=lambda rows: publish_rows(rows, WRITTEN_COLUMNS)
+        )
+        write_buffer.start()
+        logging.info("Mode write-behind actif (file de %d mesures, lots de %d)", WRITE_BEHIND_MAX_ROWS, WRITE_BEHIND_BATCH)
+    yield
+    if write_buffer is not None:
+        await write_buffer.drain()
+    stats_task.cancel()
+    if listen_task is not None:
+        listen_task.cancel()
+    ingest_stats.report()
+    await run_db(close_pool)
 
-        raw_payload = await request.body()
-        logging.info("Payload reçu (%d octets)", len(raw_payload))
 
-        decoded_data = msgpack.unpackb(base64.b64decode(raw_payload), raw=False)
+app = FastAPI(lifespan=lifespan)
+
+INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "10000"))
+
 
-        logging.info("Contenu reçu : %s", decoded_data)
+# convertit une mesure décodée en données typées (horodatage compris, voir validator.parse_timestamp) et la valide.
+# retourne (mesure, erreurs) : la liste d'erreurs est non vide si la mesure est rejetée.
 
+def prepare_reading(decoded_data):
+    try:
         transformed_data = {
+            "sensor_id": str(decoded_data["sensor_id"]),
+            "sensor_version": str(decoded_data["sensor_version"]),
             "plant_id": int(decoded_data["plant_id"]),
             "temperature": float(decoded_data["temperature"]),
             "humidity": float(decoded_data["humidity"]),
-            "timestamp": decoded_data["timestamp"]
+            "timestamp": parse_timestamp(decoded_data["timestamp"])
         }
+    except (KeyError, TypeError, ValueError) as e:
+        return None, [f"champ manquant ou invalide : {e}"]
 
-        is_valid, errors = validate_sensor_payload(transformed_data)
-        if not is_valid:
-            logging.error("Données invalides : %s", errors)
-            raise HTTPException(status_code=400, detail=errors)
+    is_valid, errors = validate_sensor_payload(transformed_data)
+    if not is_valid:
+        return None, errors
+    return transformed_data, []
+
+
+# alertes de chaque mesure validée, évaluées en une passe par les règles communes (shared/rules.py) :
+# seuils par plante et par version de capteur. retourne (code de raison, libellés) par mesure.
+
+def reading_alerts(readings):
+    _, reasons = rules.evaluate(
+        [reading["temperature"] for reading in readings],
+        [reading["humidity"] for reading in readings],
+        plant_ids=[reading["plant_id"] for reading in readings],
+        sensor_versions=[reading["sensor_version"] for reading in readings],
+    )
+    return [
+        (int(reason), describe(reason, reading["temperature"], reading["humidity"]))
+        for reading, reason in zip(readings, reasons)
+    ]
+
+
+# le corps est du msgpack brut quand le Content-Type vaut exactement application/msgpack.
+# la forme base64 des firmwares FR-v8/EN-v2 reste acceptée si l'en-tête Content-Transfer-Encoding: base64
+# est présent, ou avec un autre Content-Type (ex. application/x-msgpack-base64).
+
+def is_base64_body(request):
+    encoding = request.headers.get("content-transfer-encoding", "").strip().lower()
+    if encoding:
+        return encoding == "base64"
+    return request.headers.get("content-type", "").strip().lower() != "application/msgpack"
 
-        alerts = []
-        if transformed_data["temperature"] > TEMP_MAX:
-            alerts.append(f"Température élevée ({transformed_data['temperature']}°C)")
-        if not HUM_MIN <= transformed_data["humidity"] <= HUM_MAX:
-            alerts.append(f"Humidité anormale ({transformed_data['humidity']}%)")
 
-        for alert in alerts:
-            logging.warning("🚨 Alerte plante %s : %s", transformed_data['plant_id'], alert)
+# insère des lignes (voir reading_row) dans "sensor_data" en un seul INSERT multi-lignes et met à jour
+# le registre des capteurs dans la même transaction ; fonction bloquante, exécutée hors de la boucle
+# d'événements via run_db. retourne les lignes écrites avec leur id (voir buffer.WRITTEN_COLUMNS).
 
+def insert_readings(readings):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            ids = execute_values(cursor, """
+                INSERT INTO sensor_data 
+                (sensor_id, sensor_version, plant_id, temperature, humidity, timestamp, anomaly, reason)
+                VALUES %s
+                RETURNING id
+            """, readings, page_size=max(len(readings), 1), fetch=True)
+            registered = upsert_sensors(cursor, readings)
+    confirm_sensors(registered)
+    return [(reading_id,) + tuple(row) for (reading_id,), row in zip(ids, readings)]
+
+
+# ligne à insérer, dans l'ordre des colonnes de COPY_COLUMNS ; anomalie si le code de raison est non nul
+
+def reading_row(reading, reason):
+    return tuple(reading[column] for column in COPY_COLUMNS[:-2]) + (reason != 0, reason)
+
+
+# enregistre les mesures : directement en base, ou via la file write-behind si le mode est actif.
+# si la file est pleine, le client est invité à réessayer plus tard (503 + Retry-After).
+
+async def store_readings(rows):
+    if write_buffer is not None:
+        if not write_buffer.offer(rows):
+            logging.warning("File write-behind pleine, %d mesures refusées", len(rows))
+            raise HTTPException(
+                status_code=503,
+                detail="File d'écriture pleine, réessayer plus tard",
+                headers={"Retry-After": str(WRITE_BEHIND_RETRY_AFTER)}
+            )
+        return
+    publish_rows(await run_db(insert_readings, rows), WRITTEN_COLUMNS)
+
+
+# endpoint /ingest permet de réceptionner, convertit et valide les données, génère des anomalies, enregistre les données dans la table "sensor_data".
+
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    try:
+        raw_payload = await request.body()
         try:
-            conn = get_db_connection()
-            with conn:
-                with conn.cursor() as cursor:
-                    # Dans la fonction @app.post("/ingest")
-                    cursor.execute("""
-                        INSERT INTO sensor_data 
-                        (sensor_id, sensor_version, plant_id, temperature, humidity, timestamp, anomaly)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        decoded_data["sensor_id"],
-                        decoded_data["sensor_version"],
-                        transformed_data["plant_id"],
-                        transformed_data["temperature"],
-                        transformed_data["humidity"],
-                        transformed_data["timestamp"],
-                        len(alerts) > 0  # True si au moins une alerte
-                    ))
-
-            logging.info("✅ Données insérées")
+            decoded_data = decode_sensor_reading(raw_payload, is_base64_body(request))
+        except ValueError as e:
+            ingest_stats.record_rejected()
+            logging.warning("Mesure illisible : %s", str(e))
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # journalisation par mesure désactivée par défaut (voir LOG_READINGS), remplacée par des compteurs agrégés
+        log_reading = log_this_reading()
+        if log_reading:
+            logging.info("Contenu reçu (%d octets) : %s", len(raw_payload), decoded_data)
+
+        transformed_data, errors = prepare_reading(decoded_data)
+        if errors:
+            ingest_stats.record_rejected()
+            if log_reading:
+                logging.error("Données invalides : %s", errors)
+            raise HTTPException(status_code=400, detail=errors)
+
+        reason, alerts = reading_alerts([transformed_data])[0]
+        if log_reading:
+            for alert in alerts:
+                logging.warning("🚨 Alerte plante %s : %s", transformed_data['plant_id'], alert)
+
+        try:
+            # anomalie = True si au moins une alerte
+            await store_readings([reading_row(transformed_data, reason)])
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error("Erreur insertion DB : %s", str(e))
             raise HTTPException(status_code=500, detail="Erreur base de données")
 
+        ingest_stats.record_accepted(transformed_data["plant_id"], len(alerts))
         return {"status": "OK", "alerts": alerts}
 
     except HTTPException:
@@ -115,107 +208,530 @@ async def ingest(request: Request):
         raise HTTPException(status_code=500, detail="Erreur serveur interne")
 
 
-# execute une requête pour récupérer et retourner la liste des identifiants de plantes distincts stockées dans la base
+# endpoint /ingest/batch : reçoit un tableau msgpack de mesures (brut ou base64), valide chaque mesure
+# et insère toutes les mesures valides en une seule requête. La réponse donne le statut de chaque mesure,
+# dans l'ordre du lot.
+
+@app.post("/ingest/batch")
+async def ingest_batch(request: Request):
+    raw_payload = await request.body()
+    try:
+        batch = decode_sensor_batch(raw_payload, is_base64_body(request))
+    except ValueError as e:
+        logging.error("Lot invalide : %s", str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(batch) > INGEST_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Lot trop volumineux ({len(batch)} > {INGEST_BATCH_MAX} mesures)")
+
+    results = []
+    valid = []
+    for index, decoded_data in enumerate(batch):
+        if not isinstance(decoded_data, dict):
+            results.append({"index": index, "status": "rejected", "errors": ["mesure invalide (objet attendu)"]})
+            continue
+        transformed_data, errors = prepare_reading(decoded_data)
+        if errors:
+            results.append({"index": index, "status": "rejected", "errors": errors})
+            continue
+        valid.append(transformed_data)
+        results.append({"index": index, "status": "OK"})
+
+    accepted = list(zip(valid, reading_alerts(valid))) if valid else []
+    accepted_results = (result for result in results if result["status"] == "OK")
+    for (_, (_, alerts)), result in zip(accepted, accepted_results):
+        result["alerts"] = alerts
+
+    if accepted:
+        try:
+            await store_readings([reading_row(reading, reason) for reading, (reason, _) in accepted])
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error("Erreur insertion DB (lot de %d mesures) : %s", len(accepted), str(e))
+            raise HTTPException(status_code=500, detail="Erreur base de données")
+
+    for reading, (_, alerts) in accepted:
+        ingest_stats.record_accepted(reading["plant_id"], len(alerts))
+    ingest_stats.record_rejected(len(batch) - len(accepted))
+    logging.debug("Lot reçu : %d acceptées, %d rejetées", len(accepted), len(batch) - len(accepted))
+    return {
+        "status": "OK",
+        "accepted": len(accepted),
+        "rejected": len(batch) - len(accepted),
+        "results": results
+    }
+
+
+# execute une requête pour récupérer et retourner la liste des identifiants de plantes distincts stockées dans la base.
+# /plants et /sensors lisent le registre des capteurs (table "sensors"), avec un cache en mémoire à durée de vie limitée.
+
+def fetch_plants():
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(PLANTS_QUERY)
+            return [row[0] for row in cursor.fetchall()]
+
 
 @app.get("/plants")
-def get_plants():
+async def get_plants():
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT DISTINCT plant_id FROM sensor_data ORDER BY plant_id")
-                return [row[0] for row in cursor.fetchall()]
+        return await registry_cache.get_or_load("plants", lambda: run_db(fetch_plants))
     except Exception as e:
         logging.error("Erreur récupération plantes : %s", str(e))
         raise HTTPException(status_code=500, detail="Erreur base de données")
 
 # prend en paramètre un identifiant de plante et retourne, pour cette plante, la liste des capteurs distincts (identifiant et version)
+def fetch_sensors(plant_id):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SENSORS_QUERY, (plant_id,))
+            return [
+                {"sensor_id": row[0], "sensor_version": row[1]}
+                for row in cursor.fetchall()
+            ]
+
+
 @app.get("/sensors")
-def get_sensors(plant_id: int = Query(...)):
+async def get_sensors(plant_id: int = Query(...)):
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT DISTINCT sensor_id, sensor_version 
-                    FROM sensor_data 
-                    WHERE plant_id = %s
-                    ORDER BY sensor_id
-                """, (plant_id,))
-                return [
-                    {"sensor_id": row[0], "sensor_version": row[1]}
-                    for row in cursor.fetchall()
-                ]
+        return await registry_cache.get_or_load(("sensors", plant_id), lambda: run_db(fetch_sensors, plant_id))
     except Exception as e:
         logging.error("Erreur récupération capteurs : %s", str(e))
         raise HTTPException(status_code=500, detail="Erreur base de données")
 
 
-# effectue un test pour vérifier si la connexion à la base est fonctionnelle et renvoie un indicateur de statut de la base
+# effectue un test pour vérifier si la connexion à la base est fonctionnelle et renvoie un indicateur de statut de la base,
+# ainsi que l'état du pool de connexions (connexions utilisées, requêtes en attente, connexions créées)
+# et les compteurs de la file write-behind
+
+def ping_db():
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
 
 @app.get("/health")
 async def health():
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT 1")
-        return {"status": "OK", "database": "connecté"}
+        await run_db(ping_db)
+        database = "connecté"
     except Exception:
-        return {"status": "OK", "database": "non connecté"}
+        database = "non connecté"
+    return {
+        "status": "OK",
+        "database": database,
+        "pool": pool_stats(),
+        "registry_cache": registry_cache.stats(),
+        "write_behind": write_buffer.stats() if write_buffer is not None else None,
+        "stream": broker.stats()
+    }
 
 # permet de récuperer les données enregistrées pour une plante donnée, avec pour possibilité de filtrer parmi les capteurs et les dates.
+# resolution : "raw" (mesures brutes, 20 plus récentes), "1m" / "1h" (agrégats par minute / heure sur la plage),
+# ou "auto" (choix selon la durée de la plage, voir queries.pick_resolution).
+# max_points : toute la plage est lue (DATA_MAX_ROWS lignes au plus, sinon 413) puis réduite à max_points points
+# par capteur en conservant la forme des courbes et les anomalies (downsample.lttb). les agrégats sont aussi
+# limités à DATA_MAX_ROWS lignes sans max_points (413 au-delà) : une plage absente couvre tout l'historique.
+# pagination des mesures brutes : limit lignes par page ; la réponse contient next_cursor (null sur la dernière
+# page), à repasser en paramètre cursor pour obtenir la page suivante. un curseur implique resolution=raw.
+# rafraîchissement incrémental : la réponse contient last_id (dernier id inséré pour la plante) ; un appel suivant
+# avec since=last_id ne renvoie que les mesures brutes insérées depuis (limit au plus), dans l'ordre d'insertion.
+
+# format : JSON par défaut ; en-tête Accept application/x-msgpack ou application/vnd.apache.arrow.stream pour une
+# réponse en colonnes (tableaux typés, horodatages en ms depuis l'epoch, voir columnar.py).
+
+RESOLUTIONS = ("auto", "raw", "1m", "1h")
+DATA_MAX_ROWS = int(os.getenv("DATA_MAX_ROWS", 200000))
+DATA_PAGE_MAX = int(os.getenv("DATA_PAGE_MAX", 10000))
+
+
+class TooManyRows(Exception):
+    pass
+
+
+# bornes de plage des endpoints de lecture avec fuseau : sans fuseau, l'heure est considérée UTC comme pour les
+# mesures reçues (validator.parse_timestamp), une plage mêlant les deux reste comparable
+def time_bounds(start, end):
+    return tuple(None if bound is None else parse_timestamp(bound) for bound in (start, end))
+
+
+# bounded : requête limitée à DATA_MAX_ROWS + 1 lignes, TooManyRows au-delà de DATA_MAX_ROWS
+def fetch_rows(cursor, query, max_points=None, bounded=False, **columns):
+    cursor.execute(*query)
+    if not (max_points or bounded):
+        return cursor.fetchall()
+    rows = cursor.fetchmany(DATA_MAX_ROWS + 1)
+    if len(rows) > DATA_MAX_ROWS:
+        raise TooManyRows()
+    return downsample_rows(rows, max_points, **columns) if max_points else rows
+
+
+# colonnes communes aux requêtes de /data (brutes et agrégats)
+DATA_COLUMNS = {"sensor": 6, "timestamp": 3, "values": (1, 2), "flag": 4}
+# position de chaque colonne des réponses en colonnes (voir columnar.py) dans les lignes des requêtes
+RAW_POSITIONS = {
+    "plant_id": 0, "sensor_id": 6, "id": 7, "timestamp": 3, "temperature": 1, "humidity": 2,
+    "anomaly": 4, "cross_sensor_issue": 5
+}
+ROLLUP_POSITIONS = {
+    "plant_id": 0, "sensor_id": 6, "timestamp": 3, "temperature": 1, "humidity": 2,
+    "anomaly": 4, "cross_sensor_issue": 5, "readings": 7, "anomaly_count": 4,
+    "temperature_min": 8, "temperature_max": 9, "humidity_min": 10, "humidity_max": 11
+}
+
+
+# columnar : results est un dict {colonne: tableau NumPy} au lieu d'une liste de mesures
+def fetch_data(plant_id, sensor_id, start, end, resolution="raw", max_points=None, limit=20, after=None, since=None,
+               columnar=False):
+    next_cursor = None
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            if since is not None:
+                rows = fetch_rows(cursor, since_query(plant_id, sensor_id, since, start, end, limit))
+                last_id = rows[-1][7] if rows else since
+            else:
+                # lu avant les mesures : une mesure insérée entre les deux requêtes sera renvoyée par l'appel suivant
+                cursor.execute(LAST_ID_QUERY, (plant_id,))
+                last_id = cursor.fetchone()[0] or 0
+                if resolution == "raw":
+                    query = data_query(plant_id, sensor_id, start, end, DATA_MAX_ROWS + 1 if max_points else limit, after)
+                    rows = fetch_rows(cursor, query, max_points, **DATA_COLUMNS)
+                    if not max_points and len(rows) == limit:
+                        next_cursor = encode_cursor(rows[-1][3], rows[-1][7])
+                else:
+                    query = rollup_query(resolution, plant_id, sensor_id, start, end, DATA_MAX_ROWS + 1)
+                    rows = fetch_rows(cursor, query, max_points, bounded=True, **DATA_COLUMNS)
+    positions = RAW_POSITIONS if resolution == "raw" else ROLLUP_POSITIONS
+    if columnar:
+        results = to_columns(rows, positions)
+    elif resolution == "raw":
+        results = [
+            {
+                "plant_id": row[0],
+                "temperature": float(row[1]),
+                "humidity": float(row[2]),
+                "timestamp": row[3].isoformat(),
+                "anomaly": bool(row[4]),
+                "cross_sensor_issue": bool(row[5]),
+                "sensor_id": row[6],
+                "id": row[7]
+            }
+            for row in rows
+        ]
+    else:
+        results = [
+            {
+                "plant_id": row[0],
+                "temperature": float(row[1]),
+                "humidity": float(row[2]),
+                "timestamp": row[3].isoformat(),
+                "anomaly": row[4] > 0,
+                "cross_sensor_issue": row[5] > 0,
+                "sensor_id": row[6],
+                "readings": row[7],
+                "anomaly_count": row[4],
+                "temperature_min": row[8],
+                "temperature_max": row[9],
+                "humidity_min": row[10],
+                "humidity_max": row[11]
+            }
+            for row in rows
+        ]
+    return {"resolution": resolution, "results": results, "next_cursor": next_cursor, "last_id": last_id}
+
+
+# type de réponse en colonnes demandé par Accept, None pour JSON ; 406 si seul Arrow est demandé sans pyarrow
+def columnar_type(request):
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type == ARROW_TYPE and not ARROW_AVAILABLE:
+        raise HTTPException(status_code=406, detail="Format Arrow indisponible (pyarrow non installé)")
+    return media_type
+
+
+# réponse en colonnes : results (ou columns) de la réponse JSON sous forme de tableaux, le reste en métadonnées
+def columnar_response(media_type, data, columns):
+    return Response(pack(media_type, data, columns), media_type=media_type, headers={"Vary": "Accept"})
+
 
 @app.get("/data")
-def get_data(
+async def get_data(
+    request: Request,
     plant_id: int = Query(..., description="ID de la plante"),
     sensor_id: str = Query(None, description="ID du capteur"),
-    start: str = Query(None, description="Date de début (ISO)"),
-    end: str = Query(None, description="Date de fin (ISO)")
+    start: datetime = Query(None, description="Date de début (ISO)"),
+    end: datetime = Query(None, description="Date de fin (ISO)"),
+    resolution: str = Query("auto", description="raw, 1m, 1h ou auto (selon la plage demandée)"),
+    max_points: int = Query(None, ge=3, description="Nombre maximal de points par capteur (sous-échantillonnage LTTB)"),
+    limit: int = Query(20, ge=1, le=DATA_PAGE_MAX, description="Nombre de mesures brutes par page"),
+    cursor: str = Query(None, description="Curseur de la page suivante (next_cursor de la réponse précédente)"),
+    since: int = Query(None, ge=0, description="Mesures insérées après cet id (last_id de la réponse précédente)")
 ):
+    start, end = time_bounds(start, end)
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution doit valoir {', '.join(RESOLUTIONS)}")
+    after = None
+    if since is not None:
+        if resolution not in ("auto", "raw") or max_points or cursor:
+            raise HTTPException(status_code=400, detail="since n'est valable qu'avec resolution=raw, sans max_points ni cursor")
+        resolution = "raw"
+    if cursor:
+        if resolution not in ("auto", "raw") or max_points:
+            raise HTTPException(status_code=400, detail="cursor n'est valable qu'avec resolution=raw, sans max_points")
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        resolution = "raw"
+    resolution = pick_resolution(resolution, start, end)
+    media_type = columnar_type(request)
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                # Modification de la requête SQL
-                base_query = """
-                    SELECT 
-                        plant_id, 
-                        temperature, 
-                        humidity, 
-                        timestamp, 
-                        anomaly,
-                        cross_sensor_issue,
-                        sensor_id
-                    FROM sensor_data
-                    WHERE plant_id = %s
-                """
-                params = [plant_id]
-                
-                if sensor_id:
-                    base_query += " AND sensor_id = %s"
-                    params.append(sensor_id)
-                
-                if start and end:
-                    base_query += " AND timestamp BETWEEN %s AND %s"
-                    params.extend([start, end])
-                
-                base_query += " ORDER BY timestamp DESC LIMIT 20"
-                
-                cursor.execute(base_query, tuple(params))
-                
-                return {
-                    "results": [
-                        {
-                            "plant_id": row[0],
-                            "temperature": float(row[1]),
-                            "humidity": float(row[2]),
-                            "timestamp": row[3].isoformat(),
-                            "anomaly": bool(row[4]),
-                            "cross_sensor_issue": bool(row[5]),
-                            "sensor_id": row[6]
-                        } 
-                        for row in cursor.fetchall()
-                    ]
-                }
-                
+        data = await run_db(
+            fetch_data, plant_id, sensor_id, start, end, resolution, max_points, limit, after, since, media_type is not None
+        )
+    except TooManyRows:
+        raise too_many_rows()
     except Exception as e:
         logging.error("Erreur de lecture DB : %s", str(e))
         raise HTTPException(status_code=500, detail="Erreur base de données")
+    if media_type is None:
+        return data
+    return columnar_response(media_type, data, data.pop("results"))
+
+
+# exporte toutes les mesures (brutes) d'une plante, filtrées comme /data, dans l'ordre chronologique.
+# format : ndjson, csv ou msgpack (voir export.py). les lignes sont lues par un curseur serveur par paquets de
+# EXPORT_CHUNK_ROWS et envoyées au fil de l'eau : la mémoire utilisée ne dépend pas de la taille de l'export.
+# chaque export a sa propre connexion, hors du pool (tenue pendant toute la durée de l'envoi, au rythme du
+# client) ; au plus EXPORT_MAX exports simultanés par processus, au-delà 503 + Retry-After.
+
+EXPORT_MAX = int(os.getenv("EXPORT_MAX", "2"))
+EXPORT_RETRY_AFTER = 30
+export_slots = threading.BoundedSemaphore(EXPORT_MAX)
+
+
+# libère la place d'export à la fin du générateur (épuisé, fermé ou en erreur)
+def export_chunks(query, encode):
+    try:
+        with dedicated_connection() as conn:
+            with conn.cursor(name="data_export") as cursor:
+                cursor.itersize = EXPORT_CHUNK_ROWS
+                cursor.execute(*query)
+                first = True
+                while True:
+                    rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                    if rows or first:
+                        yield encode([export_record(row) for row in rows], first)
+                    if len(rows) < EXPORT_CHUNK_ROWS:
+                        break
+                    first = False
+    finally:
+        export_slots.release()
+
+
+@app.get("/data/export")
+async def export_data(
+    plant_id: int = Query(..., description="ID de la plante"),
+    sensor_id: str = Query(None, description="ID du capteur"),
+    start: datetime = Query(None, description="Date de début (ISO)"),
+    end: datetime = Query(None, description="Date de fin (ISO)"),
+    format: str = Query("ndjson", description="ndjson, csv ou msgpack")
+):
+    start, end = time_bounds(start, end)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format doit valoir {', '.join(EXPORT_FORMATS)}")
+    media_type, extension, encode = EXPORT_FORMATS[format]
+    if not export_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Trop d'exports en cours, réessayer plus tard",
+            headers={"Retry-After": str(EXPORT_RETRY_AFTER)}
+        )
+    chunks = export_chunks(export_query(plant_id, sensor_id, start, end), encode)
+    # le premier paquet est lu avant de répondre : une erreur de requête donne encore un code 500
+    try:
+        first = await run_db(next, chunks)
+    except Exception as e:
+        chunks.close()
+        logging.error("Erreur de lecture DB : %s", str(e))
+        raise HTTPException(status_code=500, detail="Erreur base de données")
+    return StreamingResponse(
+        itertools.chain([first], chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="plant_{plant_id}.{extension}"'}
+    )
+
+
+# récupère en une requête les mesures de tous les capteurs d'une plante sur une plage (vue de comparaison du dashboard).
+# réponse en colonnes groupées par capteur : {"sensors": {sensor_id: {"timestamp": [...], "temperature": [...], ...}}},
+# chaque capteur dans l'ordre chronologique. au-delà de DATA_MAX_ROWS lignes, la plage doit être réduite
+# ou une résolution agrégée demandée (413). max_points comme pour /data.
+# en colonnes (Accept, comme /data) : une colonne sensor_id au lieu du regroupement, lignes groupées par capteur.
+
+PLANT_DATA_COLUMNS = ("timestamp", "temperature", "humidity", "anomaly", "cross_sensor_issue")
+PLANT_POSITIONS = {"sensor_id": 0, "timestamp": 1, "temperature": 2, "humidity": 3, "anomaly": 4, "cross_sensor_issue": 5}
+
+
+def fetch_plant_data(plant_id, start, end, resolution="raw", max_points=None, columnar=False):
+    if resolution == "raw":
+        query = plant_data_query(plant_id, start, end, DATA_MAX_ROWS + 1)
+    else:
+        query = plant_rollup_query(resolution, plant_id, start, end, DATA_MAX_ROWS + 1)
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(*query)
+            rows = cursor.fetchall()
+    if len(rows) > DATA_MAX_ROWS:
+        raise TooManyRows()
+    if max_points:
+        rows = downsample_rows(rows, max_points, sensor=0, timestamp=1, values=(2, 3), flag=4)
+    if columnar:
+        return {"plant_id": plant_id, "resolution": resolution, "columns": to_columns(rows, PLANT_POSITIONS)}
+
+    sensors = {}
+    for sensor_id, timestamp, temperature, humidity, anomaly, cross_sensor_issue in rows:
+        columns = sensors.get(sensor_id)
+        if columns is None:
+            columns = sensors[sensor_id] = {name: [] for name in PLANT_DATA_COLUMNS}
+        columns["timestamp"].append(timestamp.isoformat())
+        columns["temperature"].append(float(temperature))
+        columns["humidity"].append(float(humidity))
+        columns["anomaly"].append(bool(anomaly))
+        columns["cross_sensor_issue"].append(bool(cross_sensor_issue))
+    return {
+        "plant_id": plant_id,
+        "resolution": resolution,
+        "sensors": {sensor_id: sensors[sensor_id] for sensor_id in sorted(sensors)}
+    }
+
+
+def too_many_rows():
+    return HTTPException(
+        status_code=413,
+        detail=f"Plus de {DATA_MAX_ROWS} mesures : réduisez la plage ou choisissez une résolution agrégée"
+    )
+
+
+@app.get("/data/plant")
+async def get_plant_data(
+    request: Request,
+    plant_id: int = Query(..., description="ID de la plante"),
+    start: datetime = Query(..., description="Date de début (ISO)"),
+    end: datetime = Query(..., description="Date de fin (ISO)"),
+    resolution: str = Query("auto", description="raw, 1m, 1h ou auto (selon la plage demandée)"),
+    max_points: int = Query(None, ge=3, description="Nombre maximal de points par capteur (sous-échantillonnage LTTB)")
+):
+    start, end = time_bounds(start, end)
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution doit valoir {', '.join(RESOLUTIONS)}")
+    resolution = pick_resolution(resolution, start, end)
+    media_type = columnar_type(request)
+    try:
+        data = await run_db(fetch_plant_data, plant_id, start, end, resolution, max_points, media_type is not None)
+    except TooManyRows:
+        raise too_many_rows()
+    except Exception as e:
+        logging.error("Erreur de lecture DB : %s", str(e))
+        raise HTTPException(status_code=500, detail="Erreur base de données")
+    if media_type is None:
+        return data
+    return columnar_response(media_type, data, data.pop("columns"))
+
+
+# mesures anormales d'une plante (filtrées par capteur et plage comme /data), les plus récentes d'abord, avec
+# le code de raison enregistré et ses libellés (shared/rules.py), paginées par cursor / next_cursor.
+# la réponse contient aussi les compteurs de la plage, lus dans les agrégats tenus par triggers : total (mesures
+# signalées, anomaly ou cross_sensor_issue comme la liste) et counts (mesures par raison : {"temp_high": 3, ...}), à la minute près.
+
+ANOMALIES_PAGE_MAX = int(os.getenv("ANOMALIES_PAGE_MAX", 1000))
+
+
+def fetch_anomalies(plant_id, sensor_id, start, end, limit=50, after=None):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(*anomaly_counts_query(plant_id, sensor_id, start, end))
+            counts = dict(cursor.fetchall())
+            cursor.execute(*anomalies_query(plant_id, sensor_id, start, end, limit, after))
+            rows = cursor.fetchall()
+    results = [
+        {
+            "id": reading_id,
+            "sensor_id": sensor_id,
+            "timestamp": timestamp.isoformat(),
+            "temperature": float(temperature),
+            "humidity": float(humidity),
+            "anomaly": bool(anomaly),
+            "cross_sensor_issue": bool(cross_sensor_issue),
+            "reason": reason,
+            "reasons": describe(reason, temperature, humidity)
+        }
+        for reading_id, sensor_id, timestamp, temperature, humidity, anomaly, cross_sensor_issue, reason in rows
+    ]
+    next_cursor = encode_cursor(rows[-1][2], rows[-1][0]) if len(rows) == limit else None
+    return {
+        "plant_id": plant_id,
+        "total": int(counts.pop(0, 0)),
+        "counts": {name: int(counts.get(bit, 0)) for bit, name in REASON_NAMES.items()},
+        "results": results,
+        "next_cursor": next_cursor
+    }
+
+
+@app.get("/anomalies")
+async def get_anomalies(
+    plant_id: int = Query(..., description="ID de la plante"),
+    sensor_id: str = Query(None, description="ID du capteur"),
+    start: datetime = Query(None, description="Date de début (ISO)"),
+    end: datetime = Query(None, description="Date de fin (ISO)"),
+    limit: int = Query(50, ge=1, le=ANOMALIES_PAGE_MAX, description="Nombre de mesures par page"),
+    cursor: str = Query(None, description="Curseur de la page suivante (next_cursor de la réponse précédente)")
+):
+    start, end = time_bounds(start, end)
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await run_db(fetch_anomalies, plant_id, sensor_id, start, end, limit, after)
+    except Exception as e:
+        logging.error("Erreur de lecture DB : %s", str(e))
+        raise HTTPException(status_code=500, detail="Erreur base de données")
+
+
+# flux Server-Sent Events des nouvelles mesures ("reading") et des marquages du détecteur ("anomaly") pour une
+# ou plusieurs plantes (plant_id répété, toutes si absent), alimenté par pubsub.broker. "resync" signale des
+# événements perdus (client trop lent). un commentaire est envoyé toutes les STREAM_HEARTBEAT secondes sans
+# événement, pour garder la connexion ouverte à travers les proxys.
+
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/stream")
+async def stream(plant_id: List[int] = Query(None, description="ID des plantes suivies (toutes si absent)")):
+    subscription = broker.subscribe(plant_id or ())
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if subscription.lagged:
+                    subscription.reset()
+                    yield sse_event("resync", {})
+                try:
+                    event, data = await asyncio.wait_for(subscription.queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield sse_event(event, data)
+        finally:
+            broker.unsubscribe(subscription)
 
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -2,6 +2,14 @@ import base64
 import msgpack
 
 
+# décode un corps de requête msgpack, enveloppé ou non dans du Base64.
+
+def unpack_payload(raw_payload: bytes, base64_encoded: bool = True):
+    if base64_encoded:
+        raw_payload = base64.b64decode(raw_payload)
+    return msgpack.unpackb(raw_payload, raw=False)
+
+
 def decode_sensor_data(raw_payload: bytes) -> dict:
     try:
         # Décodage Base64
@@ -14,3 +22,30 @@ def decode_sensor_data(raw_payload: bytes) -> dict:
     except Exception as e:
         raise ValueError(
             f"Erreur lors du décodage des données du capteur : {e}")
+
+
+# décode une mesure unitaire (objet msgpack, brut ou base64) ; lève ValueError si le corps est illisible
+# (base64 invalide, msgpack tronqué, corps base64 envoyé comme du msgpack brut ou l'inverse).
+
+def decode_sensor_reading(raw_payload: bytes, base64_encoded: bool = True) -> dict:
+    try:
+        data = unpack_payload(raw_payload, base64_encoded)
+    except Exception as e:
+        raise ValueError(
+            f"Erreur lors du décodage de la mesure : {e}")
+    if not isinstance(data, dict):
+        raise ValueError("La mesure doit être un objet msgpack")
+    return data
+
+
+# décode un lot de mesures : un tableau msgpack dont chaque élément a le même format qu'une mesure unitaire.
+
+def decode_sensor_batch(raw_payload: bytes, base64_encoded: bool = True) -> list:
+    try:
+        data = unpack_payload(raw_payload, base64_encoded)
+    except Exception as e:
+        raise ValueError(
+            f"Erreur lors du décodage du lot de mesures : {e}")
+    if not isinstance(data, list):
+        raise ValueError("Le lot de mesures doit être un tableau msgpack")
+    return data
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import os
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from db import DATABASE_URL
+
+# diffusion en mémoire des événements du flux /stream (Server-Sent Events) :
+#   - "reading" : chaque mesure validée, publiée par /ingest et /ingest/batch une fois écrite en base ; seules
+#     les mesures reçues par cette instance sont publiées (avec plusieurs réplicas, les clients complètent
+#     régulièrement par /data?since, voir le dashboard) ;
+#   - "anomaly" : mesures marquées par le détecteur, reçues de PostgreSQL (trigger sensor_data_flag_notify).
+# chaque abonné a une file bornée ; si elle est pleine (client trop lent), les événements suivants sont perdus
+# pour lui et il reçoit un événement "resync" pour recharger ses données par /data.
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "1000"))
+# écoute des marquages du détecteur (LISTEN), sur une connexion dédiée hors du pool
+STREAM_LISTEN = os.getenv("STREAM_LISTEN", "1") == "1"
+FLAG_CHANNEL = "sensor_data_flagged"
+LISTEN_RETRY = 5
+
+
+class Subscription:
+    def __init__(self, plant_ids, queue_size):
+        self.plant_ids = set(plant_ids)
+        self.queue = asyncio.Queue(queue_size)
+        self.lagged = False
+
+    def wants(self, plant_id):
+        return not self.plant_ids or plant_id in self.plant_ids
+
+    # après une perte d'événements : vide la file, le client recharge ses données
+    def reset(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.lagged = False
+
+
+# publish et subscribe ne sont appelés que depuis la boucle d'événements (pas de verrou)
+
+class Broker:
+    def __init__(self, queue_size=STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self.published = 0
+        self.dropped = 0
+
+    # abonnement aux plantes données (toutes si la liste est vide)
+    def subscribe(self, plant_ids=()):
+        subscription = Subscription(plant_ids, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, event, plant_id, data):
+        self.published += 1
+        for subscription in self._subscribers:
+            if not subscription.wants(plant_id):
+                continue
+            try:
+                subscription.queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                subscription.lagged = True
+                self.dropped += 1
+
+    def stats(self):
+        return {"subscribers": len(self._subscribers), "published": self.published, "dropped": self.dropped}
+
+
+broker = Broker()
+
+
+# ligne écrite dans sensor_data (voir buffer.WRITTEN_COLUMNS) -> événement "reading"
+def publish_rows(rows, columns):
+    for row in rows:
+        data = dict(zip(columns, row))
+        if hasattr(data["timestamp"], "isoformat"):
+            data["timestamp"] = data["timestamp"].isoformat()
+        broker.publish("reading", data["plant_id"], data)
+
+
+def publish_notification(payload):
+    data = json.loads(payload)
+    broker.publish("anomaly", data["plant_id"], data)
+
+
+# relaie les notifications du détecteur vers les abonnés ; la connexion est rouverte après une coupure.
+# tâche de fond lancée au démarrage de l'application.
+
+async def listen_flags(dsn=DATABASE_URL, channel=FLAG_CHANNEL):
+    loop = asyncio.get_running_loop()
+    while True:
+        conn = None
+        try:
+            conn = await loop.run_in_executor(None, psycopg2.connect, dsn)
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {channel}")
+            logging.info("Écoute des marquages d'anomalies (canal %s)", channel)
+            ready = asyncio.Event()
+            loop.add_reader(conn.fileno(), ready.set)
+            try:
+                while True:
+                    await ready.wait()
+                    ready.clear()
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            publish_notification(notify.payload)
+                        except (ValueError, KeyError) as e:
+                            logging.warning("Notification ignorée : %s", str(e))
+            finally:
+                loop.remove_reader(conn.fileno())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("Écoute des marquages interrompue (%s), reprise dans %ds", str(e), LISTEN_RETRY)
+        finally:
+            if conn is not None:
+                conn.close()
+        await asyncio.sleep(LISTEN_RETRY)
@@ -0,0 +1,268 @@
+# requêtes SQL des endpoints de lecture, regroupées ici pour que test_query_plans.py vérifie
+# leurs plans d'exécution (EXPLAIN) sur les mêmes textes que ceux exécutés par l'API.
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+# /plants et /sensors lisent le registre des capteurs (une ligne par capteur) et non l'historique des mesures.
+PLANTS_QUERY = """
+    SELECT DISTINCT plant_id FROM sensors ORDER BY plant_id
+"""
+
+SENSORS_QUERY = """
+    SELECT sensor_id, sensor_version
+    FROM sensors
+    WHERE plant_id = %s
+    ORDER BY sensor_id
+"""
+
+
+# construit la requête de /data : filtre par plante, éventuellement par capteur et plage de dates,
+# trié du plus récent au plus ancien (puis par id), limit lignes au plus. retourne (requête, paramètres).
+# after = (timestamp, id) de la dernière ligne d'une page : la requête reprend juste après (pagination par clé).
+# la borne "timestamp <= ..." redondante permet de démarrer le parcours d'index à la position du curseur.
+
+def data_query(plant_id, sensor_id=None, start=None, end=None, limit=20, after=None):
+    base_query = """
+        SELECT
+            plant_id,
+            temperature,
+            humidity,
+            timestamp,
+            anomaly,
+            cross_sensor_issue,
+            sensor_id,
+            id
+        FROM sensor_data
+        WHERE plant_id = %s
+    """
+    params = [plant_id]
+
+    if sensor_id:
+        base_query += " AND sensor_id = %s"
+        params.append(sensor_id)
+
+    if start and end:
+        base_query += " AND timestamp BETWEEN %s AND %s"
+        params.extend([start, end])
+
+    if after:
+        base_query += " AND timestamp <= %s AND (timestamp, id) < (%s, %s)"
+        params.extend([after[0], after[0], after[1]])
+
+    base_query += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+    params.append(limit)
+    return base_query, tuple(params)
+
+
+# mesures brutes insérées après la mesure d'id since_id (rafraîchissement incrémental du dashboard),
+# dans l'ordre d'insertion, mêmes colonnes que data_query ; parcours de idx_plant_id à partir de since_id.
+
+def since_query(plant_id, sensor_id, since_id, start=None, end=None, limit=20):
+    base_query = """
+        SELECT
+            plant_id,
+            temperature,
+            humidity,
+            timestamp,
+            anomaly,
+            cross_sensor_issue,
+            sensor_id,
+            id
+        FROM sensor_data
+        WHERE plant_id = %s AND id > %s
+    """
+    params = [plant_id, since_id]
+
+    if sensor_id:
+        base_query += " AND sensor_id = %s"
+        params.append(sensor_id)
+
+    if start and end:
+        base_query += " AND timestamp BETWEEN %s AND %s"
+        params.extend([start, end])
+
+    base_query += " ORDER BY id LIMIT %s"
+    params.append(limit)
+    return base_query, tuple(params)
+
+
+# dernier id inséré pour une plante : point de départ du prochain appel avec since
+LAST_ID_QUERY = """
+    SELECT max(id) FROM sensor_data WHERE plant_id = %s
+"""
+
+
+# curseur de pagination opaque : (timestamp, id) de la dernière ligne renvoyée, en base64 url.
+# decode_cursor lève ValueError sur un curseur invalide.
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception as e:
+        raise ValueError("curseur invalide") from e
+
+
+# construit la requête de /data/export : mêmes filtres que /data, toutes les lignes dans l'ordre chronologique.
+# elle est lue par un curseur serveur (nommé), par paquets, sans charger le résultat en mémoire.
+
+def export_query(plant_id, sensor_id=None, start=None, end=None):
+    base_query = """
+        SELECT plant_id, sensor_id, timestamp, temperature, humidity, anomaly, cross_sensor_issue
+        FROM sensor_data
+        WHERE plant_id = %s
+    """
+    params = [plant_id]
+
+    if sensor_id:
+        base_query += " AND sensor_id = %s"
+        params.append(sensor_id)
+
+    if start and end:
+        base_query += " AND timestamp BETWEEN %s AND %s"
+        params.extend([start, end])
+
+    base_query += " ORDER BY timestamp, id"
+    return base_query, tuple(params)
+
+
+# tables d'agrégats par résolution
+ROLLUP_TABLES = {"1m": "sensor_data_1m", "1h": "sensor_data_1h"}
+# résolution choisie automatiquement : brute jusqu'à 2 h de plage, agrégats minute jusqu'à 2 jours, horaires au-delà
+AUTO_RESOLUTIONS = ((timedelta(hours=2), "raw"), (timedelta(days=2), "1m"))
+
+
+# choisit la résolution effective ; "auto" dépend de la durée entre start et end (données brutes sans plage).
+
+def pick_resolution(resolution, start=None, end=None):
+    if resolution != "auto":
+        return resolution
+    if not (start and end):
+        return "raw"
+    span = end - start
+    for max_span, candidate in AUTO_RESOLUTIONS:
+        if span <= max_span:
+            return candidate
+    return "1h"
+
+
+# construit la requête sur les agrégats (1m ou 1h) : un point par capteur et par seau, du plus récent au plus ancien.
+# limit borne le nombre de lignes lues.
+
+def rollup_query(resolution, plant_id, sensor_id=None, start=None, end=None, limit=None):
+    base_query = f"""
+        SELECT
+            plant_id,
+            temperature_sum / readings,
+            humidity_sum / readings,
+            bucket,
+            anomaly_count,
+            cross_sensor_count,
+            sensor_id,
+            readings,
+            temperature_min,
+            temperature_max,
+            humidity_min,
+            humidity_max
+        FROM {ROLLUP_TABLES[resolution]}
+        WHERE plant_id = %s
+    """
+    params = [plant_id]
+
+    if sensor_id:
+        base_query += " AND sensor_id = %s"
+        params.append(sensor_id)
+
+    if start and end:
+        base_query += " AND bucket BETWEEN %s AND %s"
+        params.extend([start, end])
+
+    base_query += " ORDER BY bucket DESC"
+    if limit:
+        base_query += " LIMIT %s"
+        params.append(limit)
+    return base_query, tuple(params)
+
+
+# construit la requête de /data/plant : toutes les mesures brutes d'une plante sur une plage, groupées par capteur
+# et dans l'ordre chronologique pour chaque capteur (parcours arrière de idx_plant_sensor_timestamp, sans tri).
+# limit borne le nombre de lignes lues.
+
+def plant_data_query(plant_id, start, end, limit):
+    return """
+        SELECT sensor_id, timestamp, temperature, humidity, anomaly, cross_sensor_issue
+        FROM sensor_data
+        WHERE plant_id = %s AND timestamp BETWEEN %s AND %s
+        ORDER BY sensor_id DESC, timestamp
+        LIMIT %s
+    """, (plant_id, start, end, limit)
+
+
+# même chose sur les agrégats (1m ou 1h) : la moyenne du seau tient lieu de mesure.
+
+def plant_rollup_query(resolution, plant_id, start, end, limit):
+    return f"""
+        SELECT sensor_id, bucket, temperature_sum / readings, humidity_sum / readings,
+               anomaly_count > 0, cross_sensor_count > 0
+        FROM {ROLLUP_TABLES[resolution]}
+        WHERE plant_id = %s AND bucket BETWEEN %s AND %s
+        ORDER BY sensor_id, bucket
+        LIMIT %s
+    """, (plant_id, start, end, limit)
+
+
+# construit la requête de /anomalies : mesures anormales (anomaly ou cross_sensor_issue) d'une plante, filtrées
+# comme /data, du plus récent au plus ancien, paginées par clé (after) ; parcours de l'index partiel
+# idx_plant_anomalies, qui ne contient que les mesures anormales.
+
+def anomalies_query(plant_id, sensor_id=None, start=None, end=None, limit=50, after=None):
+    base_query = """
+        SELECT id, sensor_id, timestamp, temperature, humidity, anomaly, cross_sensor_issue, reason
+        FROM sensor_data
+        WHERE plant_id = %s AND (anomaly OR cross_sensor_issue)
+    """
+    params = [plant_id]
+
+    if sensor_id:
+        base_query += " AND sensor_id = %s"
+        params.append(sensor_id)
+
+    if start and end:
+        base_query += " AND timestamp BETWEEN %s AND %s"
+        params.extend([start, end])
+
+    if after:
+        base_query += " AND timestamp <= %s AND (timestamp, id) < (%s, %s)"
+        params.extend([after[0], after[0], after[1]])
+
+    base_query += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+    params.append(limit)
+    return base_query, tuple(params)
+
+
+# compteurs de /anomalies, lus dans les agrégats plutôt que dans les mesures (sensor_anomalies_1m), à la minute
+# près sur la plage : nombre de mesures par bit de raison, et raison 0 pour le total des mesures signalées.
+# retourne (requête, paramètres) ; la requête renvoie des lignes (raison, nombre).
+
+def anomaly_counts_query(plant_id, sensor_id=None, start=None, end=None):
+    base_query = "SELECT reason, sum(anomalies) FROM sensor_anomalies_1m WHERE plant_id = %s"
+    params = [plant_id]
+
+    if sensor_id:
+        base_query += " AND sensor_id = %s"
+        params.append(sensor_id)
+
+    if start and end:
+        base_query += " AND bucket BETWEEN date_trunc('minute', %s::timestamptz) AND %s"
+        params.extend([start, end])
+
+    base_query += " GROUP BY reason"
+    return base_query, tuple(params)
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from cache import TTLCache
+
+# registre des capteurs (table "sensors") : une ligne par (plante, capteur), tenue à jour à l'ingestion.
+# un capteur déjà enregistré par ce processus n'est ré-écrit (last_seen) qu'une fois par REGISTRY_REFRESH secondes.
+REGISTRY_REFRESH = float(os.getenv("REGISTRY_REFRESH", "60"))
+REGISTRY_CACHE_TTL = float(os.getenv("REGISTRY_CACHE_TTL", "30"))
+
+# cache des réponses de /plants et /sensors, vidé dès qu'un nouveau capteur apparaît
+registry_cache = TTLCache(REGISTRY_CACHE_TTL)
+
+_registered = {}  # (plant_id, sensor_id) -> (sensor_version, instant du dernier upsert)
+_lock = threading.Lock()
+
+
+def _pending(rows):
+    now = time.monotonic()
+    pending = {}
+    with _lock:
+        for row in rows:
+            sensor_id, sensor_version, plant_id = row[0], row[1], row[2]
+            key = (plant_id, sensor_id)
+            known = _registered.get(key)
+            if known is None or known[0] != sensor_version or now - known[1] >= REGISTRY_REFRESH:
+                pending.setdefault(key, []).append(row)
+    return pending
+
+
+# met à jour le registre pour des lignes de mesures (ordre des colonnes de COPY_COLUMNS),
+# dans la transaction du curseur fourni. retourne les clés écrites, à confirmer après le commit.
+
+def upsert_sensors(cursor, rows):
+    pending = _pending(rows)
+    if not pending:
+        return {}
+    values = [(row[0], row[1], row[2], row[5]) for group in pending.values() for row in group]
+    inserted = execute_values(cursor, """
+        INSERT INTO sensors (sensor_id, sensor_version, plant_id, first_seen, last_seen)
+        SELECT v.sensor_id, max(v.sensor_version), v.plant_id, min(v.ts::timestamptz), max(v.ts::timestamptz)
+        FROM (VALUES %s) AS v (sensor_id, sensor_version, plant_id, ts)
+        GROUP BY v.sensor_id, v.plant_id
+        ON CONFLICT (plant_id, sensor_id) DO UPDATE SET
+            sensor_version = EXCLUDED.sensor_version,
+            first_seen = LEAST(sensors.first_seen, EXCLUDED.first_seen),
+            last_seen = GREATEST(sensors.last_seen, EXCLUDED.last_seen)
+        RETURNING (xmax = 0)
+    """, values, page_size=max(len(values), 1), fetch=True)
+    return {
+        "keys": {key: group[-1][1] for key, group in pending.items()},
+        "new": sum(1 for (is_new,) in inserted if is_new)
+    }
+
+
+# à appeler une fois la transaction validée : mémorise les capteurs écrits et invalide le cache si un capteur est nouveau
+
+def confirm_sensors(result):
+    if not result:
+        return
+    now = time.monotonic()
+    with _lock:
+        for key, sensor_version in result["keys"].items():
+            _registered[key] = (sensor_version, now)
+    if result["new"]:
+        registry_cache.clear()
@@ -1,10 +1,12 @@
 import psycopg2
 from fastapi.testclient import TestClient
+import main
 from main import app
 import base64
 import msgpack
 import random
 import time
+from datetime import datetime, timedelta, timezone
 
 client = TestClient(app)
 
@@ -83,3 +85,61 @@ def test_ingest_and_db_insertion():
     # Fermeture de la connexion
     cursor.close()
     conn.close()
+
+
+def test_ingest_unreadable_body_is_rejected():
+    # mesure base64 envoyée comme du msgpack brut
+    response = client.post("/ingest", content=generate_payload().encode(),
+                           headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 400
+
+
+def test_ingest_batch_rejects_invalid_readings():
+    batch = [
+        {"sensor_id": "FR-001", "sensor_version": "FR-v8", "plant_id": "abc",
+         "temperature": 21.5, "humidity": 60.0, "timestamp": "2024-04-08T14:00:00"},
+        "pas une mesure"
+    ]
+    response = client.post("/ingest/batch", content=msgpack.packb(batch),
+                           headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 0
+    assert [r["status"] for r in body["results"]] == ["rejected", "rejected"]
+
+
+def test_ingest_batch_rejects_bad_timestamps_individually():
+    reading = {"sensor_id": "FR-001", "sensor_version": "FR-v8", "plant_id": 1, "temperature": 21.5, "humidity": 60.0}
+    batch = [dict(reading, timestamp="pas une date"), dict(reading, timestamp=1712584800)]
+    response = client.post("/ingest/batch", content=msgpack.packb(batch),
+                           headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 0
+    assert [r["status"] for r in body["results"]] == ["rejected", "rejected"]
+    assert "timestamp invalide" in body["results"][0]["errors"][0]
+
+
+def test_export_rejected_when_all_slots_taken():
+    taken = 0
+    while main.export_slots.acquire(blocking=False):
+        taken += 1
+    try:
+        response = client.get("/data/export", params={"plant_id": 1})
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+    finally:
+        for _ in range(taken):
+            main.export_slots.release()
+
+
+def test_time_bounds_compare_naive_and_aware():
+    start, end = main.time_bounds(datetime(2024, 4, 8, 12), datetime(2024, 4, 8, 14, tzinfo=timezone.utc))
+    assert end - start == timedelta(hours=2)
+    assert main.time_bounds(None, None) == (None, None)
+
+
+def test_ingest_batch_invalid_body():
+    response = client.post("/ingest/batch", content=msgpack.packb({"plant_id": 1}),
+                           headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 400
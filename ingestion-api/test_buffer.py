@@ -0,0 +1,107 @@
+import asyncio
+
+import psycopg2
+from buffer import WriteBehindBuffer
+
+
+def test_buffer_flushes_in_batches_and_drains():
+    written = []
+
+    async def scenario():
+        buffer = WriteBehindBuffer(max_rows=100, batch_size=10, interval=0.05, flush_func=written.append)
+        buffer.start()
+        assert buffer.offer([("FR-001", i) for i in range(25)])
+        await asyncio.sleep(0.2)
+        assert buffer.offer([("FR-001", 99)])
+        await buffer.drain()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert [len(batch) for batch in written][:2] == [10, 10]
+    assert sum(len(batch) for batch in written) == 26
+    assert stats["flushed"] == 26 and stats["depth"] == 0 and stats["dropped"] == 0
+
+
+def test_buffer_rejects_when_full():
+    async def scenario():
+        buffer = WriteBehindBuffer(max_rows=5, batch_size=10, interval=10, flush_func=lambda rows: None)
+        assert buffer.offer([1, 2, 3])
+        assert not buffer.offer([4, 5, 6])
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["depth"] == 3 and stats["rejected"] == 3
+
+
+def test_buffer_reports_written_batches():
+    published = []
+
+    async def scenario():
+        buffer = WriteBehindBuffer(max_rows=100, batch_size=10, interval=10, flush_func=lambda rows: None,
+                                   on_flush=published.append)
+        buffer.offer([1, 2, 3])
+        await buffer.drain()
+
+    asyncio.run(scenario())
+    assert published == [[1, 2, 3]]
+
+
+def test_buffer_keeps_flushing_when_on_flush_fails():
+    written = []
+
+    def publish(rows):
+        raise RuntimeError("diffusion impossible")
+
+    async def scenario():
+        buffer = WriteBehindBuffer(max_rows=100, batch_size=10, interval=0.05, flush_func=written.append,
+                                   on_flush=publish)
+        buffer.start()
+        buffer.offer([1, 2])
+        await asyncio.sleep(0.2)
+        buffer.offer([3])
+        await asyncio.sleep(0.2)
+        assert not buffer._task.done()
+        await buffer.drain()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert written == [[1, 2], [3]]
+    assert stats["flushed"] == 3 and stats["depth"] == 0
+
+
+def test_buffer_sets_aside_invalid_rows():
+    written = []
+
+    def copy(rows):
+        if "bad" in rows:
+            raise psycopg2.DataError("invalid input syntax for type timestamp")
+        written.extend(rows)
+
+    async def scenario():
+        buffer = WriteBehindBuffer(max_rows=100, batch_size=10, interval=10, flush_func=copy)
+        buffer.offer([1, 2, "bad", 4, 5, 6, 7])
+        await buffer.drain()
+        return buffer.stats()
+
+    stats = asyncio.run(scenario())
+    assert written == [1, 2, 4, 5, 6, 7]
+    assert stats["invalid"] == 1 and stats["depth"] == 0 and stats["flushed"] == 6
+
+
+def test_buffer_requeues_unwritten_rows_on_failure():
+    def copy(rows):
+        if "bad" in rows:
+            raise psycopg2.DataError("invalid input")
+        if rows == [3, 4]:
+            raise psycopg2.OperationalError("connexion perdue")
+
+    async def scenario():
+        buffer = WriteBehindBuffer(max_rows=100, batch_size=10, interval=10, flush_func=copy)
+        buffer.offer(["bad", 2, 3, 4])
+        assert not await buffer._flush_once()
+        return list(buffer._rows), buffer.stats()
+
+    rows, stats = asyncio.run(scenario())
+    # ["bad", 2] -> ["bad"] écarté, [2] écrit, puis [3, 4] en échec : remis en file
+    assert rows == [3, 4]
+    assert stats["flushed"] == 1 and stats["invalid"] == 1 and stats["failures"] == 1
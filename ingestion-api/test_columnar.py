@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from columnar import ARROW_TYPE, MSGPACK_TYPE, negotiate, pack_arrow, pack_msgpack, to_columns, unpack_msgpack
+
+START = datetime(2024, 4, 8, 12, 0, 0, 123456, tzinfo=timezone.utc)
+POSITIONS = {"sensor_id": 0, "timestamp": 1, "temperature": 2, "anomaly": 3}
+ROWS = [
+    ("S-2", START, 21.5, False),
+    ("S-1", START + timedelta(seconds=5), 22.0, True),
+    ("S-2", START + timedelta(seconds=10), 22.5, False),
+]
+
+
+def test_negotiate_accept_header():
+    assert negotiate(None) is None
+    assert negotiate("application/json") is None
+    assert negotiate("application/x-msgpack, application/json;q=0.5") == MSGPACK_TYPE
+    assert negotiate(ARROW_TYPE) == ARROW_TYPE
+
+
+def test_to_columns_types_and_epoch_ms():
+    columns = to_columns(ROWS, POSITIONS)
+
+    assert columns["timestamp"].dtype == np.int64
+    assert columns["timestamp"][0] == 1712577600123
+    assert columns["temperature"].dtype == np.float64
+    assert list(columns["anomaly"]) == [False, True, False]
+
+
+def test_msgpack_round_trip_with_dictionary():
+    payload = pack_msgpack({"resolution": "raw", "next_cursor": None}, to_columns(ROWS, POSITIONS))
+
+    meta, columns = unpack_msgpack(payload)
+
+    assert meta == {"resolution": "raw", "next_cursor": None, "rows": 3}
+    assert list(columns["sensor_id"]) == ["S-2", "S-1", "S-2"]
+    assert list(columns["temperature"]) == [21.5, 22.0, 22.5]
+    assert columns["timestamp"][2] - columns["timestamp"][0] == 10_000
+
+
+def test_msgpack_empty_result():
+    meta, columns = unpack_msgpack(pack_msgpack({}, to_columns([], POSITIONS)))
+
+    assert meta["rows"] == 0
+    assert all(len(values) == 0 for values in columns.values())
+
+
+def test_arrow_stream_round_trip():
+    pa = pytest.importorskip("pyarrow")
+
+    table = pa.ipc.open_stream(pack_arrow({"last_id": 42}, to_columns(ROWS, POSITIONS))).read_all()
+
+    assert table.schema.metadata[b"last_id"] == b"42"
+    assert table.column("sensor_id").to_pylist() == ["S-2", "S-1", "S-2"]
+    assert table.column("timestamp").type == pa.int64()
@@ -0,0 +1,95 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from psycopg2 import extensions
+
+from db import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.info = SimpleNamespace(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+# ouverture lente : élargit la fenêtre entre deux emprunts concurrents
+def slow_connect(dsn):
+    time.sleep(0.01)
+    return FakeConnection()
+
+
+def test_exhausted_pool_times_out():
+    pool = ConnectionPool("fake", 0, 2, connect=lambda dsn: FakeConnection())
+    held = [pool.getconn(), pool.getconn()]
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    pool.putconn(held.pop())
+    assert pool.getconn(timeout=0.05) is not None
+    assert pool.stats()["in_use"] == 2 and pool.stats()["created"] == 2
+
+
+def test_broken_connection_is_replaced():
+    pool = ConnectionPool("fake", 1, 1, connect=lambda dsn: FakeConnection())
+    conn = pool.getconn()
+    conn.closed = 2
+    pool.putconn(conn)
+    assert pool.stats()["size"] == 0
+    replacement = pool.getconn(timeout=0.05)
+    assert replacement is not conn and not replacement.closed
+    assert pool.stats()["created"] == 2
+
+
+def test_connection_in_unknown_state_is_discarded():
+    pool = ConnectionPool("fake", 0, 1, connect=lambda dsn: FakeConnection())
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(conn)
+    assert conn.closed and pool.stats()["size"] == 0
+
+
+def test_concurrent_checkouts_respect_max_size():
+    pool = ConnectionPool("fake", 0, 3, connect=slow_connect)
+    lock = threading.Lock()
+    in_use = [0, 0]  # courant, maximum
+
+    def worker():
+        conn = pool.getconn(timeout=5)
+        with lock:
+            in_use[0] += 1
+            in_use[1] = max(in_use)
+        time.sleep(0.01)
+        with lock:
+            in_use[0] -= 1
+        pool.putconn(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert in_use[1] <= 3
+    assert stats["size"] == stats["created"] == 3
+    assert stats["idle"] == 3 and stats["waiting"] == 0
+
+
+def test_failed_minconn_opening_closes_opened_connections():
+    opened = []
+
+    def connect(dsn):
+        if len(opened) == 2:
+            raise RuntimeError("base indisponible")
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    with pytest.raises(RuntimeError):
+        ConnectionPool("fake", 3, 5, connect=connect)
+    assert all(conn.closed for conn in opened)
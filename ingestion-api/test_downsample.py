@@ -0,0 +1,50 @@
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+from downsample import downsample_rows, lttb
+
+START = datetime(2024, 4, 8, tzinfo=timezone.utc)
+
+
+def test_lttb_bounds_points_and_keeps_spike():
+    x = np.arange(10_000, dtype=float)
+    temperature = np.full(10_000, 22.0)
+    temperature[4321] = 40.0
+    humidity = np.full(10_000, 60.0)
+
+    indices = lttb(x, [temperature, humidity], 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 9_999
+    assert np.all(np.diff(indices) > 0)
+    assert 4321 in indices
+
+
+def test_lttb_prefers_flagged_points():
+    x = np.arange(1_000, dtype=float)
+    temperature = np.sin(x / 10)
+    keep = np.zeros(1_000, dtype=bool)
+    keep[[123, 517]] = True
+
+    indices = lttb(x, [temperature], 50, keep)
+
+    assert {123, 517} <= set(indices)
+
+
+def test_lttb_short_series_unchanged():
+    assert list(lttb([0, 1, 2], [[1, 2, 3]], 10)) == [0, 1, 2]
+
+
+def test_downsample_rows_per_sensor_keeps_order():
+    rows = [
+        (sensor_id, START - timedelta(seconds=10 * i), 20.0 + (i % 7), 50.0, False)
+        for i in range(500)
+        for sensor_id in ("S-1", "S-2")
+    ]
+
+    kept = downsample_rows(rows, 20, sensor=0, timestamp=1, values=(2, 3), flag=4)
+
+    assert sum(row[0] == "S-1" for row in kept) == 20
+    assert sum(row[0] == "S-2" for row in kept) == 20
+    positions = [rows.index(row) for row in kept]
+    assert positions == sorted(positions)
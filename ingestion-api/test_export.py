@@ -0,0 +1,43 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import msgpack
+
+from export import csv_chunk, export_record, msgpack_chunk, ndjson_chunk
+
+ROWS = [
+    (3, "S-3-1", datetime(2024, 4, 8, 14, 0, tzinfo=timezone.utc), Decimal("22.5"), Decimal("55.0"), False, False),
+    (3, "S-3-2", datetime(2024, 4, 8, 14, 0, 10, tzinfo=timezone.utc), Decimal("36.1"), Decimal("54.0"), True, True),
+]
+
+
+def records():
+    return [export_record(row) for row in ROWS]
+
+
+def test_ndjson_chunks_concatenate():
+    data = ndjson_chunk(records()[:1], True) + ndjson_chunk(records()[1:], False)
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert lines == records()
+    assert lines[1]["temperature"] == 36.1 and lines[1]["anomaly"] is True
+
+
+def test_csv_header_only_in_first_chunk():
+    data = csv_chunk(records()[:1], True) + csv_chunk(records()[1:], False)
+    rows = list(csv.DictReader(io.StringIO(data.decode())))
+    assert [row["sensor_id"] for row in rows] == ["S-3-1", "S-3-2"]
+    assert rows[0]["timestamp"] == "2024-04-08T14:00:00+00:00"
+
+
+def test_empty_csv_export_has_header():
+    assert csv_chunk([], True).decode().startswith("plant_id,sensor_id,timestamp")
+
+
+def test_msgpack_stream():
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(msgpack_chunk(records()[:1], True))
+    unpacker.feed(msgpack_chunk(records()[1:], False))
+    assert list(unpacker) == records()
@@ -0,0 +1,12 @@
+from ingest_stats import IngestStats
+
+
+def test_stats_aggregate_and_reset():
+    stats = IngestStats()
+    stats.record_accepted(1, 0)
+    stats.record_accepted(1, 2)
+    stats.record_accepted(2, 1)
+    stats.record_rejected(3)
+
+    assert stats.snapshot(reset=True) == {"accepted": 3, "rejected": 3, "alerts_by_plant": {"1": 2, "2": 1}}
+    assert stats.snapshot() == {"accepted": 0, "rejected": 0, "alerts_by_plant": {}}
@@ -0,0 +1,38 @@
+import base64
+import msgpack
+import pytest
+from parser import decode_sensor_batch, decode_sensor_reading, unpack_payload
+
+READINGS = [
+    {"sensor_id": "FR-001", "sensor_version": "FR-v8", "plant_id": 1,
+     "temperature": 21.5, "humidity": 60.0, "timestamp": "2024-04-08T14:00:00"},
+    {"sensor_id": "EN-001", "sensor_version": "EN-v2", "plant_id": 1,
+     "temperature": 22.0, "humidity": 58.0, "timestamp": "2024-04-08T14:00:05"},
+]
+
+
+def test_decode_batch_raw():
+    assert decode_sensor_batch(msgpack.packb(READINGS), base64_encoded=False) == READINGS
+
+
+def test_decode_batch_base64():
+    assert decode_sensor_batch(base64.b64encode(msgpack.packb(READINGS))) == READINGS
+
+
+def test_decode_batch_not_a_list():
+    with pytest.raises(ValueError):
+        decode_sensor_batch(msgpack.packb(READINGS[0]), base64_encoded=False)
+
+
+def test_unpack_payload_raw_and_base64():
+    packed = msgpack.packb(READINGS[0])
+    assert unpack_payload(packed, base64_encoded=False) == READINGS[0]
+    assert unpack_payload(base64.b64encode(packed)) == READINGS[0]
+
+
+def test_decode_reading_rejects_unreadable_bodies():
+    packed = msgpack.packb(READINGS[0])
+    assert decode_sensor_reading(packed, base64_encoded=False) == READINGS[0]
+    for body, base64_encoded in ((packed[:-3], False), (base64.b64encode(packed), False), (b"%%%", True)):
+        with pytest.raises(ValueError):
+            decode_sensor_reading(body, base64_encoded)
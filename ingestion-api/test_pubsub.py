@@ -0,0 +1,53 @@
+import asyncio
+from datetime import datetime, timezone
+
+from pubsub import Broker
+
+
+def test_broker_filters_by_plant():
+    async def scenario():
+        broker = Broker(queue_size=10)
+        plant_1 = broker.subscribe([1])
+        every_plant = broker.subscribe()
+        broker.publish("reading", 1, {"plant_id": 1})
+        broker.publish("reading", 2, {"plant_id": 2})
+        broker.unsubscribe(plant_1)
+        broker.publish("reading", 1, {"plant_id": 1, "late": True})
+        return plant_1.queue.qsize(), every_plant.queue.qsize(), broker.stats()
+
+    plant_1, every_plant, stats = asyncio.run(scenario())
+    assert (plant_1, every_plant) == (1, 3)
+    assert stats == {"subscribers": 1, "published": 3, "dropped": 0}
+
+
+def test_slow_subscriber_is_marked_lagged():
+    async def scenario():
+        broker = Broker(queue_size=2)
+        subscription = broker.subscribe([1])
+        for i in range(5):
+            broker.publish("reading", 1, {"i": i})
+        lagged = subscription.lagged
+        subscription.reset()
+        return lagged, subscription, broker.stats()
+
+    lagged, subscription, stats = asyncio.run(scenario())
+    assert lagged and stats["dropped"] == 3
+    assert not subscription.lagged and subscription.queue.empty()
+
+
+def test_publish_rows_serializes_timestamps():
+    import pubsub
+
+    async def scenario():
+        subscription = pubsub.broker.subscribe([3])
+        try:
+            timestamp = datetime(2024, 4, 8, 14, 0, tzinfo=timezone.utc)
+            pubsub.publish_rows([("S-3-1", "FR-v8", 3, 22.5, 55.0, timestamp, False)],
+                                ("sensor_id", "sensor_version", "plant_id", "temperature", "humidity", "timestamp", "anomaly"))
+            return subscription.queue.get_nowait()
+        finally:
+            pubsub.broker.unsubscribe(subscription)
+
+    event, data = asyncio.run(scenario())
+    assert event == "reading"
+    assert data["timestamp"] == "2024-04-08T14:00:00+00:00" and data["plant_id"] == 3
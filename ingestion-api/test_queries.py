@@ -0,0 +1,47 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from queries import anomalies_query, anomaly_counts_query, decode_cursor, encode_cursor, pick_resolution, rollup_query
+
+END = datetime(2024, 4, 8, 14, 0)
+
+
+def test_pick_resolution_auto():
+    assert pick_resolution("auto") == "raw"
+    assert pick_resolution("auto", END - timedelta(hours=1), END) == "raw"
+    assert pick_resolution("auto", END - timedelta(hours=24), END) == "1m"
+    assert pick_resolution("auto", END - timedelta(days=7), END) == "1h"
+
+
+def test_pick_resolution_explicit():
+    assert pick_resolution("1h", END - timedelta(hours=1), END) == "1h"
+
+
+def test_rollup_query_is_limited():
+    query, params = rollup_query("1h", 1, limit=1001)
+    assert query.rstrip().endswith("LIMIT %s")
+    assert params == (1, 1001)
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 4, 8, 14, 0, 10, 123456, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("pas-un-curseur")
+
+
+def test_anomalies_query_filters_and_pages():
+    after = (END - timedelta(hours=1), 42)
+    query, params = anomalies_query(3, "S-1", END - timedelta(days=1), END, 50, after)
+
+    assert "(anomaly OR cross_sensor_issue)" in query
+    assert params == (3, "S-1", END - timedelta(days=1), END, after[0], after[0], 42, 50)
+
+
+def test_anomaly_counts_query_reads_reason_rollup_only():
+    query, params = anomaly_counts_query(3, None, END - timedelta(days=1), END)
+
+    assert "sensor_anomalies_1m" in query and "sensor_data_1m" not in query
+    assert params == (3, END - timedelta(days=1), END)
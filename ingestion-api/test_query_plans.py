@@ -0,0 +1,172 @@
+# test de non-régression des plans d'exécution : charge le schéma de database/ dans un schéma temporaire,
+# le remplit avec un historique synthétique de 7 jours, puis vérifie avec EXPLAIN qu'aucune requête
+# des endpoints de lecture ne fait de parcours séquentiel sur une partition volumineuse.
+#
+# nécessite une base PostgreSQL de test : TEST_DATABASE_URL=postgresql://... pytest test_query_plans.py
+
+import os
+import json
+import pytest
+import psycopg2
+from datetime import datetime, timedelta, timezone
+
+from queries import LAST_ID_QUERY, PLANTS_QUERY, SENSORS_QUERY, anomalies_query, anomaly_counts_query, data_query, \
+    export_query, plant_data_query, plant_rollup_query, rollup_query, since_query
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "database")
+SCHEMA = "plan_test"
+# au-delà de ce nombre de lignes, un parcours séquentiel de la partition est considéré comme une régression
+LARGE_RELATION_ROWS = 1000
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL non défini")
+
+
+@pytest.fixture(scope="module")
+def cursor():
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}")
+    for script in ("init.sql", "functions.sql"):
+        with open(os.path.join(DATABASE_DIR, script), encoding="utf-8") as f:
+            cursor.execute(f.read())
+    cursor.execute("SELECT create_sensor_data_partitions(1, 8)")
+    # 20 plantes x 4 capteurs, une mesure toutes les 2 minutes pendant 7 jours, insérées dans l'ordre chronologique
+    cursor.execute("""
+        INSERT INTO sensor_data (sensor_id, sensor_version, plant_id, temperature, humidity, timestamp)
+        SELECT 'S-' || p || '-' || s, 'FR-v8', p, 20 + random() * 10, 50 + random() * 20, t
+        FROM generate_series(now() - INTERVAL '7 days', now(), INTERVAL '2 minutes') AS t,
+             generate_series(1, 20) AS p,
+             generate_series(1, 4) AS s
+        ORDER BY t
+    """)
+    # une mesure sur 500 marquée anormale (seuil haut de température)
+    cursor.execute("UPDATE sensor_data SET anomaly = TRUE, reason = 1 WHERE id % 500 = 0")
+    cursor.execute("""
+        INSERT INTO sensors (sensor_id, sensor_version, plant_id, first_seen, last_seen)
+        SELECT sensor_id, max(sensor_version), plant_id, min(timestamp), max(timestamp)
+        FROM sensor_data GROUP BY plant_id, sensor_id
+    """)
+    cursor.execute("ANALYZE sensor_data")
+    cursor.execute("ANALYZE sensors")
+    cursor.execute("ANALYZE sensor_data_1m")
+    cursor.execute("ANALYZE sensor_data_1h")
+    cursor.execute("ANALYZE sensor_anomalies_1m")
+    yield cursor
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+
+
+def large_relations(cursor):
+    cursor.execute("""
+        SELECT c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'r' AND c.reltuples > %s
+    """, (SCHEMA, LARGE_RELATION_ROWS))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def seq_scans(plan):
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            yield node["Relation Name"]
+        nodes.extend(node.get("Plans", []))
+
+
+def explain(cursor, query, params=None):
+    cursor.execute("EXPLAIN (FORMAT JSON) " + cursor.mogrify(query, params).decode())
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+NOW = datetime.now(timezone.utc)
+
+ENDPOINT_QUERIES = {
+    "plants": lambda: (PLANTS_QUERY, None),
+    "sensors": lambda: (SENSORS_QUERY, (3,)),
+    "data": lambda: data_query(3),
+    "data_sensor": lambda: data_query(3, "S-3-2"),
+    "data_range": lambda: data_query(3, None, NOW - timedelta(days=1), NOW),
+    "data_sensor_range_24h": lambda: data_query(3, "S-3-2", NOW - timedelta(days=1), NOW),
+    "data_sensor_range_7d": lambda: data_query(3, "S-3-2", NOW - timedelta(days=7), NOW),
+    "data_1m_sensor_range_24h": lambda: rollup_query("1m", 3, "S-3-2", NOW - timedelta(days=1), NOW, 200001),
+    "data_1m_range_24h": lambda: rollup_query("1m", 3, None, NOW - timedelta(days=1), NOW, 200001),
+    "data_1h_range_7d": lambda: rollup_query("1h", 3, None, NOW - timedelta(days=7), NOW, 200001),
+    "data_raw_sensor_range_7d": lambda: data_query(3, "S-3-2", NOW - timedelta(days=7), NOW, 200000),
+    "data_sensor_page": lambda: data_query(3, "S-3-2", None, None, 100, (NOW - timedelta(hours=5), 123456)),
+    "data_page_range_7d": lambda: data_query(3, None, NOW - timedelta(days=7), NOW, 100, (NOW - timedelta(days=1), 123456)),
+    "export_sensor_range_7d": lambda: export_query(3, "S-3-2", NOW - timedelta(days=7), NOW),
+    "export_range_7d": lambda: export_query(3, None, NOW - timedelta(days=7), NOW),
+    "data_since": lambda: since_query(3, "S-3-2", 1_000_000, None, None, 10000),
+    "data_since_plant": lambda: since_query(3, None, 1_000_000, None, None, 10000),
+    "last_id": lambda: (LAST_ID_QUERY, (3,)),
+    "plant_raw_2h": lambda: plant_data_query(3, NOW - timedelta(hours=2), NOW, 200000),
+    "plant_1m_24h": lambda: plant_rollup_query("1m", 3, NOW - timedelta(days=1), NOW, 200000),
+    "plant_1h_7d": lambda: plant_rollup_query("1h", 3, NOW - timedelta(days=7), NOW, 200000),
+    "anomalies_range_7d": lambda: anomalies_query(3, None, NOW - timedelta(days=7), NOW),
+    "anomalies_sensor_range_7d": lambda: anomalies_query(3, "S-3-2", NOW - timedelta(days=7), NOW),
+    "anomalies_page": lambda: anomalies_query(3, None, None, None, 50, (NOW - timedelta(days=1), 123456)),
+    "anomaly_counts_range_7d": lambda: anomaly_counts_query(3, None, NOW - timedelta(days=7), NOW),
+    "anomaly_counts_sensor_range_24h": lambda: anomaly_counts_query(3, "S-3-2", NOW - timedelta(days=1), NOW),
+}
+
+
+@pytest.mark.parametrize("name", sorted(ENDPOINT_QUERIES))
+def test_endpoint_queries_avoid_seq_scans(cursor, name):
+    query, params = ENDPOINT_QUERIES[name]()
+    large = large_relations(cursor)
+    assert large, "jeu de données synthétique vide"
+    scanned = [relation for relation in seq_scans(explain(cursor, query, params)) if relation in large]
+    assert scanned == [], f"{name} : parcours séquentiel sur {scanned}"
+
+
+# l'export est lu par un curseur serveur : le plan du curseur (optimisé pour les premières lignes) doit produire
+# les lignes dans l'ordre sans tri complet (un tri incrémental, borné aux lignes de même horodatage, est accepté)
+STREAMED_QUERIES = ("export_sensor_range_7d", "export_range_7d")
+
+
+def node_types(plan):
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        yield node["Node Type"]
+        nodes.extend(node.get("Plans", []))
+
+
+@pytest.mark.parametrize("name", STREAMED_QUERIES)
+def test_export_queries_avoid_full_sort(cursor, name):
+    query, params = ENDPOINT_QUERIES[name]()
+    cursor.execute("BEGIN")
+    try:
+        plan = explain(cursor, "DECLARE export_plan CURSOR FOR " + query, params)
+    finally:
+        cursor.execute("ROLLBACK")
+    assert "Sort" not in set(node_types(plan)), f"{name} : tri complet du résultat"
+
+
+# /anomalies ne lit que l'index partiel des mesures anormales (ou ses index de partition), sans parcourir toutes
+# les mesures de la plage
+def index_names(plan):
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            yield node["Index Name"]
+        nodes.extend(node.get("Plans", []))
+
+
+@pytest.mark.parametrize("name", ("anomalies_range_7d", "anomalies_sensor_range_7d", "anomalies_page"))
+def test_anomalies_queries_use_partial_index(cursor, name):
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'idx_plant_anomalies'::regclass
+    """)
+    partial = {row[0] for row in cursor.fetchall()} | {"idx_plant_anomalies"}
+    query, params = ENDPOINT_QUERIES[name]()
+    used = set(index_names(explain(cursor, query, params)))
+    assert used and used <= partial, f"{name} : index utilisés {used}"
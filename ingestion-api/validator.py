@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime, timezone
 
 # permet juste de s'assurer que le dict de données reçu respecte certains critères de validité qu'on attend pour un enregistrement de capteur.
 
@@ -21,9 +22,27 @@ def validate_sensor_payload(data: dict) -> (bool, list):
     if "timestamp" not in data:
         errors.append("timestamp manquant")
 
-    logging.info(f"Validation result: {len(errors) == 0}, errors: {errors}")
+    # niveau DEBUG et formatage différé : ne coûte rien quand le niveau est désactivé
+    logging.debug("Validation result: %s, errors: %s", len(errors) == 0, errors)
     return (len(errors) == 0, errors)
 
+# convertit l'horodatage reçu (chaîne ISO 8601, ou Timestamp msgpack) en datetime avec fuseau ; sans fuseau,
+# l'heure est considérée UTC. lève ValueError sur toute autre valeur : la mesure est rejetée avant d'atteindre SQL.
+
+def parse_timestamp(value) -> datetime:
+    if hasattr(value, "to_datetime"):
+        value = value.to_datetime()
+    elif isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            raise ValueError(f"timestamp invalide ({value!r}), format ISO 8601 attendu") from None
+    if not isinstance(value, datetime):
+        raise ValueError(f"timestamp invalide ({value!r}), format ISO 8601 attendu")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
 # permet de convertir une valeur de mesure sous forme str en float.
 
 def convert_measurements(measure: str) -> float:
@@ -39,6 +58,6 @@ def convert_measurements(measure: str) -> float:
         else:
             return float(measure)
     except Exception as e:
-        logging.error(f"Error converting measurement: {measure}, error: {e}")
+        logging.error("Error converting measurement: %s, error: %s", measure, e)
         return None
 
@@ -10,6 +10,8 @@ API_URL = os.getenv("SERVER_URL", "http://ingestion-api:8000/ingest")
 SENSOR_ID = os.getenv("SENSOR_ID", "FR-001")
 PLANT_ID = int(os.getenv("PLANT_ID", "1").replace("PLANT-", ""))
 SENSOR_VERSION = os.getenv("SENSOR_VERSION", "FR-v8")
+# "binary" : msgpack brut ; "base64" : forme historique des firmwares FR-v8/EN-v2
+PAYLOAD_ENCODING = os.getenv("PAYLOAD_ENCODING", "base64")
 
 def generate_fake_measurements():
     temperature = round(random.normalvariate(25, 3), 2)
@@ -33,19 +35,29 @@ def generate_payload():
         "humidity": humidity
     }
 
-def encode_payload(payload):
+def encode_payload(payload, binary=False):
+    if binary:
+        return msgpack.packb(payload)
     return base64.b64encode(msgpack.packb(payload)).decode('utf-8')
 
+def build_headers(binary=False):
+    headers = {
+        "Content-Type": "application/msgpack",
+        "X-Sensor-Version": SENSOR_VERSION
+    }
+    if not binary:
+        headers["Content-Transfer-Encoding"] = "base64"
+    return headers
+
 if __name__ == "__main__":
-    print(f"🚀 Capteur {SENSOR_ID} (v{SENSOR_VERSION}) actif pour plante {PLANT_ID}")
+    binary = PAYLOAD_ENCODING == "binary"
+    headers = build_headers(binary)
+    print(f"🚀 Capteur {SENSOR_ID} (v{SENSOR_VERSION}) actif pour plante {PLANT_ID} ({PAYLOAD_ENCODING})")
     while True:
         try:
             payload = generate_payload()
-            encoded = encode_payload(payload)
-            response = requests.post(API_URL, data=encoded, headers={
-                "Content-Type": "application/msgpack",
-                "X-Sensor-Version": SENSOR_VERSION
-            })
+            encoded = encode_payload(payload, binary)
+            response = requests.post(API_URL, data=encoded, headers=headers)
             print(f"📤 Données envoyées | Statut: {response.status_code}")
         except Exception as e:
             print(f"❌ Erreur d'envoi : {str(e)}")
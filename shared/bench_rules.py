@@ -0,0 +1,68 @@
+# mesure le débit de l'évaluation vectorisée des règles sur un lot de ROWS mesures (1 million par défaut),
+# comparé à une évaluation mesure par mesure en Python des seuils seuls.
+#
+# usage (depuis la racine du dépôt) : python -m shared.bench_rules
+
+import os
+import time
+
+import numpy as np
+
+from shared.rules import RuleSet, Thresholds
+
+ROWS = int(os.getenv("ROWS", "1000000"))
+SENSORS = int(os.getenv("SENSORS", "1000"))
+
+
+def build_batch(rows, sensors, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "temperature": rng.normal(25, 3, rows),
+        "humidity": rng.normal(60, 10, rows),
+        "plant_ids": rng.integers(1, 51, rows),
+        "sensor_versions": np.where(rng.random(rows) < 0.5, "FR-v8", "US-v2"),
+        "sensor_ids": rng.integers(0, sensors, rows),
+        "timestamps": np.sort(rng.uniform(0, 86400, rows)),
+        "temp_mean": np.full(rows, 25.0),
+        "temp_std": np.full(rows, 3.0),
+        "hum_mean": np.full(rows, 60.0),
+        "hum_std": np.full(rows, 10.0),
+    }
+
+
+def python_loop(rules, batch):
+    flagged = 0
+    for plant_id, version, temp, hum in zip(batch["plant_ids"], batch["sensor_versions"],
+                                            batch["temperature"], batch["humidity"]):
+        limits = rules.thresholds(plant_id, version)
+        if not (limits.temp_min <= temp <= limits.temp_max and limits.hum_min <= hum <= limits.hum_max):
+            flagged += 1
+    return flagged
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def main():
+    rules = RuleSet(
+        Thresholds(temp_rate=20.0, hum_rate=60.0),
+        [(7, None, Thresholds(temp_max=30.0)), (None, "US-v2", Thresholds(hum_max=90.0))],
+    )
+    batch = build_batch(ROWS, SENSORS)
+
+    (mask, _), elapsed = timed(rules.evaluate, batch["temperature"], batch["humidity"],
+                               plant_ids=batch["plant_ids"], sensor_versions=batch["sensor_versions"])
+    print(f"seuils vectorisés        : {ROWS / elapsed:>12,.0f} mesures/s ({elapsed * 1000:.0f} ms, {mask.sum()} anomalies)")
+
+    (mask, _), elapsed = timed(rules.evaluate, **batch)
+    print(f"toutes règles vectorisées: {ROWS / elapsed:>12,.0f} mesures/s ({elapsed * 1000:.0f} ms, {mask.sum()} anomalies)")
+
+    flagged, elapsed = timed(python_loop, rules, batch)
+    print(f"seuils, boucle Python    : {ROWS / elapsed:>12,.0f} mesures/s ({elapsed * 1000:.0f} ms, {flagged} anomalies)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# règles d'anomalie communes à l'API d'ingestion, au détecteur et au dashboard.
+#
+# un lot de mesures est évalué en une passe vectorisée (tableaux NumPy) : seuils min/max par plante et par
+# version de capteur, vitesse de variation entre deux mesures consécutives d'un même capteur, et écart en
+# nombre d'écarts-types (z-score) par rapport à une référence fournie par l'appelant.
+# le résultat est un masque booléen et un code de raison par mesure (combinaison des bits ci-dessous).
+# le code est enregistré avec la mesure (sensor_data.reason) et compté par bit (table sensor_anomalies_1m).
+#
+# les seuils par défaut peuvent être remplacés par plante et/ou par version de capteur avec un fichier JSON
+# (RULES_FILE) :
+#   {"default": {"temp_max": 35},
+#    "overrides": [{"plant_id": 3, "temp_max": 30}, {"sensor_version": "US-v2", "hum_max": 90}]}
+
+import json
+import os
+from dataclasses import dataclass, fields, replace
+from typing import Optional
+
+import numpy as np
+
+RULES_FILE = os.getenv("RULES_FILE")
+
+# codes de raison
+TEMP_HIGH = 1
+TEMP_LOW = 2
+HUM_HIGH = 4
+HUM_LOW = 8
+TEMP_RATE = 16
+HUM_RATE = 32
+TEMP_DRIFT = 64
+HUM_DRIFT = 128
+# écart entre deux capteurs d'une même plante, positionné par le détecteur (pas par evaluate)
+CROSS_SENSOR = 256
+
+REASON_LABELS = {
+    TEMP_HIGH: "Température critique ({temperature:.1f}°C)",
+    TEMP_LOW: "Température basse ({temperature:.1f}°C)",
+    HUM_HIGH: "Humidité élevée ({humidity:.1f}%)",
+    HUM_LOW: "Humidité basse ({humidity:.1f}%)",
+    TEMP_RATE: "Variation de température trop rapide",
+    HUM_RATE: "Variation d'humidité trop rapide",
+    TEMP_DRIFT: "Dérive de température",
+    HUM_DRIFT: "Dérive d'humidité",
+    CROSS_SENSOR: "Écart inter-capteurs",
+}
+
+# noms courts des bits, utilisés par l'API (/anomalies) pour les compteurs par raison
+REASON_NAMES = {
+    TEMP_HIGH: "temp_high",
+    TEMP_LOW: "temp_low",
+    HUM_HIGH: "hum_high",
+    HUM_LOW: "hum_low",
+    TEMP_RATE: "temp_rate",
+    HUM_RATE: "hum_rate",
+    TEMP_DRIFT: "temp_drift",
+    HUM_DRIFT: "hum_drift",
+    CROSS_SENSOR: "cross_sensor",
+}
+
+# intitulés des bits sans valeur mesurée, pour les compteurs par raison (dashboard)
+REASON_TITLES = {
+    TEMP_HIGH: "Température critique",
+    TEMP_LOW: "Température basse",
+    HUM_HIGH: "Humidité élevée",
+    HUM_LOW: "Humidité basse",
+    TEMP_RATE: "Variation de température",
+    HUM_RATE: "Variation d'humidité",
+    TEMP_DRIFT: "Dérive de température",
+    HUM_DRIFT: "Dérive d'humidité",
+    CROSS_SENSOR: "Écart inter-capteurs",
+}
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    temp_min: float = 10.0
+    temp_max: float = 35.0
+    hum_min: float = 25.0
+    hum_max: float = 85.0
+    # variation maximale par minute entre deux mesures consécutives d'un capteur (None = pas de contrôle)
+    temp_rate: Optional[float] = None
+    hum_rate: Optional[float] = None
+    # écart maximal à la référence, en écarts-types
+    zscore: float = 3.0
+
+
+THRESHOLD_FIELDS = [field.name for field in fields(Thresholds)]
+
+
+class RuleSet:
+    def __init__(self, default=Thresholds(), overrides=()):
+        self.default = default
+        # (plant_id ou None, sensor_version ou None, seuils), du moins au plus spécifique : le dernier applicable l'emporte
+        self.overrides = sorted(overrides, key=lambda o: (o[0] is not None, o[1] is not None))
+
+    @classmethod
+    def from_config(cls, config):
+        default = replace(Thresholds(), **config.get("default", {}))
+        overrides = []
+        for entry in config.get("overrides", []):
+            entry = dict(entry)
+            plant_id = entry.pop("plant_id", None)
+            sensor_version = entry.pop("sensor_version", None)
+            overrides.append((plant_id, sensor_version, replace(default, **entry)))
+        return cls(default, overrides)
+
+    # seuils d'une seule mesure
+    def thresholds(self, plant_id=None, sensor_version=None):
+        result = self.default
+        for override_plant, override_version, thresholds in self.overrides:
+            if override_plant in (None, plant_id) and override_version in (None, sensor_version):
+                result = thresholds
+        return result
+
+    # seuils ligne à ligne : {champ: tableau}, NaN pour un contrôle désactivé
+    def threshold_arrays(self, n, plant_ids=None, sensor_versions=None):
+        arrays = {name: np.full(n, _value(getattr(self.default, name))) for name in THRESHOLD_FIELDS}
+        if plant_ids is not None:
+            plant_ids = np.asarray(plant_ids)
+        if sensor_versions is not None:
+            sensor_versions = np.asarray(sensor_versions)
+        for override_plant, override_version, thresholds in self.overrides:
+            rows = np.ones(n, dtype=bool)
+            if override_plant is not None:
+                if plant_ids is None:
+                    continue
+                rows &= plant_ids == override_plant
+            if override_version is not None:
+                if sensor_versions is None:
+                    continue
+                rows &= sensor_versions == override_version
+            for name in THRESHOLD_FIELDS:
+                arrays[name][rows] = _value(getattr(thresholds, name))
+        return arrays
+
+    # évalue un lot de mesures. les vitesses de variation ne sont calculées que si sensor_ids et timestamps
+    # (secondes, datetime64 ou datetime) sont fournis ; le z-score que si les références moyenne/écart-type le sont.
+    # retourne (masque, raisons) : deux tableaux de la taille du lot.
+    def evaluate(self, temperature, humidity, plant_ids=None, sensor_versions=None, sensor_ids=None,
+                 timestamps=None, temp_mean=None, temp_std=None, hum_mean=None, hum_std=None):
+        temperature = np.asarray(temperature, dtype=float)
+        humidity = np.asarray(humidity, dtype=float)
+        n = len(temperature)
+        limits = self.threshold_arrays(n, plant_ids, sensor_versions)
+        reasons = np.zeros(n, dtype=np.int32)
+
+        reasons |= np.where(temperature > limits["temp_max"], TEMP_HIGH, 0)
+        reasons |= np.where(temperature < limits["temp_min"], TEMP_LOW, 0)
+        reasons |= np.where(humidity > limits["hum_max"], HUM_HIGH, 0)
+        reasons |= np.where(humidity < limits["hum_min"], HUM_LOW, 0)
+
+        if sensor_ids is not None and timestamps is not None and n > 1:
+            temp_rate, hum_rate = rates_per_minute(sensor_ids, timestamps, temperature, humidity)
+            with np.errstate(invalid="ignore"):
+                reasons |= np.where(temp_rate > limits["temp_rate"], TEMP_RATE, 0)
+                reasons |= np.where(hum_rate > limits["hum_rate"], HUM_RATE, 0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if temp_mean is not None and temp_std is not None:
+                z = np.abs(temperature - np.asarray(temp_mean, dtype=float)) / np.asarray(temp_std, dtype=float)
+                reasons |= np.where(z > limits["zscore"], TEMP_DRIFT, 0)
+            if hum_mean is not None and hum_std is not None:
+                z = np.abs(humidity - np.asarray(hum_mean, dtype=float)) / np.asarray(hum_std, dtype=float)
+                reasons |= np.where(z > limits["zscore"], HUM_DRIFT, 0)
+
+        return reasons != 0, reasons
+
+
+def _value(value):
+    return np.nan if value is None else float(value)
+
+
+# vitesse de variation (valeur absolue, par minute) de chaque mesure par rapport à la précédente du même capteur
+# dans le lot ; NaN pour la première mesure de chaque capteur ou deux mesures au même instant.
+
+def rates_per_minute(sensor_ids, timestamps, temperature, humidity):
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.datetime64):
+        seconds = timestamps.astype("datetime64[ms]").astype(np.int64) / 1000.0
+    elif timestamps.dtype == object:
+        seconds = np.array([ts.timestamp() for ts in timestamps], dtype=float)
+    else:
+        seconds = timestamps.astype(float)
+    sensor_ids = np.asarray(sensor_ids)
+    if sensor_ids.dtype == object:
+        sensor_ids = sensor_ids.astype(str)
+    _, codes = np.unique(sensor_ids, return_inverse=True)
+    order = np.lexsort((seconds, codes))
+
+    same_sensor = codes[order][1:] == codes[order][:-1]
+    minutes = np.diff(seconds[order]) / 60.0
+    valid = same_sensor & (minutes > 0)
+    temp_rate = np.full(len(seconds), np.nan)
+    hum_rate = np.full(len(seconds), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        temp_rate[order[1:]] = np.where(valid, np.abs(np.diff(temperature[order])) / minutes, np.nan)
+        hum_rate[order[1:]] = np.where(valid, np.abs(np.diff(humidity[order])) / minutes, np.nan)
+    return temp_rate, hum_rate
+
+
+# libellés des raisons d'un code (dans l'ordre des bits)
+
+def describe(reason, temperature=None, humidity=None):
+    return [
+        label.format(temperature=temperature, humidity=humidity)
+        for bit, label in REASON_LABELS.items() if int(reason) & bit
+    ]
+
+
+def load_rules(path=RULES_FILE):
+    if not path:
+        return RuleSet()
+    with open(path, encoding="utf-8") as f:
+        return RuleSet.from_config(json.load(f))
+
+
+rules = load_rules()
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from shared.rules import (CROSS_SENSOR, HUM_DRIFT, HUM_HIGH, HUM_LOW, TEMP_DRIFT, TEMP_HIGH, TEMP_LOW, TEMP_RATE,
+                          REASON_LABELS, REASON_NAMES, REASON_TITLES, RuleSet, Thresholds, describe,
+                          rates_per_minute)
+
+
+def test_default_thresholds():
+    mask, reasons = RuleSet().evaluate([25, 36, 5, 25, 25], [60, 60, 60, 90, 20])
+    assert mask.tolist() == [False, True, True, True, True]
+    assert reasons.tolist() == [0, TEMP_HIGH, TEMP_LOW, HUM_HIGH, HUM_LOW]
+
+
+def test_overrides_by_plant_and_sensor_version():
+    rules = RuleSet.from_config({
+        "default": {"temp_max": 35},
+        "overrides": [
+            {"sensor_version": "US-v2", "temp_max": 40},
+            {"plant_id": 3, "temp_max": 30},
+            {"plant_id": 3, "sensor_version": "US-v2", "temp_max": 32},
+        ],
+    })
+    _, reasons = rules.evaluate(
+        [33, 33, 33, 33],
+        [60, 60, 60, 60],
+        plant_ids=[1, 1, 3, 3],
+        sensor_versions=["FR-v8", "US-v2", "FR-v8", "US-v2"],
+    )
+    assert reasons.tolist() == [0, 0, TEMP_HIGH, TEMP_HIGH]
+    assert rules.thresholds(3, "US-v2").temp_max == 32
+    assert rules.thresholds(1, "US-v2").temp_max == 40
+
+
+def test_rate_of_change_per_sensor():
+    rules = RuleSet(Thresholds(temp_rate=2.0))
+    # S-2 est intercalé et ne compte pas dans la variation de S-1
+    _, reasons = rules.evaluate(
+        [20.0, 30.0, 20.5, 25.0],
+        [60, 60, 60, 60],
+        sensor_ids=["S-1", "S-2", "S-1", "S-1"],
+        timestamps=[0, 30, 60, 120],
+    )
+    assert reasons.tolist() == [0, 0, 0, TEMP_RATE]
+
+
+def test_rates_are_nan_for_first_reading_of_each_sensor():
+    temp_rate, _ = rates_per_minute(["A", "B", "A"], np.array([0.0, 0.0, 30.0]), np.array([1.0, 2.0, 2.0]),
+                                    np.zeros(3))
+    assert np.isnan(temp_rate[:2]).all()
+    assert temp_rate[2] == pytest.approx(2.0)
+
+
+def test_zscore_against_reference_ignores_missing_reference():
+    _, reasons = RuleSet().evaluate(
+        [25, 25, 25], [60, 60, 60],
+        temp_mean=[20, 20, np.nan], temp_std=[1, 2, np.nan],
+        hum_mean=[60, 60, 60], hum_std=[0, 0, 0],
+    )
+    assert reasons.tolist() == [TEMP_DRIFT, 0, 0]
+    _, reasons = RuleSet().evaluate([25], [61], hum_mean=[60], hum_std=[0])
+    assert reasons.tolist() == [HUM_DRIFT]
+
+
+def test_describe_lists_labels_in_bit_order():
+    assert describe(TEMP_HIGH | HUM_LOW, 36.0, 20.0) == ["Température critique (36.0°C)", "Humidité basse (20.0%)"]
+
+
+def test_every_reason_bit_has_a_name_and_titles():
+    # bits contigus de TEMP_HIGH à CROSS_SENSOR, chacun avec nom, libellé et intitulé
+    assert sum(REASON_NAMES) == 2 * CROSS_SENSOR - 1
+    assert set(REASON_NAMES) == set(REASON_LABELS) == set(REASON_TITLES)
+    assert all(REASON_TITLES.values())